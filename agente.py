@@ -3,16 +3,50 @@ from flask_cors import CORS
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.rest import Client
 from dotenv import load_dotenv
-from langchain.agents import initialize_agent, AgentType
+from langchain.agents import ConversationalAgent
 from langchain.memory import ConversationBufferMemory
-from langchain.schema import messages_from_dict, messages_to_dict
+from langchain.schema import messages_from_dict, messages_to_dict, SystemMessage, HumanMessage, AIMessage
 try:
     from langchain_community.llms import OpenAI
 except ImportError:
     from langchain.llms import OpenAI
-from rag_engine import qa_chains
+from rag_engine import qa_chains, embedding_model
+from session_queue import SessionTurnQueue
+from llm_scheduler import (
+    LLMScheduler, SchedulerBusyError,
+    PRIORITY_RESERVA, PRIORITY_DISPONIBILIDAD, PRIORITY_FAQ, PRIORITY_OFF_TOPIC,
+)
+from circuit_breaker import BreakerRegistry, CircuitOpenError, LastGoodCache
+from single_flight import SingleFlight
+from token_memory import TokenBudgetMemory, truncate_to_tokens
+from semantic_recall import SemanticRecallIndex
+from tool_router import ToolSelector
+from model_router import ModelRouter, EscalationExhausted, parse_routes
+from reservation_schemas import ReservationDetails, AvailabilityQuery, DOMOS
+from date_ranges import parse_date, parse_date_range
+from session_log import SessionLogStore
+from memory_manifest import MemoryManifest
+from session_archive import SessionArchive
+from conversation_search import ConversationSearchIndex
+from write_behind import WriteBehindPersister
+from lazy_session import LazySessionMemory, PendingTurns, combine_pending
+from session_cache import SessionCache
+from session_state import SessionStateStore, MemoryStateBackend, SQLiteStateBackend, SQLAlchemyStateBackend
+import parallel_agent
+from parallel_agent import ParallelAgentExecutor, MultiActionConvoOutputParser, MULTI_ACTION_FORMAT_INSTRUCTIONS
+from system_prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_VERSION, SYSTEM_PROMPT_HASH, strip_legacy_system_messages
+import llm_deadline
+from llm_deadline import (
+    DeadlineExceeded, turn_deadline, has_budget, remaining,
+    call_with_deadline, backoff_sleep, skip_retry, openai_client_kwargs,
+)
 import uuid
+import threading
+import time
+import atexit
+from collections import OrderedDict
 import os
+import sys
 import json
 from langchain.tools import BaseTool, Tool
 # Importaciones para base de datos con manejo de errores
@@ -24,6 +58,7 @@ except ImportError:
 
 from datetime import datetime, date
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 import random
 import string
 
@@ -254,6 +289,7 @@ else:
 # Modelos de datos de reservas y usuarios
 Reserva = None # Inicializar como None para evitar errores de referencia
 Usuario = None
+SessionState = None
 if db:
     class Reserva(db.Model):
         __tablename__ = 'reservas'
@@ -300,6 +336,14 @@ if db:
         def __repr__(self):
             return f'<Usuario {self.id}: {self.nombre} ({self.email})>'
 
+    # Estado de conversación por sesión, compartido por todos los workers
+    class SessionState(db.Model):
+        __tablename__ = 'session_state'
+        session_id = db.Column(db.String(100), primary_key=True)
+        state = db.Column(db.Text, nullable=False)  # JSON del estado
+        version = db.Column(db.Integer, nullable=False, default=0)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 #  FUNCIONES DE GENERACIÓN DE CONTRASEÑAS 
 def generate_random_password(length=8):
     """Generar contraseña aleatoria segura"""
@@ -595,7 +639,26 @@ def initialize_database():
 db_initialized = initialize_database()
 
 # Directorio de memoria del usuario
-MEMORY_DIR = "user_memories_data" # Directorio de archivos de memoria
+MEMORY_DIR = os.getenv("MEMORY_DIR", "user_memories_data") # Directorio de archivos de memoria
+# Presupuesto de tokens del historial que se envía al agente y turnos que se conservan literales
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_KEEP_LAST_TURNS = int(os.getenv("MEMORY_KEEP_LAST_TURNS", "6"))
+LLM_PROMPT_TOKEN_LIMIT = int(os.getenv("LLM_PROMPT_TOKEN_LIMIT", "3000"))
+# Índice local de turnos pasados por usuario para el recuerdo semántico
+USER_RECALL_DIR = os.getenv("USER_RECALL_DIR", "user_recall_data")
+RECALL_TOP_K = int(os.getenv("RECALL_TOP_K", "3"))
+RECALL_EMBED_TIMEOUT = float(os.getenv("RECALL_EMBED_TIMEOUT", "3"))
+# Recuerdo entre sesiones de /chat: el id estable del usuario solo se acepta en un token firmado por
+# el sitio con CHAT_USER_TOKEN_SECRET; sin secreto cada sesión web recuerda solo sus propios turnos
+CHAT_USER_TOKEN_SECRET = os.getenv("CHAT_USER_TOKEN_SECRET", "")
+CHAT_USER_TOKEN_MAX_AGE = int(os.getenv("CHAT_USER_TOKEN_MAX_AGE", str(30 * 24 * 3600)))
+# Herramientas descritas al agente por turno: las k más relevantes más las siempre activas
+AGENT_TOOL_TOP_K = int(os.getenv("AGENT_TOOL_TOP_K", "4"))
+AGENT_ALWAYS_ON_TOOLS = [
+    name.strip() for name in os.getenv(
+        "AGENT_ALWAYS_ON_TOOLS", "SolicitarDatosReserva,ConsultarDisponibilidades,MenuPrincipal"
+    ).split(",") if name.strip()
+]
 try:
     os.makedirs(MEMORY_DIR, exist_ok=True)
     print(f"OK: Directorio de memoria creado: {MEMORY_DIR}")
@@ -604,8 +667,109 @@ except Exception as e:
     print(error_msg)
     raise PermissionError(error_msg)
 
-user_memories = {}
-user_states = {}
+# Memoria de cada sesión en un registro de solo anexado: un turno agrega solo sus mensajes
+MEMORY_LOG_COMPACT_AFTER = int(os.getenv("MEMORY_LOG_COMPACT_AFTER", "50"))
+MEMORY_LOG_FSYNC = os.getenv("MEMORY_LOG_FSYNC", "false").lower() == "true"
+# Instantáneas de más de MEMORY_LOG_COMPRESS_ABOVE bytes se guardan comprimidas (0 desactiva)
+MEMORY_LOG_COMPRESS_ABOVE = int(os.getenv("MEMORY_LOG_COMPRESS_ABOVE", "4096"))
+memory_log = SessionLogStore(
+    MEMORY_DIR, compact_after=MEMORY_LOG_COMPACT_AFTER, fsync=MEMORY_LOG_FSYNC,
+    compress_above=MEMORY_LOG_COMPRESS_ABOVE,
+)
+# Índice de sesiones (tamaño, fecha, mensajes, validez) que se actualiza en cada guardado
+MEMORY_MANIFEST_PATH = os.getenv("MEMORY_MANIFEST_PATH", os.path.join(MEMORY_DIR, "_manifest.db"))
+MEMORY_LAYOUT_VERSION = 4
+# Las filas se identifican con el mismo id saneado que da nombre al registro: "whatsapp:+57…" y "whatsapp57…" son una
+memory_manifest = MemoryManifest(MEMORY_MANIFEST_PATH, key=SessionLogStore.safe_id)
+# Retención: sesiones sin mensajes por MEMORY_RETENTION_DAYS días pasan a paquetes zip (0 desactiva)
+MEMORY_RETENTION_DAYS = float(os.getenv("MEMORY_RETENTION_DAYS", "30"))
+MEMORY_RETENTION_INTERVAL = float(os.getenv("MEMORY_RETENTION_INTERVAL", str(6 * 3600)))
+MEMORY_ARCHIVE_DIR = os.getenv("MEMORY_ARCHIVE_DIR", os.path.join(MEMORY_DIR, "archive"))
+session_archive = SessionArchive(MEMORY_ARCHIVE_DIR)
+# Memoria en las respuestas de /chat: full (todo el historial), last (últimos mensajes) o none
+CHAT_MEMORY_ECHO = os.getenv("CHAT_MEMORY_ECHO", "last").lower()
+CHAT_MEMORY_ECHO_LAST = int(os.getenv("CHAT_MEMORY_ECHO_LAST", "10"))
+CHAT_HISTORY_MAX_PAGE = int(os.getenv("CHAT_HISTORY_MAX_PAGE", "100"))
+# Búsqueda de texto completo sobre todas las conversaciones para el panel
+CONVERSATION_SEARCH_PATH = os.getenv("CONVERSATION_SEARCH_PATH", os.path.join(MEMORY_DIR, "_search.db"))
+conversation_search = ConversationSearchIndex(CONVERSATION_SEARCH_PATH)
+# Carga, guardado y archivo de un registro no se intercalan
+_memory_io_lock = threading.RLock()
+# Guardado diferido: los turnos marcan la sesión y un hilo la guarda cada MEMORY_FLUSH_INTERVAL segundos
+MEMORY_WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "true").lower() == "true"
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "1.0"))
+# Sesiones en RAM: máximo SESSION_CACHE_MAX y desalojo tras SESSION_IDLE_TTL segundos sin mensajes
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "1000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", str(6 * 3600)))
+# Estado de conversación: auto (Postgres si hay base de datos, si no SQLite local), postgres, sqlite o memory
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "auto").lower()
+SESSION_STATE_PATH = os.getenv("SESSION_STATE_PATH", os.path.join(MEMORY_DIR, "session_state.db"))
+
+def _write_back_session(session_id, memory):
+    """Al desalojar una sesión se guarda lo pendiente y se libera su estado del registro"""
+    memory_persister.flush(session_id)
+    memory_log.forget(session_id)
+
+user_memories = SessionCache(SESSION_CACHE_MAX, SESSION_IDLE_TTL, on_evict=_write_back_session)
+
+def _new_user_state(session_id=None) -> dict:
+    return {"current_flow": "none", "reserva_step": 0, "reserva_data": {}, "waiting_for_availability": False}
+
+def _create_state_backend():
+    """Backend del estado de conversación según SESSION_STATE_BACKEND"""
+    backend = SESSION_STATE_BACKEND
+    if backend == "auto":
+        backend = "postgres" if database_available and db_initialized else "sqlite"
+    try:
+        if backend == "postgres":
+            if not (database_available and SessionState is not None):
+                raise RuntimeError("base de datos no disponible")
+            return SQLAlchemyStateBackend(db, app, SessionState)
+        if backend == "sqlite":
+            return SQLiteStateBackend(SESSION_STATE_PATH)
+    except Exception as e:
+        print(f"WARNING:  Backend de estado '{backend}' no disponible ({e}), usando memoria del proceso")
+    return MemoryStateBackend(SessionCache(SESSION_CACHE_MAX, SESSION_IDLE_TTL))
+
+user_states = SessionStateStore(_create_state_backend(), _new_user_state)
+print(f"OK: Estado de conversación en backend '{user_states.backend.name}'")
+
+# Turnos ordenados por sesión: evita ejecuciones concurrentes sobre la misma memoria
+# y agrupa ráfagas de mensajes de WhatsApp en un solo turno (0 desactiva la agrupación).
+# Solo sirve con workers con hilos (gthread): con un worker síncrono no hay mensajes
+# concurrentes que agrupar y la ventana solo retrasa cada respuesta, por eso viene apagada
+SESSION_COALESCE_WINDOW = float(os.getenv("SESSION_COALESCE_WINDOW", "0"))
+session_turns = SessionTurnQueue(coalesce_window=SESSION_COALESCE_WINDOW)
+
+# Planificador de llamadas LLM: límite de concurrencia y prioridad por tipo de turno
+# LLM_QUEUE_TIMEOUTS: espera máxima en cola en segundos para reserva,disponibilidad,faq,off_topic
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+_llm_queue_timeouts = {}
+if os.getenv("LLM_QUEUE_TIMEOUTS"):
+    try:
+        _valores = [float(v) for v in os.getenv("LLM_QUEUE_TIMEOUTS").split(",")]
+        _clases = [PRIORITY_RESERVA, PRIORITY_DISPONIBILIDAD, PRIORITY_FAQ, PRIORITY_OFF_TOPIC]
+        _llm_queue_timeouts = dict(zip(_clases, _valores))
+    except ValueError:
+        print("WARNING: LLM_QUEUE_TIMEOUTS inválido, usando valores por defecto")
+llm_scheduler = LLMScheduler(max_concurrency=LLM_MAX_CONCURRENCY, queue_timeouts=_llm_queue_timeouts)
+
+# Plazo total por turno (Twilio corta el webhook a los 15s), timeout por intento y hedging opcional
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "13"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "8"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+
+# Circuit breaker por modelo: con el circuito abierto se responde por rutas sin LLM
+openai_breakers = BreakerRegistry(
+    failure_rate=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+    min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", "5")),
+    window_seconds=float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60")),
+    open_seconds=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),
+)
+# Últimas respuestas buenas del menú y del RAG directo para servir durante caídas
+last_good_answers = LastGoodCache()
+# Solicitudes idénticas concurrentes (menú, filtro, cadenas RAG) comparten una sola llamada
+llm_flights = SingleFlight()
 
 # Configuración de Twilio con validación robusta
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
@@ -658,31 +822,31 @@ try:
     llm = None
     try:
         #  Import tradicional (ya importado arriba)
-        llm = OpenAI(temperature=0)
+        llm = OpenAI(temperature=0, **openai_client_kwargs())
         print("OK: LLM OpenAI inicializado con import tradicional")
     except (NameError, ImportError, TypeError) as e:
         try:
             # Import nuevo en langchain 0.1.0
             from langchain_openai import OpenAI as OpenAI_New
-            llm = OpenAI_New(temperature=0)
+            llm = OpenAI_New(temperature=0, **openai_client_kwargs())
             print("OK: LLM OpenAI inicializado con nuevo import langchain_openai")
         except ImportError:
             try:
                 # Import legacy
                 from langchain.llms.openai import OpenAI as OpenAI_Legacy
-                llm = OpenAI_Legacy(temperature=0)
+                llm = OpenAI_Legacy(temperature=0, **openai_client_kwargs())
                 print("OK: LLM OpenAI inicializado con import legacy")
             except ImportError:
                 #  ChatOpenAI como fallback
                 try:
                     from langchain.chat_models import ChatOpenAI
-                    llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo")
+                    llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", **openai_client_kwargs())
                     print("OK: LLM inicializado con ChatOpenAI como fallback")
                 except ImportError:
                     try:
                         # Opción 5: ChatOpenAI desde langchain_openai
                         from langchain_openai import ChatOpenAI as ChatOpenAI_New
-                        llm = ChatOpenAI_New(temperature=0, model="gpt-3.5-turbo")
+                        llm = ChatOpenAI_New(temperature=0, model="gpt-3.5-turbo", **openai_client_kwargs())
                         print("OK: LLM inicializado con ChatOpenAI nuevo")
                     except ImportError:
                         raise ImportError("No se pudo importar ninguna clase OpenAI de LangChain")
@@ -695,6 +859,41 @@ except Exception as e:
     print(error_msg)
     raise ConnectionError(error_msg)
 
+# Nombre del modelo principal (agente y cadenas RAG) para su circuit breaker
+LLM_MODEL = getattr(llm, "model_name", None) or "openai"
+
+# Niveles de modelo y cadena de escalamiento por punto de llamada.
+# MODEL_ROUTES sobrescribe la política, p. ej. "filter=fast,parse_reservation=fast>strong"
+MODEL_TIER_FAST = os.getenv("MODEL_TIER_FAST", "gpt-4o-mini")
+MODEL_TIER_STRONG = os.getenv("MODEL_TIER_STRONG", "gpt-4o")
+DEFAULT_MODEL_ROUTES = {
+    "filter": ["fast", "strong"],
+    "parse_reservation": ["fast", "strong"],
+    "availability_parse": ["fast", "strong"],
+    "agent": ["completion"],
+    "empathy": ["fast", "strong"],
+    "redirect": ["fast", "strong"],
+}
+
+def _chat_model(model_name: str, temperature: float):
+    """Construye un modelo de chat de OpenAI para un nivel de la política"""
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        from langchain_community.chat_models import ChatOpenAI
+    return ChatOpenAI(model=model_name, temperature=temperature, api_key=OPENAI_API_KEY, **openai_client_kwargs())
+
+model_router = ModelRouter(
+    tiers={"fast": MODEL_TIER_FAST, "strong": MODEL_TIER_STRONG, "completion": LLM_MODEL},
+    routes={**DEFAULT_MODEL_ROUTES, **parse_routes(os.getenv("MODEL_ROUTES", ""))},
+    factory=_chat_model,
+    instances={"completion": llm},
+    default_route=["fast"],
+)
+# El agente usa un único nivel: su modelo no cambia a mitad de la ejecución
+AGENT_MODEL = model_router.model_name(model_router.chain("agent")[0])
+print(f"OK: Prompt de sistema {SYSTEM_PROMPT_VERSION} ({SYSTEM_PROMPT_HASH})")
+
 #  Herramientas RAG para el Agente 
 
 # Funciones wrapper para usar invoke() 
@@ -705,8 +904,8 @@ def call_chain_safe(chain_name: str, query: str) -> str:
             return "Lo siento, esa información no está disponible en este momento."
         
         chain = qa_chains[chain_name]
-        # Usar invoke() 
-        result = chain.invoke({"query": query})
+        # Usar invoke() dentro del tiempo del turno; consultas idénticas simultáneas comparten la misma llamada
+        result = llm_flights.do(f"chain:{chain_name}", query, call_with_deadline, chain.invoke, {"query": query})
         
         # El resultado puede estar en diferentes campos dependiendo de la cadena
         if isinstance(result, dict):
@@ -1021,6 +1220,8 @@ def generar_respuesta_disponibilidades(datos, parametros, consulta_original):
 class ReservationRequestTool(BaseTool):
     name: str = "SolicitarDatosReserva"
     description: str = "Útil para iniciar el proceso de recolección de datos de reserva. Úsala cuando el usuario exprese claramente su deseo de hacer una reserva (ej. 'quiero reservar', 'hacer una reserva', 'reservar un domo', 'cómo reservo')."
+    # El centinela termina el turno sin otra llamada al LLM y se traduce en el inicio del flujo de reserva
+    return_direct: bool = True
 
     def _run(self, query: str = None) -> str:
         # Esta herramienta no procesa la reserva, solo indica que el bot debe pedir los datos.
@@ -1039,7 +1240,9 @@ tools = [
     Tool(
         name="ConsultarDisponibilidades",
         func=consultar_disponibilidades_glamping,
-        description="Útil para consultar disponibilidades de domos, fechas específicas, capacidad y precios. Úsala cuando el usuario pregunte sobre disponibilidad, fechas libres, domos disponibles, si hay espacio para cierta cantidad de personas, o quiera saber qué opciones tiene para hospedarse."
+        description="Útil para consultar disponibilidades de domos, fechas específicas, capacidad y precios. Úsala cuando el usuario pregunte sobre disponibilidad, fechas libres, domos disponibles, si hay espacio para cierta cantidad de personas, o quiera saber qué opciones tiene para hospedarse.",
+        # Su salida va tal cual al usuario: el agente no la reformula con otra llamada al LLM
+        return_direct=True
     ),
     
     Tool(
@@ -1117,12 +1320,16 @@ tools = [
     Tool(
         name="LinksImagenesWeb",
         func=links_imagenes_func,
-        description="OBLIGATORIO: Usar cuando usuario pida: 'fotos', 'imágenes', 'galería', 'página web', 'sitio web', 'links', 'enlaces', 'ver domos'. SIEMPRE devuelve los links reales de la página web."
+        description="OBLIGATORIO: Usar cuando usuario pida: 'fotos', 'imágenes', 'galería', 'página web', 'sitio web', 'links', 'enlaces', 'ver domos'. SIEMPRE devuelve los links reales de la página web.",
+        # Su salida va tal cual al usuario: el agente no la reformula con otra llamada al LLM
+        return_direct=True
     ),
     Tool(
         name="MenuPrincipal",
         func=menu_principal_func,
-        description="OBLIGATORIO: Usar cuando usuario pida: 'menú', 'menús', 'opciones', 'guía', 'ayuda', 'navegación', 'qué puedo hacer', 'cómo navegar'. Muestra el menú principal de opciones disponibles."
+        description="OBLIGATORIO: Usar cuando usuario pida: 'menú', 'menús', 'opciones', 'guía', 'ayuda', 'navegación', 'qué puedo hacer', 'cómo navegar'. Muestra el menú principal de opciones disponibles.",
+        # Su salida va tal cual al usuario: el agente no la reformula con otra llamada al LLM
+        return_direct=True
     ),
     Tool(
         name="RespuestaEmpaticaYRedirection",
@@ -1131,6 +1338,45 @@ tools = [
     )
 ]
 
+RESERVATION_DETAILS_PROMPT = (
+    "¡Claro! Para tu reserva, necesito los siguientes datos:\n"
+    "- Tu nombre completo y el de tus acompañantes\n"
+    "- Tipo de domo que te gustaría reservar\n"
+    "- Fecha de entrada y fecha de salida (Formato DD/MM/AAAA)\n"
+    "- Servicios adicionales que quieras incluir (ej. cena romántica, masajes)\n"
+    "- Cualquier adición especial (ej. mascota, decoración específica)\n"
+    "- Tu número de teléfono de contacto\n"
+    "- Tu correo electrónico de contacto\n"
+    "- Método de pago preferido (efectivo, transferencia, tarjeta)\n"
+    "- Comentarios especiales u observaciones adicionales\n\n"
+    "Por favor, envíame toda esta información en un solo mensaje para procesar tu solicitud."
+)
+
+def _start_reservation_flow(user_state: dict) -> str:
+    """Pasa la sesión al paso 1 del flujo de reserva y devuelve la solicitud de datos"""
+    user_state["current_flow"] = "reserva"
+    user_state["reserva_step"] = 1
+    user_state["reserva_data"] = {}
+    return RESERVATION_DETAILS_PROMPT
+
+# Centinelas que devuelven las herramientas de retorno directo -> transición de estado
+AGENT_SENTINEL_TRANSITIONS = {
+    "REQUEST_RESERVATION_DETAILS": _start_reservation_flow,
+}
+
+def apply_agent_sentinel(answer: str, user_state: dict, memory=None) -> str:
+    """Convierte el centinela de una herramienta directa en su transición de estado y mensaje al usuario"""
+    transition = AGENT_SENTINEL_TRANSITIONS.get((answer or "").strip())
+    if transition is None:
+        return answer
+    message = transition(user_state)
+    # La memoria del agente guardó el centinela como respuesta: se reemplaza por lo que vio el usuario
+    if memory is not None and getattr(memory, "chat_memory", None) is not None:
+        last = memory.chat_memory.messages[-1] if memory.chat_memory.messages else None
+        if last is not None and getattr(last, "type", "") == "ai" and last.content == answer:
+            last.content = message
+    return message
+
 # Nueva función para respuestas empáticas con redirección estrategica
 def generate_empathetic_redirect(query):
     """
@@ -1164,24 +1410,10 @@ def generate_empathetic_redirect(query):
 
         RESPUESTA:"""
         
-        try:
-            from langchain_openai import ChatOpenAI
-            empathy_llm = ChatOpenAI(
-                model="gpt-4o-mini",  # Modelo eficiente para respuestas empáticas
-                temperature=0.8,  # Mayor creatividad para empatía
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        except ImportError:
-            try:
-                empathy_llm = ChatOpenAI(
-                    model="gpt-4o-mini",
-                    temperature=0.8,
-                    api_key=os.getenv("OPENAI_API_KEY")
-                )
-            except NameError:
-                return "Comprendo lo que estás sintiendo. A veces la naturaleza puede ser un refugio especial para encontrar paz. ¿Te gustaría conocer cómo nuestro glamping puede ofrecerte ese espacio de tranquilidad?"
-        
-        empathetic_response = empathy_llm.invoke(hybrid_prompt).content.strip()
+        # Los mensajes fuera de tema son los primeros en descartarse si hay saturación
+        empathetic_response = call_routed_llm(
+            "empathy", hybrid_prompt, validate=bool, temperature=0.8, priority=PRIORITY_OFF_TOPIC
+        )
         
         print(f"[EMPATÍA] Respuesta generada para situación personal: '{query[:30]}...'")
         return empathetic_response
@@ -1207,129 +1439,212 @@ def _get_backup_memory_file_path(user_id: str) -> str:
     safe_user_id = "".join(c for c in user_id if c.isalnum() or c in ('-', '_', '.'))[:50]
     return os.path.join(MEMORY_DIR, f"{safe_user_id}_backup.json")
 
+def _serialize_message(message) -> dict:
+    return messages_to_dict([message])[0]
+
+def _session_filename(user_id: str) -> str:
+    """Ruta del registro de la sesión relativa al directorio de memoria (con su carpeta de hash)"""
+    return os.path.relpath(memory_log.path(user_id), MEMORY_DIR)
+
+def _index_session(user_id: str, message_count: int):
+    """Actualiza la entrada de la sesión en el índice con el tamaño y la fecha de su registro"""
+    try:
+        file_stat = os.stat(memory_log.path(user_id))
+    except OSError:
+        return
+    memory_manifest.record(user_id, _session_filename(user_id), file_stat.st_size, file_stat.st_mtime, message_count)
+
 def save_user_memory(user_id: str, memory: ConversationBufferMemory):
-    """Guarda la memoria del usuario con manejo robusto de errores y respaldo automático"""
-    memory_path = _get_memory_file_path(user_id)
-    backup_path = _get_backup_memory_file_path(user_id)
-    temp_path = f"{memory_path}.tmp"
-    
+    """Agrega al registro de la sesión los mensajes nuevos y el resumen si cambió"""
     try:
         # Validar que la memoria tenga contenido válido
         if not memory or not hasattr(memory, 'chat_memory') or not hasattr(memory.chat_memory, 'messages'):
             print(f"WARNING:  Memoria inválida para usuario {user_id}, saltando guardado")
             return False
         
-        # Serializar los mensajes
-        try:
-            serialized_messages = messages_to_dict(memory.chat_memory.messages)
-        except Exception as e:
-            print(f"ERROR: Error al serializar mensajes para usuario {user_id}: {e}")
-            return False
-        
-        # Crear respaldo del archivo existente si existe y es válido
-        if os.path.exists(memory_path):
-            try:
-                # Validar que el archivo actual es un JSON válido antes de hacer backup
-                with open(memory_path, 'r', encoding='utf-8') as f:
-                    json.load(f)  # Solo validar, no usar el contenido
-                # Si es válido, crear backup
-                import shutil
-                shutil.copy2(memory_path, backup_path)
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"WARNING:  Archivo de memoria actual corrupto para usuario {user_id}: {e}")
-                # No creamos backup de archivo corrupto
-        
-        # archivo temporal primero 
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(serialized_messages, f, ensure_ascii=False, indent=2)
-        
-        # temporal es un JSON válido 
-        with open(temp_path, 'r', encoding='utf-8') as f:
-            json.load(f)  # Validar formato
-        
-        # Mover archivo temporal al destino final
-        import shutil
-        shutil.move(temp_path, memory_path)
+        # Solo se serializan los mensajes que el registro aún no tiene
+        with _memory_io_lock:
+            records = memory_log.append(
+                user_id,
+                getattr(memory, "summary", ""),
+                getattr(memory, "summarized_count", 0),
+                memory.chat_memory.messages,
+                serialize=_serialize_message,
+            )
+            _index_session(user_id, len(memory.chat_memory.messages))
+        print(f"OK: Memoria guardada correctamente para usuario: {user_id} ({records} registros)")
         
-        print(f"OK: Memoria guardada correctamente para usuario: {user_id}")
+        # Indexar los turnos nuevos para el recuerdo semántico (en segundo plano)
+        recall_index.add_messages(getattr(memory, "recall_key", None) or user_id, user_id, memory.chat_memory.messages)
+        conversation_search.add_messages(user_id, memory.chat_memory.messages)
         return True
         
     except Exception as e:
         print(f"ERROR: Error inesperado al guardar memoria para usuario {user_id}: {e}")
-        # Limpiar archivo temporal si existe
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except:
-            pass
         return False
 
-def _create_fresh_memory(user_id: str) -> ConversationBufferMemory:
-    """Crea una memoria nueva con mensajes iniciales para el usuario"""
+def _has_legacy_memory(user_id: str) -> bool:
+    return os.path.exists(_get_memory_file_path(user_id)) or os.path.exists(_get_backup_memory_file_path(user_id))
+
+def append_session_turns(user_id: str, messages: list):
+    """Anexa al registro los turnos de una sesión que no se cargó, sin leer su historial"""
     try:
-        memory = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True, input_key="input"
-        )
-        
-        # Mensajes iniciales para el contexto del agente
-        system_message = (
-            "Eres María, una asistente experta y empática del Glamping Brillo de Luna en Guatavita, Colombia. "
-            "Tienes acceso a información detallada sobre el lugar, sus domos, servicios, políticas y actividades. "
-            "Cuentas con una excelente memoria para recordar todo lo conversado, incluso conversaciones personales y emocionales. "
-            "Responde SIEMPRE en español con un tono cálido y profesional. "
-
-            "REGLAS IMPORTANTES: "
-            "1. SIEMPRE usa las herramientas disponibles para responder preguntas específicas sobre glamping. "
-            "2. Si el usuario menciona: 'silla de ruedas', 'movilidad reducida', 'discapacidad', 'accesibilidad', 'limitaciones físicas', 'muletas' o 'adaptaciones', "
-            "usa de inmediato la herramienta 'SugerenciasMovilidadReducida' y responde con toda la información que esta te proporcione. "
-            "3. Si pregunta sobre precios, usa 'DomosPreciosDetallados'. "
-            "4. Si pregunta sobre actividades, usa 'ServiciosExternos'. "
-            "5. Si pregunta por fotos, imágenes, galería, página web o enlaces, usa 'LinksImagenesWeb'. "
-            "6. Si solicita menú, opciones, guía, ayuda o navegación, usa 'MenuPrincipal'. "
-            "7. *** NUEVA REGLA CRITICA *** Si el usuario comparte algo PERSONAL o EMOCIONAL (tristeza, estrés, problemas personales, emociones), "
-            "usa OBLIGATORIAMENTE la herramienta 'RespuestaEmpaticaYRedirection' para generar una respuesta empática que conecte con sus emociones "
-            "y haga una transición natural hacia cómo el glamping puede ayudar con su situación. "
-            "8. NUNCA hagas preguntas de seguimiento si ya tienes la información específica de una herramienta. "
-            "9. Tu respuesta debe basarse en la información EXACTA de la herramienta, sin agregar información inventada ni preguntas adicionales. "
-            "10. Evita respuestas genéricas cuando haya herramientas específicas disponibles. "
-            "11. Mantén siempre un equilibrio entre profesionalismo y calidez humana. "
-            "Tu objetivo es ser útil, clara, precisa y empática, siempre apoyándote en las herramientas adecuadas para cada situación."
-        )
+        with _memory_io_lock:
+            entry = memory_manifest.get(user_id)
+            log_exists = memory_log.exists(user_id)
+            if entry is None:
+                blind = not log_exists and not _has_legacy_memory(user_id)
+            else:
+                blind = log_exists and entry["valid"] and not entry["archived"]
+            if not blind:
+                # Sesión archivada, ilegible, sin indexar o en el formato anterior: se carga y se guarda completa
+                memory = load_user_memory(user_id)
+                for message in messages:
+                    memory.chat_memory.add_message(message)
+                return save_user_memory(user_id, memory)
+            previous = entry["messages"] if entry else 0
+            records = memory_log.append_messages(user_id, messages_to_dict(messages))
+            _index_session(user_id, previous + len(messages))
+        print(f"OK: Turnos anexados sin cargar la sesión para usuario: {user_id} ({records} registros)")
+        # El recuerdo semántico se pone al día en el próximo guardado completo de la sesión
+        conversation_search.add_messages(user_id, messages, offset=previous)
+        return True
+
+    except Exception as e:
+        print(f"ERROR: Error inesperado al anexar turnos para usuario {user_id}: {e}")
+        return False
+
+def _persist_session(user_id: str, obj):
+    """Guardado diferido: la memoria completa o solo los turnos nuevos de una sesión no cargada"""
+    if isinstance(obj, PendingTurns):
+        return append_session_turns(user_id, obj.messages)
+    return save_user_memory(user_id, obj)
+
+# Los manejadores marcan la sesión y responden sin esperar al disco; al cerrar se guarda lo pendiente
+memory_persister = WriteBehindPersister(
+    _persist_session, interval=MEMORY_FLUSH_INTERVAL, background=MEMORY_WRITE_BEHIND, combine=combine_pending
+)
+atexit.register(memory_persister.close)
+
+def _summarize_conversation(previous_summary: str, transcript: str):
+    """Actualiza el resumen de la conversación con los turnos que salen de la ventana"""
+    prompt = (
+        "Actualiza el resumen de una conversación entre un cliente y María, asistente del Glamping Brillo de Luna. "
+        "Conserva datos útiles para atenderlo: nombre, fechas, número de personas, domos de interés, "
+        "reservas en curso, preferencias y situaciones personales que haya compartido. "
+        "Responde solo con el resumen en español, máximo 120 palabras.\n\n"
+        f"Resumen actual: {previous_summary or '(vacío)'}\n\n"
+        f"Nuevos turnos:\n{transcript}\n\n"
+        "Resumen actualizado:"
+    )
+    success, summary, error = call_llm_with_retry(prompt, max_retries=1)
+    return summary if success else None
+
+def _embed_recall_documents(texts):
+    """Embeddings de turnos para el índice de recuerdo (se ejecuta en segundo plano)"""
+    with openai_breakers.get("embeddings").protect():
+        return embedding_model.embed_documents(texts)
+
+# Embeddings recientes de mensajes: el recuerdo y la selección de herramientas comparten uno por turno
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+def _embed_turn_query(text):
+    """Embedding del mensaje actual, acotado para no retrasar el turno"""
+    with _query_embeddings_lock:
+        if text in _query_embeddings:
+            _query_embeddings.move_to_end(text)
+            return _query_embeddings[text]
+    with openai_breakers.get("embeddings").protect():
+        vector = call_with_deadline(embedding_model.embed_query, text, timeout=RECALL_EMBED_TIMEOUT)
+    with _query_embeddings_lock:
+        _query_embeddings[text] = vector
+        while len(_query_embeddings) > 128:
+            _query_embeddings.popitem(last=False)
+    return vector
+
+recall_index = SemanticRecallIndex(
+    USER_RECALL_DIR,
+    embed_documents=_embed_recall_documents,
+    embed_query=_embed_turn_query,
+    top_k=RECALL_TOP_K,
+)
+
+# Solo las herramientas relevantes para el mensaje se describen al agente en cada turno
+tool_selector = ToolSelector(
+    tools,
+    embed_documents=_embed_recall_documents,
+    embed_query=_embed_turn_query,
+    top_k=AGENT_TOOL_TOP_K,
+    always_on=AGENT_ALWAYS_ON_TOOLS,
+)
+
+def is_whatsapp_session(session_id: str) -> bool:
+    """
+    Las sesiones de WhatsApp usan el número como id; /chat nunca puede usarlas.
+
+    Se mira la clave con la que se guarda la sesión, no el id tal cual:
+    ":whatsapp:+57…" o "+whatsapp+57…" caen en el mismo registro que el número.
+    """
+    return SessionLogStore.safe_id(str(session_id or "")).lower().startswith("whatsapp")
+
+def verified_chat_user(token) -> str:
+    """
+    Clave de recuerdo del usuario web a partir de su token firmado, o None.
 
-        assistant_response = (
-            "¡Hola! Mi nombre es María y soy la asistente virtual del Glamping Brillo de Luna. "
-            "Es un placer saludarte y acompañarte en lo que necesites. "
-            "Estoy especializada en brindarte información detallada sobre nuestros domos geodésicos, "
-            "servicios exclusivos, experiencias únicas y todo lo necesario para que planifiques una estadía inolvidable. "
-            "¿Qué información te gustaría conocer hoy?"
+    El token lo emite el sitio (URLSafeTimedSerializer con salt "chat-user"
+    sobre el id del usuario). La clave va con prefijo "web:" para que nunca
+    coincida con la de un número de WhatsApp.
+    """
+    if not token or not CHAT_USER_TOKEN_SECRET:
+        return None
+    try:
+        user_id = URLSafeTimedSerializer(CHAT_USER_TOKEN_SECRET, salt="chat-user").loads(
+            str(token), max_age=CHAT_USER_TOKEN_MAX_AGE
         )
+    except BadSignature:
+        print("WARNING:  Token de usuario de /chat inválido o vencido; se ignora el recuerdo entre sesiones")
+        return None
+    user_id = str(user_id or "").strip()
+    if not user_id or is_whatsapp_session(user_id):
+        return None
+    return f"web:{user_id}"
 
-        
-        try:
-            #  API de langchain 0.1.0
-            from langchain.schema import HumanMessage, AIMessage
-            memory.chat_memory.add_message(HumanMessage(content=system_message))
-            memory.chat_memory.add_message(AIMessage(content=assistant_response))
-            print(f"OK: Memoria creada con API nueva para usuario: {user_id}")
-        except (ImportError, AttributeError):
-            try:
-            
-                memory.chat_memory.add_user_message(system_message)
-                memory.chat_memory.add_ai_message(assistant_response)
-                print(f"OK: Memoria creada con API legacy para usuario: {user_id}")
-            except AttributeError:
-                
-                print(f"WARNING:  Creando memoria básica sin mensajes iniciales para usuario: {user_id}")
-                
+def attach_recall(memory, session_id: str, recall_user: str = None):
+    """Conecta la memoria de la sesión con el índice de recuerdo del usuario"""
+    if not isinstance(memory, TokenBudgetMemory):
+        return
+    recall_key = recall_user or session_id
+    memory.recall_key = recall_key
+    memory.recall = lambda query, window_start: recall_index.search(
+        recall_key, query, session_id=session_id, before_message_index=window_start
+    )
+
+def _new_memory(user_id: str = None) -> ConversationBufferMemory:
+    """Crea la memoria conversacional con presupuesto de tokens"""
+    memory = TokenBudgetMemory(
+        memory_key="chat_history", return_messages=True, input_key="input",
+        max_token_limit=MEMORY_TOKEN_BUDGET,
+        keep_last_turns=MEMORY_KEEP_LAST_TURNS,
+        summarizer=_summarize_conversation,
+    )
+    if user_id:
+        attach_recall(memory, user_id)
+    return memory
+
+def _create_fresh_memory(user_id: str) -> ConversationBufferMemory:
+    """Crea una memoria nueva y vacía; las instrucciones de María van en el prefijo del prompt"""
+    try:
+        memory = _new_memory(user_id)
+        print(f"OK: Memoria creada para usuario: {user_id}")
         return memory
-        
     except Exception as e:
         print(f"ERROR: Error creando memoria para usuario {user_id}: {e}")
-        # Fallback: memoria mínima
-        return ConversationBufferMemory(
-            memory_key="chat_history", 
-            return_messages=True, 
-            input_key="input"
+        # Fallback: el mismo tipo de memoria, sin resumen por LLM ni recuerdo (el resumen es extractivo)
+        return TokenBudgetMemory(
+            memory_key="chat_history", return_messages=True, input_key="input",
+            max_token_limit=MEMORY_TOKEN_BUDGET,
+            keep_last_turns=MEMORY_KEEP_LAST_TURNS,
         )
 
 def _try_load_memory_from_file(file_path: str, user_id: str) -> tuple[bool, ConversationBufferMemory]:
@@ -1344,23 +1659,36 @@ def _try_load_memory_from_file(file_path: str, user_id: str) -> tuple[bool, Conv
             return False, None
         
         with open(file_path, 'r', encoding='utf-8') as f:
-            serialized_messages = json.load(f)
+            data = json.load(f)
+        
+        # Formato actual: objeto con resumen; formato anterior: lista de mensajes
+        summary, summarized_count = "", 0
+        if isinstance(data, dict):
+            serialized_messages = data.get("messages")
+            summary = data.get("summary") or ""
+            summarized_count = int(data.get("summarized_count") or 0)
+        else:
+            serialized_messages = data
         
         # Validar estructura básica
         if not isinstance(serialized_messages, list):
             print(f"WARNING:  Formato de memoria inválido para usuario {user_id}: esperaba lista")
             return False, None
         
+        # Las memorias antiguas guardaban las instrucciones de sistema como primer turno
+        serialized_messages, removed = strip_legacy_system_messages(serialized_messages)
+        summarized_count = max(0, summarized_count - removed)
+        
         # Crear memoria y cargar mensajes
-        memory = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True, input_key="input"
-        )
+        memory = _new_memory(user_id)
         
         try:
             # Intentar cargar mensajes con API compatible
             try:
                 # API de langchain 
                 memory.chat_memory.messages = messages_from_dict(serialized_messages)
+                memory.summary = summary
+                memory.summarized_count = summarized_count
             except Exception:
                 # Fallback - recrear memoria vacía si falla
                 print(f"WARNING:  No se pudieron cargar mensajes históricos para usuario {user_id}")
@@ -1378,140 +1706,323 @@ def _try_load_memory_from_file(file_path: str, user_id: str) -> tuple[bool, Conv
         print(f"WARNING:  Error al leer archivo de memoria para usuario {user_id}: {e}")
         return False, None
 
+def _convert_legacy_memory(user_id: str, memory: ConversationBufferMemory, *legacy_paths):
+    """Pasa una memoria del formato JSON anterior al registro de sesión y borra los archivos viejos"""
+    try:
+        memory_log.compact(
+            user_id, getattr(memory, "summary", ""), getattr(memory, "summarized_count", 0),
+            messages_to_dict(memory.chat_memory.messages),
+        )
+        _index_session(user_id, len(memory.chat_memory.messages))
+        for path in legacy_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"🔧 Memoria de {user_id} convertida al registro de sesión")
+    except Exception as e:
+        print(f"WARNING:  No se pudo convertir la memoria de {user_id}: {e}")
+
+def _flag_corrupted_session(user_id: str, error):
+    """Marca el registro ilegible en el índice y lo aparta antes de que un guardado lo reemplace"""
+    memory_manifest.mark_invalid(user_id, _session_filename(user_id), str(error))
+    cleanup_corrupted_memory_files()
+
+def _restore_archived_session(user_id: str) -> bool:
+    """Si la sesión está archivada, devuelve su registro al almacenamiento activo"""
+    entry = memory_manifest.get(user_id)
+    if not entry or not entry.get("archived"):
+        return False
+    try:
+        session_archive.restore(entry["bundle"], entry["member"], memory_log.path(user_id))
+    except Exception as e:
+        print(f"ERROR: No se pudo recuperar del archivo la sesión {user_id}: {e}")
+        return False
+    memory_manifest.mark_restored(user_id)
+    print(f"📦 Sesión {user_id} recuperada del archivo {entry['bundle']}")
+    return True
+
 def load_user_memory(user_id: str) -> ConversationBufferMemory:
-    """Carga la memoria del usuario con recuperación robusta desde archivo principal y backup"""
+    """Carga la memoria del usuario; si estaba archivada la recupera primero"""
+    with _memory_io_lock:
+        if not memory_log.exists(user_id):
+            _restore_archived_session(user_id)
+        return _read_user_memory(user_id)
+
+def _read_user_memory(user_id: str) -> ConversationBufferMemory:
+    """Lee la memoria del usuario desde su registro de sesión (o desde el formato JSON anterior)"""
     memory_path = _get_memory_file_path(user_id)
     backup_path = _get_backup_memory_file_path(user_id)
     
-    # Intento 1: Cargar desde archivo principal
-    success, memory = _try_load_memory_from_file(memory_path, user_id)
-    if success and memory:
-        print(f"OK: Memoria cargada desde archivo principal para usuario: {user_id}")
+    # Registro de sesión: se reproduce y una cola incompleta por caída se descarta
+    try:
+        data = memory_log.load(user_id)
+    except Exception as e:
+        print(f"WARNING:  Error al leer registro de sesión para usuario {user_id}: {e}")
+        _flag_corrupted_session(user_id, e)
+        data = None
+    if data is not None:
+        memory = _new_memory(user_id)
+        try:
+            memory.chat_memory.messages = messages_from_dict(data["messages"])
+            memory.summary = data["summary"]
+            memory.summarized_count = data["summarized_count"]
+        except Exception as e:
+            print(f"WARNING:  No se pudieron cargar mensajes históricos para usuario {user_id}: {e}")
+            _flag_corrupted_session(user_id, e)
+            memory = _new_memory(user_id)
+        print(f"OK: Memoria cargada desde registro de sesión para usuario: {user_id}")
         return memory
     
-    # Intento 2: Cargar desde backup si el archivo principal falló
-    if os.path.exists(backup_path):
-        print(f"🔄 Intentando recuperar desde backup para usuario: {user_id}")
-        success, memory = _try_load_memory_from_file(backup_path, user_id)
+    # Formato anterior: archivo JSON completo con su respaldo
+    for path in (memory_path, backup_path):
+        success, memory = _try_load_memory_from_file(path, user_id)
         if success and memory:
-            print(f"OK: Memoria recuperada desde backup para usuario: {user_id}")
-            # Intentar restaurar el archivo principal desde backup
-            try:
-                import shutil
-                shutil.copy2(backup_path, memory_path)
-                print(f"🔧 Archivo principal restaurado desde backup para usuario: {user_id}")
-            except Exception as e:
-                print(f"WARNING:  No se pudo restaurar archivo principal para usuario {user_id}: {e}")
+            print(f"OK: Memoria cargada desde {os.path.basename(path)} para usuario: {user_id}")
+            _convert_legacy_memory(user_id, memory, memory_path, backup_path)
             return memory
     
-    #   crear memoria nueva si falla algo
+    #   crear memoria nueva si falla algo; se guarda cuando el turno le agregue mensajes
     print(f"Creando memoria nueva para usuario: {user_id}")
-    memory = _create_fresh_memory(user_id)
-    
-    # Guardar la memoria nueva
-    if save_user_memory(user_id, memory):
-        print(f"OK: Memoria nueva guardada para usuario: {user_id}")
-    else:
-        print(f"WARNING:  No se pudo guardar memoria nueva para usuario: {user_id}")
-    
-    return memory
+    return _create_fresh_memory(user_id)
+
+def rehydrate_user_memory(user_id: str) -> ConversationBufferMemory:
+    """Memoria de una sesión que no está en caché: la pendiente de guardar o la del almacenamiento"""
+    # pending() espera a que termine un guardado en curso: el registro no se lee a medio escribir
+    pending = memory_persister.pending(user_id)
+    if isinstance(pending, PendingTurns):
+        # Turnos anexados sin cargar la sesión: se escriben antes de leer el registro
+        memory_persister.flush(user_id)
+        pending = memory_persister.pending(user_id)
+    if isinstance(pending, PendingTurns):
+        pending = None  # el guardado falló; quedan pendientes y se anexarán en el próximo ciclo
+    return pending or load_user_memory(user_id)
+
+def _session_has_history(user_id: str):
+    """¿La sesión tiene turnos guardados? Se responde con el índice sin leer el registro (None si no se sabe)"""
+    entry = memory_manifest.get(user_id)
+    if entry is not None:
+        return entry["messages"] > 0 if entry["valid"] else None
+    if memory_log.exists(user_id) or _has_legacy_memory(user_id):
+        return None
+    return False
+
+def open_session_memory(session_id: str) -> LazySessionMemory:
+    """Memoria de la sesión para un turno; el historial se lee solo si un paso lo necesita"""
+    return LazySessionMemory(session_id, user_memories, rehydrate_user_memory, memory_persister, _session_has_history)
+
+def _exchange(user_text: str, ai_text: str) -> list:
+    return [HumanMessage(content=user_text), AIMessage(content=ai_text)]
 
 # Mantenimiento del sistema de memoria
+def _quarantine_memory_file(file_path: str):
+    """Mueve un archivo de memoria ilegible a la carpeta corrupted/"""
+    import shutil
+    corrupted_dir = os.path.join(MEMORY_DIR, 'corrupted')
+    os.makedirs(corrupted_dir, exist_ok=True)
+    filename = os.path.basename(file_path)
+    shutil.move(file_path, os.path.join(corrupted_dir, f"{filename}.{int(datetime.utcnow().timestamp())}"))
+
 def cleanup_corrupted_memory_files():
-    """Limpia archivos de memoria corruptos y crea logs de problemas encontrados"""
-    if not os.path.exists(MEMORY_DIR):
-        return
-    
-    corrupted_files = []
+    """Mueve a corrupted/ las sesiones que el índice marcó como ilegibles"""
     cleaned_count = 0
-    
     try:
-        for filename in os.listdir(MEMORY_DIR):
-            if filename.endswith('.json') and not filename.endswith('_backup.json'):
-                file_path = os.path.join(MEMORY_DIR, filename)
-                try:
-                    # Intentar validar el JSON
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        json.load(f)
-                except (json.JSONDecodeError, IOError) as e:
-                    corrupted_files.append((filename, str(e)))
-                    # Mover archivo corrupto a una carpeta de archivos problemáticos
-                    try:
-                        corrupted_dir = os.path.join(MEMORY_DIR, 'corrupted')
-                        os.makedirs(corrupted_dir, exist_ok=True)
-                        corrupted_path = os.path.join(corrupted_dir, f"{filename}.{int(datetime.utcnow().timestamp())}")
-                        import shutil
-                        shutil.move(file_path, corrupted_path)
-                        cleaned_count += 1
-                    except Exception as move_error:
-                        print(f"WARNING:  No se pudo mover archivo corrupto {filename}: {move_error}")
-        
-        if corrupted_files:
+        for entry in memory_manifest.invalid():
+            file_path = os.path.join(MEMORY_DIR, entry["filename"])
+            try:
+                if os.path.exists(file_path):
+                    _quarantine_memory_file(file_path)
+                    cleaned_count += 1
+                memory_log.forget(entry["session_id"])
+                memory_manifest.remove(entry["session_id"])
+                print(f"   - {entry['filename']}: {entry['error']}")
+            except Exception as move_error:
+                print(f"WARNING:  No se pudo mover archivo corrupto {entry['filename']}: {move_error}")
+        if cleaned_count:
             print(f"🧹 Limpieza de memoria: {cleaned_count} archivos corruptos movidos")
-            for filename, error in corrupted_files[:5]:  # Solo mostrar primeros 5
-                print(f"   - {filename}: {error}")
-        else:
-            print("OK: Todos los archivos de memoria están en buen estado")
-            
     except Exception as e:
         print(f"ERROR: Error durante limpieza de archivos de memoria: {e}")
+    return cleaned_count
 
-def get_memory_system_health() -> dict:
-    """Obtiene estadísticas sobre el estado de sistema de memoria"""
+def migrate_memory_layout():
+    """
+    Migración única del directorio de memoria.
+
+    Pasa las memorias JSON del formato anterior (y sus respaldos) al registro
+    de sesión, mueve a corrupted/ las que no se pueden leer, lleva los
+    registros del directorio plano a su carpeta de hash, une las filas del
+    índice que apuntan al mismo registro e indexa todos los registros. Queda
+    marcada en el índice y no se repite en los siguientes
+    arranques.
+    """
+    if memory_manifest.get_meta("layout_version") == str(MEMORY_LAYOUT_VERSION):
+        return
     if not os.path.exists(MEMORY_DIR):
-        return {"status": "error", "message": "Directorio de memoria no existe"}
-    
-    try:
-        stats = {
-            "status": "healthy",
-            "total_files": 0,
-            "backup_files": 0,
-            "corrupted_files": 0,
-            "total_size_mb": 0,
-            "oldest_file": None,
-            "newest_file": None
-        }
-        
-        oldest_time = None
-        newest_time = None
-        
-        for filename in os.listdir(MEMORY_DIR):
-            if filename.endswith('.json'):
-                file_path = os.path.join(MEMORY_DIR, filename)
-                file_stat = os.stat(file_path)
-                stats["total_size_mb"] += file_stat.st_size / (1024 * 1024)
-                
-                # Rastrear archivos más antiguos y nuevos
-                if oldest_time is None or file_stat.st_mtime < oldest_time:
-                    oldest_time = file_stat.st_mtime
-                    stats["oldest_file"] = filename
-                if newest_time is None or file_stat.st_mtime > newest_time:
-                    newest_time = file_stat.st_mtime
-                    stats["newest_file"] = filename
-                
-                if filename.endswith('_backup.json'):
-                    stats["backup_files"] += 1
-                else:
-                    stats["total_files"] += 1
-                    # Verificar si está corrupto
+        return
+
+    start = time.perf_counter()
+    legacy_ids, log_ids, flat_ids = set(), set(), set()
+    for filename in os.listdir(MEMORY_DIR):
+        if filename.endswith('_backup.json'):
+            legacy_ids.add(filename[:-len('_backup.json')])
+        elif filename.endswith('.json'):
+            legacy_ids.add(filename[:-len('.json')])
+        elif filename.endswith('.jsonl'):
+            flat_ids.add(filename[:-len('.jsonl')])
+        elif memory_log.is_shard_dir(filename):
+            log_ids.update(
+                name[:-len('.jsonl')] for name in os.listdir(os.path.join(MEMORY_DIR, filename))
+                if name.endswith('.jsonl')
+            )
+
+    # Registros del directorio plano: a su carpeta de hash (si ya hay uno allí, ese manda)
+    for user_id in sorted(flat_ids - log_ids):
+        target = memory_log.path(user_id)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(memory_log.flat_path(user_id), target)
+    log_ids |= flat_ids
+
+    converted = quarantined = 0
+    for user_id in sorted(legacy_ids - log_ids):
+        memory_path = _get_memory_file_path(user_id)
+        backup_path = _get_backup_memory_file_path(user_id)
+        for path in (memory_path, backup_path):
+            success, memory = _try_load_memory_from_file(path, user_id)
+            if success and memory:
+                _convert_legacy_memory(user_id, memory, memory_path, backup_path)
+                converted += 1
+                break
+        else:
+            for path in (memory_path, backup_path):
+                if os.path.exists(path):
                     try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            json.load(f)
-                    except:
-                        stats["corrupted_files"] += 1
-        
-        stats["total_size_mb"] = round(stats["total_size_mb"], 2)
-        
-        if stats["corrupted_files"] > 0:
-            stats["status"] = "warning"
-        
-        return stats
-        
+                        _quarantine_memory_file(path)
+                        quarantined += 1
+                    except Exception as move_error:
+                        print(f"WARNING:  No se pudo mover archivo corrupto {os.path.basename(path)}: {move_error}")
+
+    # Filas de versiones anteriores con el id sin sanear: se unen con la del mismo registro (gana la más reciente)
+    merged = memory_manifest.normalize_keys()
+
+    # Registros ya existentes: se cuentan sus mensajes sin decodificarlos
+    for user_id in sorted(log_ids):
+        try:
+            data = memory_log.tail(user_id, 0)
+            _index_session(user_id, data["total"] if data else 0)
+        except Exception as e:
+            memory_manifest.mark_invalid(user_id, _session_filename(user_id), str(e))
+
+    memory_manifest.set_meta("layout_version", MEMORY_LAYOUT_VERSION)
+    print(f"🔧 Migración de memoria: {converted} memorias JSON convertidas, {quarantined} archivos corruptos, "
+          f"{merged} filas del índice unidas, {len(log_ids)} registros indexados "
+          f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+def get_memory_system_health() -> dict:
+    """Estado del sistema de memoria leído del índice, sin recorrer el directorio"""
+    try:
+        stats = memory_manifest.summary()
     except Exception as e:
         return {"status": "error", "message": f"Error al obtener estadísticas: {e}"}
+    stats["status"] = "warning" if stats["corrupted_files"] else "healthy"
+    stats["total_size_mb"] = round(stats.pop("total_bytes") / (1024 * 1024), 2)
+    stats["layout_version"] = memory_manifest.get_meta("layout_version")
+    stats["archive"] = session_archive.get_stats()
+    return stats
+
+def archive_idle_sessions(max_idle_days: float = None, batch_size: int = 200) -> int:
+    """
+    Pasa a un paquete zip las sesiones sin mensajes desde hace max_idle_days.
+
+    Las sesiones en caché, con guardado pendiente o cuyo registro cambió
+    después del corte se saltan. El paquete se escribe sin tomar el candado
+    de la memoria; bajo el candado se comprueba que cada registro siga igual
+    que cuando se empaquetó y solo entonces se borra. Devuelve cuántas
+    sesiones se archivaron.
+    """
+    max_idle_days = MEMORY_RETENTION_DAYS if max_idle_days is None else max_idle_days
+    cutoff = time.time() - max_idle_days * 86400
+    archived = 0
+    skipped = set()
+
+    def busy(user_id, path, stamp=None):
+        # La fila puede tener otra forma del id que la sesión activa: la fecha del propio archivo es la que manda
+        if user_id in user_memories or memory_persister.is_dirty(user_id):
+            return True
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return True
+        if stamp is not None:
+            return (file_stat.st_mtime_ns, file_stat.st_size) != stamp
+        return file_stat.st_mtime >= cutoff
+
+    while True:
+        with _memory_io_lock:
+            batch = {}
+            for entry in memory_manifest.idle(cutoff, batch_size + len(skipped)):
+                user_id = entry["session_id"]
+                if user_id in skipped:
+                    continue
+                path = memory_log.path(user_id)
+                if not os.path.exists(path):
+                    # El índice apuntaba a un archivo que ya no está
+                    memory_manifest.remove(user_id)
+                elif busy(user_id, path):
+                    skipped.add(user_id)
+                else:
+                    file_stat = os.stat(path)
+                    batch[user_id] = (path, (file_stat.st_mtime_ns, file_stat.st_size))
+        if not batch:
+            break
+        bundle = session_archive.write_bundle({os.path.basename(path): path for path, _ in batch.values()})
+        with _memory_io_lock:
+            for user_id, (path, stamp) in batch.items():
+                if busy(user_id, path, stamp):
+                    # Llegó un mensaje mientras se empaquetaba: la copia del paquete queda sin uso
+                    skipped.add(user_id)
+                    continue
+                memory_manifest.mark_archived(user_id, bundle, os.path.basename(path))
+                os.remove(path)
+                memory_log.forget(user_id)
+                archived += 1
+        if len(batch) < batch_size:
+            break
+    if archived:
+        print(f"📦 Retención de memoria: {archived} sesiones inactivas archivadas")
+    return archived
 
-# Ejecutar validaciones de sistema al inicio
-cleanup_corrupted_memory_files()
+def _saved_conversations():
+    """Sesiones del almacenamiento activo como (id, mensajes, fecha) para construir el índice de búsqueda"""
+    for entry in memory_manifest.active():
+        try:
+            data = memory_log.tail(entry["session_id"], sys.maxsize)
+            if data and data["messages"]:
+                yield entry["session_id"], messages_from_dict(data["messages"]), entry["mtime"]
+        except Exception as e:
+            print(f"WARNING:  No se pudo indexar la conversación {entry['session_id']}: {e}")
+
+def _retention_loop():
+    while True:
+        time.sleep(MEMORY_RETENTION_INTERVAL)
+        try:
+            archive_idle_sessions()
+        except Exception as e:
+            print(f"ERROR: Error en la retención de memoria: {e}")
+
+def init_memory_storage():
+    """
+    Arranque del almacenamiento de memoria: migración única del directorio,
+    limpieza de lo que el índice marcó como ilegible e índice de búsqueda.
+
+    Lo llama el servidor al iniciar (gunicorn.conf.py o __main__), no la
+    importación del módulo: importar agente no reescribe MEMORY_DIR.
+    """
+    migrate_memory_layout()
+    cleanup_corrupted_memory_files()
+    conversation_search.backfill(_saved_conversations)
+
+def start_memory_retention():
+    """Arranca el hilo que archiva las sesiones inactivas; lo llama el servidor, nunca la importación"""
+    if MEMORY_RETENTION_DAYS > 0:
+        threading.Thread(target=_retention_loop, name="memory-retention", daemon=True).start()
 
 
 # Funciones de validación para datos de reserva
@@ -1646,6 +2157,16 @@ def parse_flexible_date(date_str: str) -> tuple[bool, date, str]:
     except Exception as e:
         pass
     
+    # Expresiones en español: "15 de diciembre", "el próximo viernes", "mañana"
+    parsed_date = parse_date(date_str)
+    if parsed_date:
+        today = date.today()
+        if parsed_date < today:
+            return False, None, f"La fecha {parsed_date.strftime('%d/%m/%Y')} ya pasó"
+        if parsed_date > today + timedelta(days=365):
+            return False, None, f"La fecha {parsed_date.strftime('%d/%m/%Y')} está muy lejos (máximo 1 año)"
+        return True, parsed_date, f"OK: Fecha interpretada: {parsed_date.strftime('%d/%m/%Y')}"
+    
     return False, None, f"No se pudo interpretar la fecha '{date_str}'. Use formato DD/MM/AAAA"
 
 def validate_date_range(fecha_entrada: date, fecha_salida: date) -> tuple[bool, str]:
@@ -1706,7 +2227,7 @@ def save_reservation_to_pinecone(user_phone_number, reservation_data):
         reserva_text = json.dumps(reservation_data, ensure_ascii=False)
         
         
-        embedder = OpenAIEmbeddings()
+        embedder = OpenAIEmbeddings(**openai_client_kwargs())
         vector = embedder.embed_query(reserva_text)
         
         
@@ -1718,33 +2239,190 @@ def save_reservation_to_pinecone(user_phone_number, reservation_data):
         print(f"ERROR: Error al guardar en Pinecone para {user_phone_number}: {e}")
         return False
 
+# Parser determinista para respuestas que siguen el formato de línea por campo que pedimos
+# Se revisan en orden: "número de personas" debe ganarle a la etiqueta del número de contacto
+_RESERVATION_LABELS = {
+    "numero_acompanantes": (
+        "personas", "número de personas", "numero de personas", "cantidad de personas",
+        "número de huéspedes", "numero de huespedes", "número de huespedes", "cantidad de huéspedes",
+        "número de acompañantes", "numero de acompañantes", "numero de acompanantes",
+    ),
+    "nombres_huespedes": ("nombre", "nombres", "huésped", "huespedes", "huéspedes", "acompañantes"),
+    "domo": ("domo", "tipo de domo"),
+    "fechas": ("fecha", "fechas", "estadía", "estadia"),
+    "servicio_elegido": ("servicio", "servicios", "servicios adicionales"),
+    "adicciones": ("adición", "adiciones", "adicciones", "adicional", "mascota"),
+    "numero_contacto": ("teléfono", "telefono", "celular", "número", "numero", "contacto", "whatsapp"),
+    "email_contacto": ("correo", "email", "e-mail", "mail"),
+    "metodo_pago": ("pago", "método de pago", "metodo de pago", "forma de pago"),
+    "comentarios_especiales": ("comentario", "comentarios", "observaciones", "observación", "notas"),
+}
+_LABEL_RE = re.compile(r"^([a-záéíóúñ\s-]{3,25})\s*[:=]\s*(.*)$", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^\s*(?:[-•*·]+|\d{1,2}[.)])\s*")
+_EMAIL_RE = re.compile(r"[\w.%+-]+@[\w.-]+\.[a-z]{2,}", re.IGNORECASE)
+_PAYMENT_WORDS = ("efectivo", "transferencia", "tarjeta", "nequi", "daviplata", "pse", "consignación", "consignacion")
+_GROUP_SIZE_RE = re.compile(r"\bsomos\s+(\d{1,2})\b|\b(\d{1,2})\s+personas\b", re.IGNORECASE)
+_REQUIRED_RESERVATION_FIELDS = ("nombres_huespedes", "domo", "fecha_entrada", "fecha_salida")
+
+_parse_stats_lock = threading.Lock()
+_parse_stats = {
+    kind: {"total": 0, "deterministic": 0, "llm_assisted": 0, "failed": 0}
+    for kind in ("reservation", "availability")
+}
+
+def _count_parse(kind: str, key: str):
+    with _parse_stats_lock:
+        _parse_stats[kind]["total"] += 1
+        _parse_stats[kind][key] += 1
+
+def get_parse_stats(kind: str) -> dict:
+    """Proporción de mensajes de reserva o disponibilidad interpretados sin LLM"""
+    with _parse_stats_lock:
+        stats = dict(_parse_stats[kind])
+    stats["llm_free_share"] = round(stats["deterministic"] / stats["total"], 3) if stats["total"] else 0
+    return stats
+
+def _label_field(label: str):
+    label = label.strip().lower()
+    for field, names in _RESERVATION_LABELS.items():
+        if label in names or any(label.startswith(name) for name in names):
+            return field
+    return None
+
+def parse_reservation_fast(user_input: str) -> tuple[dict, list]:
+    """
+    Interpreta sin LLM un mensaje de reserva con una línea por campo.
+
+    Devuelve (datos, campos_obligatorios_sin_resolver) con el mismo formato que
+    parse_reservation_details. Solo acepta valores que pasan los validadores
+    del flujo de reservas; lo demás queda sin resolver.
+    """
+    data = {}
+    names_lines, free_lines = [], []
+    seen_domo_or_dates = False
+
+    for raw_line in (user_input or "").splitlines():
+        line = _BULLET_RE.sub("", raw_line).strip().strip('"').strip()
+        if not line:
+            continue
+
+        field = None
+        label_match = _LABEL_RE.match(line)
+        if label_match:
+            field = _label_field(label_match.group(1))
+            if field:
+                line = label_match.group(2).strip()
+                if not line:
+                    continue
+
+        lower = line.lower()
+        stay = parse_date_range(line) if field == "fechas" or (field is None and re.search(r"\d", line)) else None
+        email = _EMAIL_RE.search(line)
+        digits = re.sub(r"\D", "", line)
+        domo = next((d for d in DOMOS if re.search(rf"\b{d.lower()}\b", lower)), None)
+
+        if field == "fechas" or (field is None and stay):
+            # Una línea con una sola fecha y sin salida clara se deja al LLM
+            if stay and stay.end:
+                data["fecha_entrada"] = stay.start.strftime("%d/%m/%Y")
+                data["fecha_salida"] = stay.end.strftime("%d/%m/%Y")
+            seen_domo_or_dates = True
+        elif field == "numero_acompanantes":
+            group_size = re.search(r"\b(\d{1,2})\b", line)
+            if group_size:
+                data["numero_acompanantes"] = group_size.group(1)
+        elif field == "email_contacto" or (field is None and email and len(line) <= len(email.group()) + 10):
+            if email:
+                data["email_contacto"] = email.group().lower()
+        elif field == "numero_contacto" or (field is None and 7 <= len(digits) <= 15
+                                              and len(digits) >= len(re.sub(r"[\s+()-]", "", line)) - 1):
+            data["numero_contacto"] = line
+        elif field == "domo" or (field is None and domo and len(line.split()) <= 4):
+            if domo:
+                data["domo"] = domo
+            seen_domo_or_dates = True
+        elif field == "metodo_pago" or (field is None and len(line.split()) <= 4
+                                         and any(word in lower for word in _PAYMENT_WORDS)):
+            data["metodo_pago"] = line
+        elif field in ("nombres_huespedes", "servicio_elegido", "adicciones", "comentarios_especiales"):
+            if field == "nombres_huespedes":
+                names_lines.append(line)
+            else:
+                data[field] = line
+        elif not seen_domo_or_dates:
+            # Antes del domo y las fechas solo van los nombres de los huéspedes
+            names_lines.append(line)
+        else:
+            free_lines.append(line)
+
+    # Líneas libres después de las fechas, en el orden pedido: servicios, adiciones, comentarios
+    for field in ("servicio_elegido", "adicciones", "comentarios_especiales"):
+        if field not in data and free_lines:
+            data[field] = free_lines.pop(0)
+    if free_lines:
+        extra = " ".join(free_lines)
+        current = data.get("comentarios_especiales")
+        data["comentarios_especiales"] = f"{current}. {extra}" if current else extra
+
+    if names_lines:
+        names_valid, names, _ = validate_guest_names(", ".join(names_lines))
+        if names_valid:
+            data["nombres_huespedes"] = names
+    group_size = _GROUP_SIZE_RE.search(user_input or "")
+    if group_size:
+        data["numero_acompanantes"] = group_size.group(1) or group_size.group(2)
+
+    # Solo se aceptan fechas y contacto que los validadores del flujo dan por buenos
+    if "fecha_entrada" in data:
+        entrada_ok, entrada, _ = parse_flexible_date(data["fecha_entrada"])
+        salida_ok, salida, _ = parse_flexible_date(data["fecha_salida"])
+        if not (entrada_ok and salida_ok and validate_date_range(entrada, salida)[0]):
+            del data["fecha_entrada"], data["fecha_salida"]
+    if "numero_contacto" in data or "email_contacto" in data:
+        _, _, _, contact_errors = validate_contact_info(data.get("numero_contacto", ""), data.get("email_contacto", ""))
+        if any("Teléfono" in error for error in contact_errors):
+            data.pop("numero_contacto", None)
+        if "Email inválido" in contact_errors:
+            data.pop("email_contacto", None)
+
+    missing = [field for field in _REQUIRED_RESERVATION_FIELDS if not data.get(field)]
+    return ReservationDetails(**data).to_dict(), missing
+
 def parse_reservation_details(user_input):
-    # Usar LLM para extraer fechas y detalles
+    """Interpreta la solicitud de reserva: parser determinista primero y LLM solo para lo que falte"""
+    fast_data, missing = parse_reservation_fast(user_input)
+    if not missing:
+        _count_parse("reservation", "deterministic")
+        print("OK: Datos de reserva interpretados sin LLM")
+        return fast_data
+
+    print(f"INFO: Parser determinista sin resolver {missing}, consultando al LLM")
+    llm_data = _parse_reservation_with_llm(user_input)
+    if llm_data is None:
+        _count_parse("reservation", "failed")
+        return None
+
+    # Lo que el parser determinista ya validó se conserva; el LLM completa el resto
+    defaults = ReservationDetails().to_dict()
+    merged = dict(llm_data)
+    merged.update({field: value for field, value in fast_data.items() if value != defaults[field]})
+    _count_parse("reservation", "llm_assisted")
+    return merged
+
+def _parse_reservation_with_llm(user_input):
+    """Extrae los datos de la solicitud de reserva con salida estructurada del LLM"""
     prompt = f"""
-    Extrae los siguientes datos de la solicitud de reserva del usuario. Analiza línea por línea.
-    
-    FORMATO TÍPICO DE ENTRADA:
-    Los datos pueden estar en formato de líneas separadas. Analiza todo el texto línea por línea:
-    - Nombres de huéspedes: Pueden estar en una línea separados por comas, o en líneas separadas
-    - Tipo de domo: Antares, Polaris, Sirius, Centaury
-    - Fechas: formato DD/MM/AAAA hasta DD/MM/AAAA o similar
-    - Servicios adicionales: masajes, decoraciones, etc.
-    - Adiciones especiales: mascotas, etc.
-    - Número de teléfono: números de contacto
-    - Email: correo electrónico
-    - Método de pago: efectivo, transferencia, tarjeta, etc.
-    - Comentarios especiales: cualquier observación adicional del usuario
+    Extrae los datos de esta solicitud de reserva del Glamping Brillo de Luna. Analiza línea por línea.
     
     INSTRUCCIONES IMPORTANTES:
     - Los nombres pueden estar en múltiples líneas consecutivas al inicio
     - Identifica el domo por los nombres: Antares, Polaris, Sirius, Centaury
+    - Fechas: formato DD/MM/AAAA hasta DD/MM/AAAA o similar
     - Si dice "voy con X personas más", cuenta el solicitante + X acompañantes
     - Si dice "somos X personas", usa ese número total
-    - SIEMPRE incluye metodo_pago y comentarios_especiales aunque estén vacíos
     - Si no encuentras método de pago, usa "No especificado"
     - Si no encuentras comentarios, usa "Ninguno"
-    - Responde SOLO con JSON válido, sin texto adicional
-
+    
     EJEMPLO DE ENTRADA:
     "Juan Perez
     Maria Lopez  
@@ -1757,83 +2435,33 @@ def parse_reservation_details(user_input):
     Efectivo
     Tengo una persona en silla de ruedas"
     
-    EJEMPLO DE SALIDA JSON:
-    {{
-        "nombres_huespedes": ["Juan Perez", "Maria Lopez"],
-        "numero_acompanantes": "2",
-        "domo": "Centaury",
-        "fecha_entrada": "24/08/2025",
-        "fecha_salida": "30/08/2025",
-        "servicio_elegido": "Masajes",
-        "adicciones": "1 mascota",
-        "numero_contacto": "3001234567",
-        "email_contacto": "correo@email.com",
-        "metodo_pago": "Efectivo",
-        "comentarios_especiales": "Tengo una persona en silla de ruedas"
-    }}
-
-    Solicitud del usuario: "{user_input}"
-
-    Formato de salida JSON requerido:
-    {{
-        "nombres_huespedes": ["Nombre Completo 1", "Nombre Completo 2"],
-        "numero_acompanantes": "número_total_de_acompañantes_incluyendo_solicitante",
-        "domo": "Tipo de Domo",
-        "fecha_entrada": "fecha_entrada_del_usuario",
-        "fecha_salida": "fecha_salida_del_usuario", 
-        "servicio_elegido": "Servicio Adicional",
-        "adicciones": "Adicciones (ej. mascota, otro servicio)",
-        "numero_contacto": "Numero de Telefono",
-        "email_contacto": "Correo Electronico",
-        "metodo_pago": "Forma de pago (efectivo, transferencia, tarjeta, etc.)",
-        "comentarios_especiales": "Solicitudes especiales o comentarios adicionales"
-    }}
+    Solicitud del usuario:
+    {user_input}
     """
     
-    # Funcion para llamar al LLM 
-    success, response_text, error_msg = call_llm_with_retry(prompt, max_retries=3)
-    
-    if not success:
-        print(f"ERROR: Error al llamar al LLM para parsing: {error_msg}")
+    # Salida estructurada: el modelo rápido responde con los campos tipados y se escala si faltan obligatorios
+    try:
+        details = call_routed_llm(
+            "parse_reservation", prompt, schema=ReservationDetails,
+            validate=lambda result: not result.missing_required()
+        )
+    except EscalationExhausted as e:
+        # Se conserva la última salida: validate_and_process_reservation_data informa lo que falta
+        details = e.result
+    except Exception as e:
+        print(f"ERROR: Error al llamar al LLM para parsing: {e}")
         return None
     
-    # Usar función robusta para parsear JSON
-    json_success, parsed_json, json_error = parse_llm_json_safe(response_text)
-    
-    if not json_success:
-        print(f"ERROR: Error al parsear JSON: {json_error}")
+    if details is None:
+        print("ERROR: El LLM no devolvió datos de reserva")
         return None
     
-    required_fields = ["nombres_huespedes", "domo", "fecha_entrada", "fecha_salida"]
-    optional_fields = ["numero_acompanantes", "servicio_elegido", "adicciones", "numero_contacto", "email_contacto", "metodo_pago", "comentarios_especiales"]
-    
-    missing_fields = [field for field in required_fields if field not in parsed_json]
-    
+    missing_fields = details.missing_required()
     if missing_fields:
-        print(f"WARNING:  JSON incompleto, faltan campos: {missing_fields}")
-        # Agregar campos faltantes con valores por defecto
-        for field in missing_fields:
-            if field == "nombres_huespedes":
-                parsed_json[field] = []
-            else:
-                parsed_json[field] = "N/A"
-    
-    # Agregar campos opcionales faltantes con valores por defecto
-    for field in optional_fields:
-        if field not in parsed_json:
-            if field == "numero_acompanantes":
-                parsed_json[field] = "N/A"
-            elif field in ["servicio_elegido", "adicciones"]:
-                parsed_json[field] = "ninguno"
-            elif field == "metodo_pago":
-                parsed_json[field] = "No especificado"
-            elif field == "comentarios_especiales":
-                parsed_json[field] = "Ninguno"
-            else:
-                parsed_json[field] = "N/A"
+        print(f"WARNING:  Reserva incompleta, faltan campos: {missing_fields}")
     
     print("OK: Datos de reserva parseados exitosamente")
-    return parsed_json
+    return details.to_dict()
 
 def validate_and_process_reservation_data(parsed_data, from_number) -> tuple[bool, dict, list]:
     """Valida y procesa datos de reserva"""
@@ -1928,47 +2556,88 @@ def validate_and_process_reservation_data(parsed_data, from_number) -> tuple[boo
 def call_llm_with_retry(prompt: str, max_retries: int = 3, temperature: float = 0) -> tuple[bool, str, str]:
     """Llama al LLM con reintentos automáticos y manejo de errores"""
     last_error = ""
+    if openai_breakers.is_open(LLM_MODEL):
+        # No ocupar cupo ni esperar reintentos mientras el modelo está caído
+        return False, "", str(CircuitOpenError(LLM_MODEL))
     
-    for attempt in range(max_retries):
-        try:
-            # Validar prompt
-            if not prompt or len(prompt.strip()) == 0:
-                return False, "", "Prompt vacío"
+    try:
+        # Ocupar un cupo del planificador LLM con la prioridad del turno actual
+        with llm_scheduler.slot():
+            for attempt in range(max_retries):
+                # No reintentar si el intento no alcanza a terminar antes del deadline del turno
+                if attempt > 0 and not has_budget():
+                    skip_retry()
+                    last_error = f"Timeout: deadline del turno agotado tras {attempt} intentos"
+                    break
+                try:
+                    # Validar prompt
+                    if not prompt or len(prompt.strip()) == 0:
+                        return False, "", "Prompt vacío"
             
-            # Truncar prompt si es muy largo (límite aproximado de OpenAI)
-            if len(prompt) > 3500:
-                prompt = prompt[:3500] + "\n[Prompt truncado para evitar límites]"
+                    # Truncar prompt por tokens si excede el límite configurado
+                    prompt = truncate_to_tokens(prompt, LLM_PROMPT_TOKEN_LIMIT, "\n[Prompt truncado para evitar límites]")
             
-            # Llamar al LLM
-            response = llm(prompt)
+                    # Llamar al LLM con timeout por intento acotado por el deadline
+                    with openai_breakers.get(LLM_MODEL).protect():
+                        response = call_with_deadline(
+                            llm, prompt, timeout=LLM_ATTEMPT_TIMEOUT, hedge=LLM_HEDGING, site="call_llm"
+                        )
             
-            # Validar respuesta
-            if not response:
-                last_error = "Respuesta vacía del LLM"
-                continue
+                    # Validar respuesta
+                    if not response:
+                        last_error = "Respuesta vacía del LLM"
+                        continue
                 
-            response = response.strip()
-            if len(response) == 0:
-                last_error = "Respuesta vacía después de limpiar"
-                continue
+                    response = response.strip()
+                    if len(response) == 0:
+                        last_error = "Respuesta vacía después de limpiar"
+                        continue
                 
-            print(f"OK: LLM respondió exitosamente (intento {attempt + 1})")
-            return True, response, "Éxito"
+                    print(f"OK: LLM respondió exitosamente (intento {attempt + 1})")
+                    return True, response, "Éxito"
             
-        except Exception as e:
-            last_error = f"Error en intento {attempt + 1}: {str(e)}"
-            print(f"WARNING:  {last_error}")
+                except CircuitOpenError as e:
+                    # Sin reintentos: el modelo está caído y conviene degradar de inmediato
+                    print(f"WARNING:  {e}")
+                    return False, "", str(e)
+                except Exception as e:
+                    last_error = f"Error en intento {attempt + 1}: {str(e)}"
+                    print(f"WARNING:  {last_error}")
             
-            # Si es error de rate limit, esperar un poco más
-            if "rate limit" in str(e).lower():
-                import time
-                time.sleep(2 ** attempt)  # Backoff exponencial
+                    # Si es error de rate limit, esperar un poco más (solo si el deadline lo permite)
+                    if "rate limit" in str(e).lower():
+                        if not backoff_sleep(attempt):
+                            break
             
-            if attempt < max_retries - 1:
-                continue
+                    if attempt < max_retries - 1:
+                        continue
     
-    # Si llegamos aquí, todos los intentos fallaron
-    return False, "", last_error
+            # Si llegamos aquí, todos los intentos fallaron
+            return False, "", last_error
+    except SchedulerBusyError as e:
+        print(f"WARNING:  {e}")
+        return False, "", str(e)
+
+def call_routed_llm(site: str, prompt: str, validate=None, temperature: float = 0, priority: int = None,
+                    hedge: bool = False, schema=None):
+    """
+    Llama al modelo que la política asigna al punto de llamada, escalando si la salida no es válida.
+
+    Con schema (modelo pydantic) la respuesta llega por function calling ya
+    validada como instancia del esquema; sin schema se devuelve el texto.
+    """
+    if schema is None:
+        prompt = truncate_to_tokens(prompt, LLM_PROMPT_TOKEN_LIMIT, "\n[Prompt truncado para evitar límites]")
+
+    def call(model, model_name):
+        runnable = model.with_structured_output(schema, method="function_calling") if schema is not None else model
+        with openai_breakers.get(model_name).protect(), llm_scheduler.slot(priority):
+            response = call_with_deadline(runnable.invoke, prompt, timeout=LLM_ATTEMPT_TIMEOUT, hedge=hedge, site=site)
+        if schema is not None:
+            return response
+        return str(getattr(response, "content", response)).strip()
+
+    return model_router.run(site, call, validate=validate, temperature=temperature)
 
 def parse_llm_json_safe(llm_response: str) -> tuple[bool, dict, str]:
     """Parsea JSON del LLM con múltiples estrategias de recuperación"""
@@ -2025,9 +2694,10 @@ def initialize_agent_safe(tools, memory, max_retries: int = 3):
                 # Método 1: API nueva con create_conversational_retrieval_agent
                 from langchain.agents import create_conversational_retrieval_agent
                 agent = create_conversational_retrieval_agent(
-                    llm=llm,
+                    llm=model_router.get_model(model_router.chain("agent")[0]),
                     tools=tools,
                     memory=memory,
+                    system_message=SystemMessage(content=SYSTEM_PROMPT),
                     verbose=True,
                     handle_parsing_errors=True,
                     max_iterations=3
@@ -2036,10 +2706,18 @@ def initialize_agent_safe(tools, memory, max_retries: int = 3):
                 return True, agent, "Agente moderno inicializado exitosamente"
             except (ImportError, AttributeError):
                 # Fallback al método tradicional si el método moderno no está disponible
-                agent = initialize_agent(
+                # Instrucciones fijas fuera de la memoria: prefijo idéntico en cada solicitud.
+                # El parser acepta varias acciones por paso y el executor las ejecuta en paralelo
+                conversational_agent = ConversationalAgent.from_llm_and_tools(
+                    llm=model_router.get_model(model_router.chain("agent")[0]),
+                    tools=tools,
+                    prefix=SYSTEM_PROMPT,
+                    format_instructions=MULTI_ACTION_FORMAT_INSTRUCTIONS,
+                    output_parser=MultiActionConvoOutputParser(),
+                )
+                agent = ParallelAgentExecutor.from_agent_and_tools(
+                    agent=conversational_agent,
                     tools=tools,
-                    llm=llm,
-                    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
                     memory=memory,
                     verbose=True,
                     handle_parsing_errors=True,
@@ -2058,74 +2736,115 @@ def initialize_agent_safe(tools, memory, max_retries: int = 3):
     
     return False, None, last_error
 
+def _call_agent_with_deadline(agent, method, *args, **kwargs):
+    """
+    Ejecuta el agente acotado por el tiempo que le queda al turno.
+
+    max_execution_time solo se revisa entre iteraciones; así una llamada
+    lenta del agente o de una herramienta tampoco pasa del deadline. Si se
+    abandona, la ejecución sigue en segundo plano sin su memoria para que no
+    escriba en la sesión después de que el turno ya respondió.
+    """
+    try:
+        return call_with_deadline(method, *args, **kwargs)
+    except DeadlineExceeded:
+        if getattr(agent, "memory", None) is not None:
+            agent.memory = None
+        raise
+
 def run_agent_safe(agent, user_input: str, max_retries: int = 2) -> tuple[bool, str, str]:
     """Ejecuta el agente con manejo robusto de errores"""
     last_error = ""
+    if openai_breakers.is_open(AGENT_MODEL):
+        return False, "", str(CircuitOpenError(AGENT_MODEL))
     
-    for attempt in range(max_retries):
-        try:
-            # Validar input
-            if not user_input or len(user_input.strip()) == 0:
-                return False, "Entrada vacía", "Input del usuario vacío"
+    try:
+        # El agente ocupa un cupo durante toda su ejecución; sus herramientas lo reutilizan
+        with llm_scheduler.slot():
+            for attempt in range(max_retries):
+                if attempt > 0 and not has_budget():
+                    skip_retry()
+                    last_error = f"Timeout: deadline del turno agotado tras {attempt} intentos"
+                    break
+                try:
+                    # Validar input
+                    if not user_input or len(user_input.strip()) == 0:
+                        return False, "Entrada vacía", "Input del usuario vacío"
             
-            # Truncar input si es muy largo
-            if len(user_input) > 1000:
-                user_input = user_input[:1000] + " [mensaje truncado]"
+                    # Truncar input si es muy largo
+                    if len(user_input) > 1000:
+                        user_input = user_input[:1000] + " [mensaje truncado]"
             
-            # Ejecutar agente con método moderno
-            try:
-                # Intentar método invoke primero (LangChain 0.1.0+)
-                if hasattr(agent, 'invoke'):
-                    agent_result = agent.invoke({"input": user_input})
-                    # Extraer la respuesta del resultado estructurado
-                    if isinstance(agent_result, dict):
-                        result = agent_result.get('output', agent_result.get('result', str(agent_result)))
-                    else:
-                        result = str(agent_result)
-                else:
-                    # Fallback al método run tradicional
-                    result = agent.run(input=user_input)
-            except Exception as e:
-                # Si falla invoke, intentar run
-                result = agent.run(input=user_input)
+                    # El executor deja de iterar herramientas al agotar el tiempo del turno
+                    left = remaining()
+                    if left is not None and hasattr(agent, "max_execution_time"):
+                        agent.max_execution_time = left
+
+                    # Ejecutar agente con método moderno
+                    agent_start = time.monotonic()
+                    with openai_breakers.get(AGENT_MODEL).protect():
+                        try:
+                            # Intentar método invoke primero (LangChain 0.1.0+)
+                            if hasattr(agent, 'invoke'):
+                                agent_result = _call_agent_with_deadline(agent, agent.invoke, {"input": user_input})
+                                # Extraer la respuesta del resultado estructurado
+                                if isinstance(agent_result, dict):
+                                    result = agent_result.get('output', agent_result.get('result', str(agent_result)))
+                                else:
+                                    result = str(agent_result)
+                            else:
+                                # Fallback al método run tradicional
+                                result = _call_agent_with_deadline(agent, agent.run, input=user_input)
+                        except DeadlineExceeded:
+                            raise
+                        except Exception as e:
+                            # Si falla invoke, intentar run
+                            result = _call_agent_with_deadline(agent, agent.run, input=user_input)
+                    model_router.observe("agent", AGENT_MODEL, time.monotonic() - agent_start)
             
-            # Validar resultado
-            if not result:
-                last_error = "Agente retornó resultado vacío"
-                continue
+                    # Validar resultado
+                    if not result:
+                        last_error = "Agente retornó resultado vacío"
+                        continue
                 
-            result = str(result).strip()
-            if len(result) == 0:
-                last_error = "Resultado vacío después de limpiar"
-                continue
+                    result = str(result).strip()
+                    if len(result) == 0:
+                        last_error = "Resultado vacío después de limpiar"
+                        continue
             
-            print(f"OK: Agente ejecutado exitosamente (intento {attempt + 1})")
-            return True, result, "Éxito"
+                    print(f"OK: Agente ejecutado exitosamente (intento {attempt + 1})")
+                    return True, result, "Éxito"
             
-        except Exception as e:
-            last_error = f"Error ejecutando agente (intento {attempt + 1}): {str(e)}"
-            print(f"WARNING:  {last_error}")
+                except CircuitOpenError as e:
+                    print(f"WARNING:  {e}")
+                    return False, "", str(e)
+                except Exception as e:
+                    last_error = f"Error ejecutando agente (intento {attempt + 1}): {str(e)}"
+                    print(f"WARNING:  {last_error}")
             
-            # Manejar errores específicos
-            if "parsing" in str(e).lower():
-                # Error de parsing - puede ser temporal
-                continue
-            elif "rate limit" in str(e).lower():
-                # Rate limit - esperar
-                import time
-                time.sleep(2 ** attempt)
-                continue
-            elif "timeout" in str(e).lower():
-                # Timeout - reintentar con input más corto
-                if len(user_input) > 500:
-                    user_input = user_input[:500] + " [truncado por timeout]"
-                continue
+                    # Manejar errores específicos
+                    if "parsing" in str(e).lower():
+                        # Error de parsing - puede ser temporal
+                        continue
+                    elif "rate limit" in str(e).lower():
+                        # Rate limit - esperar solo si queda tiempo para otro intento
+                        if not backoff_sleep(attempt):
+                            break
+                        continue
+                    elif "timeout" in str(e).lower():
+                        # Timeout - reintentar con input más corto
+                        if len(user_input) > 500:
+                            user_input = user_input[:500] + " [truncado por timeout]"
+                        continue
             
-            if attempt < max_retries - 1:
-                continue
+                    if attempt < max_retries - 1:
+                        continue
     
-    # Si todos los intentos fallaron
-    return False, "", last_error
+            # Si todos los intentos fallaron
+            return False, "", last_error
+    except SchedulerBusyError as e:
+        print(f"WARNING:  {e}")
+        return False, "", str(e)
 
 print("[STARTING] Sistema inicializado - Iniciando rutas Flask...")
 
@@ -2152,29 +2871,48 @@ def handle_menu_selection(selection, qa_chains):
     if selection == "1":
         try:
             # Información sobre domos usando múltiples RAG
-            domos_info = qa_chains["domos_info"].run("¿Qué tipos de domos tienen y cuáles son sus características?")
-            precios_info = qa_chains.get("domos_precios", {}).run("¿Cuáles son los precios de los domos?") if "domos_precios" in qa_chains else ""
-            
-            response = f"🏠 *INFORMACIÓN DE DOMOS*\n\n{domos_info}"
-            if precios_info:
-                response += f"\n\n💰 *PRECIOS*\n{precios_info}"
+            def generar_domos():
+                with openai_breakers.get(LLM_MODEL).protect(), llm_scheduler.slot():
+                    domos_info = call_with_deadline(qa_chains["domos_info"].run, "¿Qué tipos de domos tienen y cuáles son sus características?")
+                    precios_info = call_with_deadline(qa_chains["domos_precios"].run, "¿Cuáles son los precios de los domos?") if "domos_precios" in qa_chains else ""
+                
+                response = f"🏠 *INFORMACIÓN DE DOMOS*\n\n{domos_info}"
+                if precios_info:
+                    response += f"\n\n💰 *PRECIOS*\n{precios_info}"
+                
+                response += "\n\n¿Te gustaría saber algo más específico sobre algún domo? 🤔"
+                return response
             
-            response += "\n\n¿Te gustaría saber algo más específico sobre algún domo? 🤔"
+            # Usuarios que eligen la misma opción a la vez comparten una sola generación
+            response = llm_flights.do("menu", selection, generar_domos)
+            last_good_answers.put("menu:1", response)
             return response
+        except SchedulerBusyError:
+            return last_good_answers.get("menu:1") or get_busy_response()
         except Exception as e:
-            return "🏠 *DOMOS DISPONIBLES*"
+            # Durante caídas de OpenAI se sirve la última respuesta buena de esta opción
+            return last_good_answers.get("menu:1") or "🏠 *DOMOS DISPONIBLES*"
     
     elif selection == "2":
         try:
             # Información sobre servicios
-            servicios_incluidos = qa_chains["servicios_incluidos"].run("¿Qué servicios están incluidos?")
-            servicios_adicionales = qa_chains["actividades_adicionales"].run("¿Qué servicios adicionales y actividades ofrecen?")
+            def generar_servicios():
+                with openai_breakers.get(LLM_MODEL).protect(), llm_scheduler.slot():
+                    servicios_incluidos = call_with_deadline(qa_chains["servicios_incluidos"].run, "¿Qué servicios están incluidos?")
+                    servicios_adicionales = call_with_deadline(qa_chains["actividades_adicionales"].run, "¿Qué servicios adicionales y actividades ofrecen?")
+                
+                response = f"🎯 *NUESTROS SERVICIOS*\n\n*SERVICIOS INCLUIDOS:*\n{servicios_incluidos}\n\n*SERVICIOS ADICIONALES:*\n{servicios_adicionales}"
+                response += "\n\n¿Hay algún servicio específico que te interese? ✨"
+                return response
             
-            response = f"🎯 *NUESTROS SERVICIOS*\n\n*SERVICIOS INCLUIDOS:*\n{servicios_incluidos}\n\n*SERVICIOS ADICIONALES:*\n{servicios_adicionales}"
-            response += "\n\n¿Hay algún servicio específico que te interese? ✨"
+            response = llm_flights.do("menu", selection, generar_servicios)
+            last_good_answers.put("menu:2", response)
             return response
+        except SchedulerBusyError:
+            return last_good_answers.get("menu:2") or get_busy_response()
         except Exception as e:
-            return "🎯 *SERVICIOS*\n\nOfrecemos una amplia gama de servicios incluidos y adicionales."
+            # Durante caídas de OpenAI se sirve la última respuesta buena de esta opción
+            return last_good_answers.get("menu:2") or "🎯 *SERVICIOS*\n\nOfrecemos una amplia gama de servicios incluidos y adicionales."
     
     elif selection == "3":
         return {
@@ -2192,15 +2930,24 @@ def handle_menu_selection(selection, qa_chains):
     elif selection == "4":
         try:
             # Información general del glamping
-            ubicacion_info = qa_chains["ubicacion_contacto"].run("¿Dónde están ubicados y cómo contactarlos?")
-            concepto_info = qa_chains["concepto_glamping"].run("¿Qué es Glamping Brillo de Luna?")
-            politicas_info = qa_chains["politicas_glamping"].run("¿Cuáles son las políticas del glamping?")
+            def generar_informacion():
+                with openai_breakers.get(LLM_MODEL).protect(), llm_scheduler.slot():
+                    ubicacion_info = call_with_deadline(qa_chains["ubicacion_contacto"].run, "¿Dónde están ubicados y cómo contactarlos?")
+                    concepto_info = call_with_deadline(qa_chains["concepto_glamping"].run, "¿Qué es Glamping Brillo de Luna?")
+                    politicas_info = call_with_deadline(qa_chains["politicas_glamping"].run, "¿Cuáles son las políticas del glamping?")
+                
+                response = f"ℹ️ *INFORMACIÓN GENERAL*\n\n*CONCEPTO:*\n{concepto_info}\n\n*UBICACIÓN Y CONTACTO:*\n{ubicacion_info}\n\n*POLÍTICAS:*\n{politicas_info}"
+                response += "\n\n¿Hay algo más específico que te gustaría saber? 🌟"
+                return response
             
-            response = f"ℹ️ *INFORMACIÓN GENERAL*\n\n*CONCEPTO:*\n{concepto_info}\n\n*UBICACIÓN Y CONTACTO:*\n{ubicacion_info}\n\n*POLÍTICAS:*\n{politicas_info}"
-            response += "\n\n¿Hay algo más específico que te gustaría saber? 🌟"
+            response = llm_flights.do("menu", selection, generar_informacion)
+            last_good_answers.put("menu:4", response)
             return response
+        except SchedulerBusyError:
+            return last_good_answers.get("menu:4") or get_busy_response()
         except Exception as e:
-            return "ℹ️ *INFORMACIÓN GENERAL*\n\nSomos un glamping ubicado en un entorno natural único."
+            # Durante caídas de OpenAI se sirve la última respuesta buena de esta opción
+            return last_good_answers.get("menu:4") or "ℹ️ *INFORMACIÓN GENERAL*\n\nSomos un glamping ubicado en un entorno natural único."
     
     else:
         return (
@@ -2224,37 +2971,40 @@ def is_greeting_message(message):
 def handle_availability_request(message):
     """Maneja consultas de disponibilidad cuando el usuario responde después de seleccionar opción 3"""
     try:
-        # Usar LLM para extraer fechas y detalles
-        prompt = f"""
-        Extrae la información de disponibilidad de este mensaje del usuario: "{message}"
-        
-        Busca:
-        - Fechas (formato DD/MM/AAAA o similar)
-        - Número de personas
-        - Tipo de domo (si lo menciona)
-        
-        Responde en JSON:
-        {{
-            "fecha_inicio": "YYYY-MM-DD",
-            "fecha_fin": "YYYY-MM-DD", 
-            "personas": número,
-            "domo_tipo": "tipo o null"
-        }}
-        
-        Si no puedes extraer fechas válidas, responde con: {{"error": "fechas_no_claras"}}
-        """
-        
-        parsing_llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        response_text = parsing_llm.invoke(prompt).content
-        try:
-            parsed_data = json.loads(response_text)
+        # Caso común sin LLM: fechas en español con el parser determinista; una sola fecha es una noche
+        rango = parse_date_range(message)
+        if rango:
+            parametros = extraer_parametros_consulta(message)
+            fecha_fin = rango.end or rango.start + timedelta(days=1)
+            # Mismas reglas que el flujo de reserva: nada en el pasado ni rangos invertidos o demasiado largos
+            fechas_ok = rango.start >= date.today() and validate_date_range(rango.start, fecha_fin)[0]
+            query = AvailabilityQuery(
+                fechas_claras=fechas_ok, fecha_inicio=rango.start if fechas_ok else None,
+                fecha_fin=fecha_fin if fechas_ok else None,
+                personas=parametros['personas'], domo_tipo=parametros['domo']
+            )
+            _count_parse("availability", "deterministic")
+        else:
+            # Salida estructurada: fechas y personas llegan tipadas, sin recuperar JSON de texto libre
+            prompt = f"""
+            Extrae la información de disponibilidad de este mensaje del usuario: "{message}"
             
-            if "error" in parsed_data:
+            Busca las fechas de la estadía (formato DD/MM/AAAA o similar; hoy es {date.today().isoformat()}),
+            el número de personas y el tipo de domo si lo menciona.
+            Si no puedes extraer fechas válidas, marca fechas_claras como falso.
+            """
+            
+            try:
+                query = call_routed_llm(
+                    "availability_parse", prompt, schema=AvailabilityQuery, validate=lambda q: q.is_complete(),
+                    priority=PRIORITY_DISPONIBILIDAD, hedge=LLM_HEDGING
+                )
+            except EscalationExhausted as e:
+                query = e.result
+            _count_parse("availability", "llm_assisted" if query is not None else "failed")
+        
+        if query is not None:
+            if not query.fechas_claras:
                 return (
                     "🤔 No pude entender las fechas claramente.\n\n"
                     "Por favor, compárteme la información así:\n"
@@ -2265,10 +3015,10 @@ def handle_availability_request(message):
                 )
             
             # fechas válidas, consultar disponibilidad
-            fecha_inicio = parsed_data.get("fecha_inicio")
-            fecha_fin = parsed_data.get("fecha_fin")
-            personas = parsed_data.get("personas")
-            domo_tipo = parsed_data.get("domo_tipo")
+            fecha_inicio = query.fecha_inicio.isoformat() if query.fecha_inicio else None
+            fecha_fin = query.fecha_fin.isoformat() if query.fecha_fin else None
+            personas = query.personas
+            domo_tipo = query.domo_tipo
             
             if fecha_inicio and fecha_fin:
                 # obtener_disponibilidades_calendario 
@@ -2300,9 +3050,9 @@ def handle_availability_request(message):
                 else:
                     return f"X No hay disponibilidad para las fechas {fecha_inicio} al {fecha_fin}.\n\n¿Te gustaría consultar otras fechas?"
             
-        except json.JSONDecodeError:
-            pass
-            
+    except SchedulerBusyError as e:
+        print(f"WARNING:  {e}")
+        return get_busy_response()
     except Exception as e:
         print(f"Error procesando consulta de disponibilidad: {e}")
     
@@ -2350,22 +3100,12 @@ def is_glamping_related(message):
 
         Respuesta:"""
         
-        try:
-            filter_llm = ChatOpenAI(
-                model="gpt-4o",
-                temperature=0,
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        except NameError:
-            # Fallback en caso de que ChatOpenAI no esté disponible
-            from langchain_openai import ChatOpenAI
-            filter_llm = ChatOpenAI(
-                model="gpt-4o",
-                temperature=0,
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
+        def clasificar():
+            return call_routed_llm(
+                "filter", prompt, validate=lambda text: "SI" in text.upper() or "NO" in text.upper(), hedge=LLM_HEDGING
+            ).upper()
         
-        response_text = filter_llm.invoke(prompt).content.strip().upper()
+        response_text = llm_flights.do("topic_filter", message, clasificar)
         
         # Determinar si está relacionado
         is_related = response_text == "SI" or "SI" in response_text
@@ -2412,21 +3152,10 @@ def get_strategic_redirect_response(user_message):
 
         RESPUESTA:"""
         
-        try:
-            redirect_llm = ChatOpenAI(
-                model="gpt-4o",
-                temperature=0.7,  # Más creatividad para respuestas empáticas
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        except NameError:
-            from langchain_openai import ChatOpenAI
-            redirect_llm = ChatOpenAI(
-                model="gpt-4o",
-                temperature=0.7,
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        
-        empathetic_response = redirect_llm.invoke(hybrid_prompt).content.strip()
+        # Los mensajes fuera de tema son los primeros en descartarse si hay saturación
+        empathetic_response = call_routed_llm(
+            "redirect", hybrid_prompt, validate=bool, temperature=0.7, priority=PRIORITY_OFF_TOPIC
+        )
         
         # Agregar opciones de menú al final
         full_response = empathetic_response + "\n\n"
@@ -2445,85 +3174,98 @@ def get_strategic_redirect_response(user_message):
         # Fallback a respuesta básica pero mejorada
         return get_fallback_empathetic_response()
 
-def get_direct_rag_response(query):
+def _direct_chain_answer(chain_name, query, use_llm):
+    """Consulta una cadena RAG para el fallback directo; usa la última respuesta buena si OpenAI falla"""
+    cache_key = f"{chain_name}:{query}"
+    if use_llm and chain_name in qa_chains:
+        try:
+            with openai_breakers.get(LLM_MODEL).protect():
+                result = llm_flights.do(
+                    f"direct:{chain_name}", query, call_with_deadline, qa_chains[chain_name], query
+                )["result"]
+            last_good_answers.put(cache_key, result)
+            return result
+        except Exception as e:
+            print(f"[FALLBACK] Cadena {chain_name} no disponible: {e}")
+    return last_good_answers.get(cache_key)
+
+def get_direct_rag_response(query, use_llm=None):
     """
     Respuesta directa usando cadenas RAG sin necesidad de OpenAI
     Sistema de fallback cuando la API de OpenAI no está disponible
     """
     try:
         query_lower = query.lower().strip()
+        # Con el circuito abierto no se intenta OpenAI: palabras clave, caché y textos fijos
+        if use_llm is None:
+            use_llm = not openai_breakers.is_open(LLM_MODEL)
         
         # Detectar intención y usar la cadena RAG apropiada
         if any(keyword in query_lower for keyword in ['precio', 'costo', 'tarifa', 'valor', 'sirius', 'antares', 'polaris']):
-            try:
-                response = qa_chains['domos_precios'](query)
-                return f"**PRECIOS DE DOMOS**\n\n{response['result']}"
-            except:
-                return (
-                    "**PRECIOS DE NUESTROS DOMOS:**\n\n"
-                    "**DOMO ANTARES** (con jacuzzi): $650,000 COP por noche\n"
-                    "**DOMO POLARIS** (amplio): $550,000 COP por noche\n"
-                    "**DOMO SIRIUS** (economico): $350,000 COP por noche\n\n"
-                    "*Precios incluyen desayuno, WiFi y parqueadero*"
-                )
+            response = _direct_chain_answer('domos_precios', query, use_llm)
+            if response:
+                return f"**PRECIOS DE DOMOS**\n\n{response}"
+            return (
+                "**PRECIOS DE NUESTROS DOMOS:**\n\n"
+                "**DOMO ANTARES** (con jacuzzi): $650,000 COP por noche\n"
+                "**DOMO POLARIS** (amplio): $550,000 COP por noche\n"
+                "**DOMO SIRIUS** (economico): $350,000 COP por noche\n\n"
+                "*Precios incluyen desayuno, WiFi y parqueadero*"
+            )
         
         elif any(keyword in query_lower for keyword in ['servicio', 'incluye', 'ofrece', 'wifi', 'desayuno']):
-            try:
-                response = qa_chains['servicios_incluidos'](query)
-                return f"**SERVICIOS INCLUIDOS**\n\n{response['result']}"
-            except:
-                return (
-                    "**SERVICIOS INCLUIDOS EN TODOS LOS DOMOS:**\n\n"
-                    "- Desayuno delicioso y nutritivo\n"
-                    "- WiFi de alta velocidad\n"
-                    "- Parqueadero gratuito\n"
-                    "- Amenidades basicas\n"
-                    "- Acceso a zonas comunes\n\n"
-                    "*Todos nuestros domos incluyen estos servicios sin costo adicional*"
-                )
+            response = _direct_chain_answer('servicios_incluidos', query, use_llm)
+            if response:
+                return f"**SERVICIOS INCLUIDOS**\n\n{response}"
+            return (
+                "**SERVICIOS INCLUIDOS EN TODOS LOS DOMOS:**\n\n"
+                "- Desayuno delicioso y nutritivo\n"
+                "- WiFi de alta velocidad\n"
+                "- Parqueadero gratuito\n"
+                "- Amenidades basicas\n"
+                "- Acceso a zonas comunes\n\n"
+                "*Todos nuestros domos incluyen estos servicios sin costo adicional*"
+            )
         
         elif any(keyword in query_lower for keyword in ['ubicación', 'dirección', 'donde', 'contacto', 'teléfono']):
-            try:
-                response = qa_chains['ubicacion_contacto'](query)
-                return f"🗺️ **UBICACIÓN Y CONTACTO**\n\n{response['result']}"
-            except:
-                return (
-                    "🗺️ **UBICACIÓN Y CONTACTO:**\n\n"
-                    "📍 **Ubicación:** Guatavita, Cundinamarca\n"
-                    "🌊 Con vista espectacular a la represa de Tominé\n"
-                    "📞 **Contacto:** Vía WhatsApp\n"
-                    "🏝️ RNT: Registro Nacional de Turismo\n\n"
-                    "*Ubicación privilégiada en la naturaleza de Cundinamarca*"
-                )
+            response = _direct_chain_answer('ubicacion_contacto', query, use_llm)
+            if response:
+                return f"🗺️ **UBICACIÓN Y CONTACTO**\n\n{response}"
+            return (
+                "🗺️ **UBICACIÓN Y CONTACTO:**\n\n"
+                "📍 **Ubicación:** Guatavita, Cundinamarca\n"
+                "🌊 Con vista espectacular a la represa de Tominé\n"
+                "📞 **Contacto:** Vía WhatsApp\n"
+                "🏝️ RNT: Registro Nacional de Turismo\n\n"
+                "*Ubicación privilégiada en la naturaleza de Cundinamarca*"
+            )
         
         elif any(keyword in query_lower for keyword in ['actividad', 'hacer', 'turismo', 'paseo', 'diversión']):
-            try:
-                response = qa_chains['servicios_externos'](query)
-                return f"🎯 **ACTIVIDADES Y TURISMO**\n\n{response['result']}"
-            except:
-                return (
-                    "🎯 **ACTIVIDADES EN GUATAVITA:**\n\n"
-                    "• Visita a la Laguna Sagrada de Guatavita\n"
-                    "• Jet ski en la represa de Tominé\n"
-                    "• Paseos a caballo\n"
-                    "• Avistamiento de aves\n"
-                    "• Navegación y deportes acuáticos\n"
-                    "• Caminatas ecológicas\n\n"
-                    "*Experiencias únicas en contacto con la naturaleza*"
-                )
+            response = _direct_chain_answer('servicios_externos', query, use_llm)
+            if response:
+                return f"🎯 **ACTIVIDADES Y TURISMO**\n\n{response}"
+            return (
+                "🎯 **ACTIVIDADES EN GUATAVITA:**\n\n"
+                "• Visita a la Laguna Sagrada de Guatavita\n"
+                "• Jet ski en la represa de Tominé\n"
+                "• Paseos a caballo\n"
+                "• Avistamiento de aves\n"
+                "• Navegación y deportes acuáticos\n"
+                "• Caminatas ecológicas\n\n"
+                "*Experiencias únicas en contacto con la naturaleza*"
+            )
         
         elif any(keyword in query_lower for keyword in ['domo', 'tipo', 'característica', 'diferencia']):
-            try:
-                response = qa_chains['domos_info'](query)
-                return f"🏕️ **INFORMACIÓN DE DOMOS**\n\n{response['result']}"
-            except:
-                return (
-                    "🏕️ **NUESTROS DOMOS GEODÉSICOS:**\n\n"
-                    "🌠 **ANTARES:** Domo de lujo con jacuzzi privado\n"
-                    "🌟 **POLARIS:** Domo amplio para mayor comodidad\n"
-                    "✨ **SIRIUS:** Domo acogedor y económico\n\n"
-                    "*Todos con vista panorámica y diseño único*"
-                )
+            response = _direct_chain_answer('domos_info', query, use_llm)
+            if response:
+                return f"🏕️ **INFORMACIÓN DE DOMOS**\n\n{response}"
+            return (
+                "🏕️ **NUESTROS DOMOS GEODÉSICOS:**\n\n"
+                "🌠 **ANTARES:** Domo de lujo con jacuzzi privado\n"
+                "🌟 **POLARIS:** Domo amplio para mayor comodidad\n"
+                "✨ **SIRIUS:** Domo acogedor y económico\n\n"
+                "*Todos con vista panorámica y diseño único*"
+            )
         
         elif any(keyword in query_lower for keyword in ['disponibilidad', 'disponible', 'fecha', 'reservar']):
             return (
@@ -2560,6 +3302,10 @@ def get_direct_rag_response(query):
             "Por favor, inténtalo de nuevo en unos minutos."
         )
 
+def get_busy_response():
+    """Respuesta cuando el planificador LLM descarta la solicitud por saturación"""
+    return "[BUSY] Nuestro sistema está un poco ocupado en este momento. Por favor, intenta de nuevo en unos segundos."
+
 def get_fallback_empathetic_response():
     """
     Respuesta de respaldo más empática que la anterior
@@ -2607,6 +3353,23 @@ def should_bypass_filter(message):
     
     return False
 
+def classify_turn_priority(session_id, message, button_payload=None):
+    """Determina la clase de prioridad LLM del turno según el estado de la sesión y el mensaje"""
+    state = user_states.get(session_id) or {}
+    message_lower = (message or "").lower()
+
+    # Reservas en curso o intención de reservar: máxima prioridad
+    if state.get("current_flow") == "reserva" or "reserv" in message_lower or \
+       (button_payload and "reserva" in button_payload.lower()):
+        return PRIORITY_RESERVA
+
+    if state.get("waiting_for_availability") or \
+       detectar_intencion_consulta(message or "")['es_consulta_disponibilidad']:
+        return PRIORITY_DISPONIBILIDAD
+
+    # Los mensajes fuera de tema bajan a PRIORITY_OFF_TOPIC en la redirección empática
+    return PRIORITY_FAQ
+
 # WEBHOOK DE WHATSAPP 
 
 @app.route("/whatsapp_webhook", methods=["POST"])
@@ -2617,44 +3380,41 @@ def whatsapp_webhook():
 
     print(f"[{from_number}] Mensaje recibido: '{incoming_msg}' (Payload: '{button_payload}')")
 
+    # El tiempo del turno corre desde que llega el mensaje: la espera para agruparlo también cuenta
+    with turn_deadline(TURN_DEADLINE_SECONDS):
+        # Agrupar mensajes consecutivos rápidos (los botones se procesan de inmediato)
+        if not button_payload:
+            incoming_msg = session_turns.collect(from_number, incoming_msg)
+            if incoming_msg is None:
+                # Mensaje absorbido por el turno en curso de esta sesión; ese turno responde
+                print(f"[{from_number}] Mensaje agrupado con el turno en curso")
+                return str(MessagingResponse())
+
+        with session_turns.turn(from_number), user_states.turn(from_number):
+            priority = classify_turn_priority(from_number, incoming_msg, button_payload)
+            with llm_scheduler.priority(priority):
+                return _process_whatsapp_turn(incoming_msg, from_number, button_payload)
+
+def _process_whatsapp_turn(incoming_msg, from_number, button_payload):
+    """Procesa un turno de WhatsApp; se ejecuta con el turno de la sesión adquirido"""
     resp = MessagingResponse()
     agent_answer = "Lo siento, no pude procesar tu solicitud en este momento."
 
-    if from_number not in user_memories:
-        user_memories[from_number] = load_user_memory(from_number)
+    # La memoria se carga solo en los pasos que usan el historial (el agente)
+    session_memory = open_session_memory(from_number)
     
-    if from_number not in user_states:
-        user_states[from_number] = {"current_flow": "none", "reserva_step": 0, "reserva_data": {}, "waiting_for_availability": False}
+    user_state = user_states.current(from_number)
             
-    memory = user_memories[from_number]
-    user_state = user_states[from_number]
 
     # Verificar si el mensaje es un saludo o una consulta de menú
     
-    # Verificar si es una memoria nueva (solo tiene mensajes del sistema)
-    is_new_conversation = False
-    if hasattr(memory, 'chat_memory') and hasattr(memory.chat_memory, 'messages'):
-        # Si solo tiene 2 mensajes (system + assistant_response) es conversación nueva
-        if len(memory.chat_memory.messages) <= 2:
-            is_new_conversation = True
-    
-    # Si es un saludo en una conversación nueva, mostrar menú de bienvenida
-    if is_greeting_message(incoming_msg) and is_new_conversation:
+    # Si es un saludo en una conversación nueva (sin turnos guardados), mostrar menú de bienvenida
+    if is_greeting_message(incoming_msg) and session_memory.is_new():
         welcome_message = get_welcome_menu()
         resp.message(welcome_message)
         
-        try:
-            from langchain.schema import HumanMessage, AIMessage
-            memory.chat_memory.add_message(HumanMessage(content=incoming_msg))
-            memory.chat_memory.add_message(AIMessage(content=welcome_message))
-        except (ImportError, AttributeError):
-            try:
-                memory.chat_memory.add_user_message(incoming_msg)
-                memory.chat_memory.add_ai_message(welcome_message)
-            except:
-                pass
-        
-        save_user_memory(from_number, memory)
+        session_memory.add_messages(_exchange(incoming_msg, welcome_message))
+        session_memory.commit()
         return str(resp)
     
     # Manejar selecciones del menú principal (números 1-4)
@@ -2670,33 +3430,15 @@ def whatsapp_webhook():
                 resp.message(message_text)
                 
                 # Agregar a la memoria
-                try:
-                    from langchain.schema import HumanMessage, AIMessage
-                    memory.chat_memory.add_message(HumanMessage(content=incoming_msg))
-                    memory.chat_memory.add_message(AIMessage(content=message_text))
-                except (ImportError, AttributeError):
-                    try:
-                        memory.chat_memory.add_user_message(incoming_msg)
-                        memory.chat_memory.add_ai_message(message_text)
-                    except:
-                        pass
+                session_memory.add_messages(_exchange(incoming_msg, message_text))
             else:
                 # Respuesta normal (string)
                 resp.message(menu_response)
                 
                 # Agregar a la memoria
-                try:
-                    from langchain.schema import HumanMessage, AIMessage
-                    memory.chat_memory.add_message(HumanMessage(content=incoming_msg))
-                    memory.chat_memory.add_message(AIMessage(content=menu_response))
-                except (ImportError, AttributeError):
-                    try:
-                        memory.chat_memory.add_user_message(incoming_msg)
-                        memory.chat_memory.add_ai_message(menu_response)
-                    except:
-                        pass
+                session_memory.add_messages(_exchange(incoming_msg, menu_response))
             
-            save_user_memory(from_number, memory)
+            session_memory.commit()
             return str(resp)
         except Exception as e:
             print(f"Error en manejo de menú: {e}")
@@ -2713,18 +3455,9 @@ def whatsapp_webhook():
             user_state["waiting_for_availability"] = False
             
             # Agregar a la memoria
-            try:
-                from langchain.schema import HumanMessage, AIMessage
-                memory.chat_memory.add_message(HumanMessage(content=incoming_msg))
-                memory.chat_memory.add_message(AIMessage(content=availability_response))
-            except (ImportError, AttributeError):
-                try:
-                    memory.chat_memory.add_user_message(incoming_msg)
-                    memory.chat_memory.add_ai_message(availability_response)
-                except:
-                    pass
+            session_memory.add_messages(_exchange(incoming_msg, availability_response))
             
-            save_user_memory(from_number, memory)
+            session_memory.commit()
             return str(resp)
         except Exception as e:
             print(f"Error procesando consulta de disponibilidad: {e}")
@@ -2754,7 +3487,7 @@ def whatsapp_webhook():
             "-Comentarios especiales u observaciones adicionales\n\n"
             "Por favor, escribe toda la información en un solo mensaje."
         )
-        save_user_memory(from_number, memory)
+        session_memory.commit()
         return str(resp)
     
     # Si el usuario ya está en el flujo de reserva y está en el paso 1, procesar la solicitud de reserva
@@ -2843,7 +3576,7 @@ def whatsapp_webhook():
             )
             # No resetear - dar otra oportunidad
         
-        save_user_memory(from_number, memory)
+        session_memory.commit()
         return str(resp)
 
     if user_state["current_flow"] == "reserva" and user_state["reserva_step"] == 2:
@@ -2922,13 +3655,14 @@ def whatsapp_webhook():
             user_state["current_flow"] = "none"
             user_state["reserva_step"] = 0
             user_state["reserva_data"] = {}
-        save_user_memory(from_number, memory)
+        session_memory.commit()
         return str(resp)
 
     # Procesamiento normal con el Agente Conversacional si no hay flujo activo
     try:
         # Inicializar agente con manejo robusto
-        init_success, custom_agent, init_error = initialize_agent_safe(tools, memory, max_retries=3)
+        memory = session_memory.memory
+        init_success, custom_agent, init_error = initialize_agent_safe(tool_selector.select(incoming_msg), memory, max_retries=3)
         
         if not init_success:
             print(f"ERROR: Error al inicializar agente: {init_error}")
@@ -2946,8 +3680,11 @@ def whatsapp_webhook():
                 if "401" in str(run_error) or "invalid_api_key" in str(run_error):
                     print("[FALLBACK] API key inválida, intentando respuesta directa con RAG...")
                     agent_answer = get_direct_rag_response(incoming_msg)
-                elif "rate limit" in run_error.lower():
-                    agent_answer = "[BUSY] Nuestro sistema está un poco ocupado en este momento. Por favor, intenta de nuevo en unos segundos."
+                elif "circuito abierto" in run_error.lower():
+                    print("[CIRCUITO] OpenAI no disponible, respondiendo sin LLM...")
+                    agent_answer = get_direct_rag_response(incoming_msg, use_llm=False)
+                elif "rate limit" in run_error.lower() or "sistema ocupado" in run_error.lower():
+                    agent_answer = get_busy_response()
                 elif "timeout" in run_error.lower():
                     agent_answer = "[TIMEOUT] Tu mensaje está siendo procesado, pero está tomando más tiempo del esperado. ¿Podrías intentar con un mensaje más corto?"
                 elif "parsing" in run_error.lower():
@@ -2957,31 +3694,18 @@ def whatsapp_webhook():
                     print("[FALLBACK] Error general, intentando respuesta directa con RAG...")
                     agent_answer = get_direct_rag_response(incoming_msg)
         
+        # Las herramientas de retorno directo pueden pedir un cambio de flujo
+        agent_answer = apply_agent_sentinel(agent_answer, user_state, memory)
+        
         # Guardar memoria independientemente del resultado
-        save_user_memory(from_number, memory)
+        session_memory.commit()
         
     except Exception as e:
         print(f"ERROR: Error inesperado en procesamiento conversacional: {e}")
         agent_answer = "🔧 Estamos experimentando problemas técnicos temporales. Por favor, intenta contactarnos de nuevo en unos minutos."
 
-    # Si el agente decide iniciar el flujo de reserva (a través de la herramienta)
-    if agent_answer == "REQUEST_RESERVATION_DETAILS":
-        resp.message(
-            "¡Claro! Para tu reserva, necesito los siguientes datos:\n"
-            "- Tu nombre completo y el de tus acompañantes\n"
-            "- Tipo de domo que te gustaría reservar\n"
-            "- Fecha de entrada y fecha de salida (Formato DD/MM/AAAA)\n"
-            "- Servicios adicionales que quieras incluir (ej. cena romántica, masajes)\n"
-            "- Cualquier adición especial (ej. mascota, decoración específica)\n"
-            "- Tu número de teléfono de contacto\n"
-            "- Tu correo electrónico de contacto\n"
-            "- Método de pago preferido (efectivo, transferencia, tarjeta)\n"
-            "- Comentarios especiales u observaciones adicionales\n\n"
-            "Por favor, envíame toda esta información en un solo mensaje para procesar tu solicitud."
-        )
-    else:
-        resp.message(agent_answer)
-        print(f"[{from_number}] Respuesta: '{agent_answer}'")
+    resp.message(agent_answer)
+    print(f"[{from_number}] Respuesta: '{agent_answer}'")
     return str(resp)
 
 def detectar_intencion_consulta(user_input: str) -> dict:
@@ -3008,59 +3732,87 @@ def detectar_intencion_consulta(user_input: str) -> dict:
         'keywords_detectadas': keywords_encontradas
     }
 
+def _chat_memory_payload(memory, memory_echo: dict = None) -> dict:
+    """
+    Memoria que acompaña la respuesta de /chat: completa, los últimos mensajes o nada.
+
+    Con "last" se devuelven los últimos mensajes, el total y el cursor para
+    pedir los anteriores a /chat/<session_id>/history. Si se recibe la
+    memoria diferida del turno, solo se carga cuando hay que devolverla.
+    """
+    memory_echo = memory_echo or {}
+    mode = memory_echo.get("mode") or CHAT_MEMORY_ECHO
+    if mode == "none":
+        return {}
+    if isinstance(memory, LazySessionMemory):
+        memory = memory.memory
+    messages = memory.chat_memory.messages
+    if mode == "full":
+        return {"memory": messages_to_dict(messages)}
+    last_n = memory_echo.get("last")
+    last_n = CHAT_MEMORY_ECHO_LAST if last_n is None else last_n
+    start = max(0, len(messages) - last_n)
+    return {
+        "memory": messages_to_dict(messages[start:]),
+        "memory_total": len(messages),
+        "memory_cursor": start or None,
+    }
+
+def _parse_memory_echo(data: dict) -> dict:
+    """Lee del request cómo devolver la memoria: "memory" (full, last, none) y "memory_last" """
+    mode = str(data.get("memory") or "").lower()
+    memory_echo = {"mode": mode if mode in ("full", "last", "none") else None}
+    try:
+        if data.get("memory_last") is not None:
+            memory_echo["last"] = max(0, min(int(data["memory_last"]), CHAT_HISTORY_MAX_PAGE))
+    except (TypeError, ValueError):
+        pass
+    return memory_echo
+
 # ENDPOINT PRINCIPAL PARA CHAT WEB DE WHATSAPP 
 @app.route("/chat", methods=["POST"])
 def chat():
     data = request.get_json() # Obtener JSON del request
     user_input = data.get("input", "").strip()
-    session_id = data.get("session_id", str(uuid.uuid4()))
+    session_id = str(data.get("session_id") or uuid.uuid4())
+    # Recordar sesiones anteriores solo con una identidad verificada (token firmado por el sitio)
+    recall_user = verified_chat_user(data.get("user_token"))
+    memory_echo = _parse_memory_echo(data) # Cuánta memoria devolver en la respuesta
 
     if not user_input: # Verificar si el campo 'input' esta presente
         return jsonify({"error": "Falta el campo 'input'"}), 400 
+    if is_whatsapp_session(session_id):
+        return jsonify({"error": "session_id inválido"}), 400
 
-    if session_id not in user_memories: # Cargar o inicializar memoria del usuario
-        user_memories[session_id] = load_user_memory(session_id)
-    
-    if session_id not in user_states: # Inicializar estado del usuario
-        user_states[session_id] = {"current_flow": "none", "reserva_step": 0, "reserva_data": {}, "waiting_for_availability": False}
+    # Un solo turno activo por sesión; el estado se lee al inicio y se guarda al final del turno
+    with turn_deadline(TURN_DEADLINE_SECONDS), session_turns.turn(session_id), user_states.turn(session_id):
+        priority = classify_turn_priority(session_id, user_input)
+        with llm_scheduler.priority(priority):
+            return _process_chat_turn(user_input, session_id, recall_user, memory_echo)
 
-    memory = user_memories[session_id]
-    user_state = user_states[session_id]
+def _process_chat_turn(user_input, session_id, recall_user=None, memory_echo=None):
+    """Procesa un turno de /chat; se ejecuta con el turno de la sesión adquirido"""
+    # La memoria se carga solo en los pasos que usan el historial (el agente o la memoria de la respuesta)
+    session_memory = open_session_memory(session_id)
+    user_state = user_states.current(session_id) # Estado del turno en curso
 
     response_output = "Lo siento, no pude procesar tu solicitud en este momento."
     
     #  SISTEMA DE MENÚ PRINCIPAL PARA /chat 
     
-    # Verificar si es una memoria nueva (solo tiene mensajes del sistema)
-    is_new_conversation = False
-    if hasattr(memory, 'chat_memory') and hasattr(memory.chat_memory, 'messages'):
-        # Si solo tiene 2 mensajes (system + assistant_response) es conversación nueva
-        if len(memory.chat_memory.messages) <= 2:
-            is_new_conversation = True
-    
-    # Si es un saludo en una conversación nueva, mostrar menú de bienvenida
-    if is_greeting_message(user_input) and is_new_conversation:
+    # Si es un saludo en una conversación nueva (sin turnos guardados), mostrar menú de bienvenida
+    if is_greeting_message(user_input) and session_memory.is_new():
         welcome_message = get_welcome_menu()
         response_output = welcome_message
         
         # Agregar este intercambio a la memoria
-        try:
-            from langchain.schema import HumanMessage, AIMessage
-            memory.chat_memory.add_message(HumanMessage(content=user_input))
-            memory.chat_memory.add_message(AIMessage(content=welcome_message))
-        except (ImportError, AttributeError):
-            try:
-                memory.chat_memory.add_user_message(user_input)
-                memory.chat_memory.add_ai_message(welcome_message)
-            except:
-                pass
-        
-        save_user_memory(session_id, memory)
+        session_memory.add_messages(_exchange(user_input, welcome_message))
+        session_memory.commit()
         
         return jsonify({
             "session_id": session_id,
             "response": response_output,
-            "memory": messages_to_dict(memory.chat_memory.messages)
+            **_chat_memory_payload(session_memory, memory_echo)
         })
     
     # Manejar selecciones del menú principal (números 1-4)
@@ -3078,23 +3830,14 @@ def chat():
                 response_output = menu_response
             
             # Agregar a la memoria
-            try:
-                from langchain.schema import HumanMessage, AIMessage
-                memory.chat_memory.add_message(HumanMessage(content=user_input))
-                memory.chat_memory.add_message(AIMessage(content=response_output))
-            except (ImportError, AttributeError):
-                try:
-                    memory.chat_memory.add_user_message(user_input)
-                    memory.chat_memory.add_ai_message(response_output)
-                except:
-                    pass
+            session_memory.add_messages(_exchange(user_input, response_output))
             
-            save_user_memory(session_id, memory)
+            session_memory.commit()
             
             return jsonify({
                 "session_id": session_id,
                 "response": response_output,
-                "memory": messages_to_dict(memory.chat_memory.messages)
+                **_chat_memory_payload(session_memory, memory_echo)
             })
         except Exception as e:
             print(f"Error en manejo de menú en /chat: {e}")
@@ -3103,7 +3846,7 @@ def chat():
             return jsonify({
                 "session_id": session_id,
                 "response": response_output,
-                "memory": messages_to_dict(memory.chat_memory.messages)
+                **_chat_memory_payload(session_memory, memory_echo)
             })
 
     # Manejar consultas de disponibilidad cuando el usuario está en modo "esperando disponibilidad"
@@ -3116,23 +3859,14 @@ def chat():
             user_state["waiting_for_availability"] = False
             
             # Agregar a la memoria
-            try:
-                from langchain.schema import HumanMessage, AIMessage
-                memory.chat_memory.add_message(HumanMessage(content=user_input))
-                memory.chat_memory.add_message(AIMessage(content=availability_response))
-            except (ImportError, AttributeError):
-                try:
-                    memory.chat_memory.add_user_message(user_input)
-                    memory.chat_memory.add_ai_message(availability_response)
-                except:
-                    pass
+            session_memory.add_messages(_exchange(user_input, availability_response))
             
-            save_user_memory(session_id, memory)
+            session_memory.commit()
             
             return jsonify({
                 "session_id": session_id,
                 "response": response_output,
-                "memory": messages_to_dict(memory.chat_memory.messages)
+                **_chat_memory_payload(session_memory, memory_echo)
             })
         except Exception as e:
             print(f"Error procesando consulta de disponibilidad en /chat: {e}")
@@ -3142,7 +3876,7 @@ def chat():
             return jsonify({
                 "session_id": session_id,
                 "response": response_output,
-                "memory": messages_to_dict(memory.chat_memory.messages)
+                **_chat_memory_payload(session_memory, memory_echo)
             })
     
     # Lógica de flujo de reserva para el endpoint /chat
@@ -3328,23 +4062,14 @@ def chat():
                 response_output = off_topic_response
                 
                 # Agregar a la memoria
-                try:
-                    from langchain.schema import HumanMessage, AIMessage
-                    memory.chat_memory.add_message(HumanMessage(content=user_input))
-                    memory.chat_memory.add_message(AIMessage(content=off_topic_response))
-                except (ImportError, AttributeError):
-                    try:
-                        memory.chat_memory.add_user_message(user_input)
-                        memory.chat_memory.add_ai_message(off_topic_response)
-                    except:
-                        pass
+                session_memory.add_messages(_exchange(user_input, off_topic_response))
                 
-                save_user_memory(session_id, memory)
+                session_memory.commit()
                 
                 return jsonify({
                     "session_id": session_id,
                     "response": response_output,
-                    "memory": messages_to_dict(memory.chat_memory.messages)
+                    **_chat_memory_payload(session_memory, memory_echo)
                 })
         
         # Procesamiento normal con el agente robusto si no hay flujo de reserva activo
@@ -3373,7 +4098,10 @@ Consulta original del usuario: {user_input}
 """
         
         # Inicializar agente con manejo robusto
-        init_success, agent, init_error = initialize_agent_safe(tools, memory, max_retries=3)
+        memory = session_memory.memory
+        if recall_user:
+            attach_recall(memory, session_id, recall_user)
+        init_success, agent, init_error = initialize_agent_safe(tool_selector.select(user_input), memory, max_retries=3)
         
         if not init_success:
             print(f"ERROR: Error al inicializar agente para {session_id}: {init_error}")
@@ -3383,7 +4111,7 @@ Consulta original del usuario: {user_input}
             run_success, result, run_error = run_agent_safe(agent, agent_input, max_retries=2)
             
             if run_success:
-                response_output = result
+                response_output = apply_agent_sentinel(result, user_state, memory)
             else:
                 print(f"ERROR: Error ejecutando agente para {session_id}: {run_error}")
                 
@@ -3391,8 +4119,11 @@ Consulta original del usuario: {user_input}
                 if "401" in str(run_error) or "invalid_api_key" in str(run_error):
                     print(f"[FALLBACK CHAT] API key inválida, intentando respuesta directa con RAG...")
                     response_output = get_direct_rag_response(user_input)
-                elif "rate limit" in run_error.lower():
-                    response_output = "[BUSY] Nuestro sistema está un poco ocupado en este momento. Por favor, intenta de nuevo en unos segundos."
+                elif "circuito abierto" in run_error.lower():
+                    print(f"[CIRCUITO] OpenAI no disponible, respondiendo sin LLM...")
+                    response_output = get_direct_rag_response(user_input, use_llm=False)
+                elif "rate limit" in run_error.lower() or "sistema ocupado" in run_error.lower():
+                    response_output = get_busy_response()
                 elif "timeout" in run_error.lower():
                     response_output = "[TIMEOUT] Tu mensaje está siendo procesado, pero está tomando más tiempo del esperado. ¿Podrías intentar con un mensaje más corto?"
                 elif "parsing" in run_error.lower():
@@ -3402,27 +4133,73 @@ Consulta original del usuario: {user_input}
                     print(f"[FALLBACK CHAT] Error general, intentando respuesta directa con RAG...")
                     response_output = get_direct_rag_response(user_input)
     
-    # Añadir mensajes a la memoria con API compatible
+    # Añadir el intercambio a la memoria (sin cargarla si el turno no usó el historial)
     try:
-        # Método 1: API nueva de langchain 0.1.0
-        from langchain.schema import HumanMessage, AIMessage
-        memory.chat_memory.add_message(HumanMessage(content=user_input))
-        memory.chat_memory.add_message(AIMessage(content=response_output))
-    except (ImportError, AttributeError):
-        try:
-            # Método 2: API legacy
-            memory.chat_memory.add_user_message(user_input)
-            memory.chat_memory.add_ai_message(response_output)
-        except AttributeError:
-            # Método 3: Fallback - no guardar en memoria si falla
-            print(f"WARNING:  No se pudo añadir mensaje a la memoria para sesión: {session_id}")
+        session_memory.add_messages(_exchange(user_input, response_output))
+    except AttributeError:
+        # Fallback - no guardar en memoria si falla
+        print(f"WARNING:  No se pudo añadir mensaje a la memoria para sesión: {session_id}")
     
-    save_user_memory(session_id, memory)
+    session_memory.commit()
 
     return jsonify({
         "session_id": session_id,
         "response": response_output,
-        "memory": messages_to_dict(memory.chat_memory.messages)
+        **_chat_memory_payload(session_memory, memory_echo)
+    })
+
+@app.route("/chat/<session_id>/history", methods=["GET"]) # Historial paginado de una sesión de /chat
+def chat_history(session_id):
+    """
+    Devuelve el historial de la sesión por páginas, de los mensajes más nuevos a los más viejos.
+
+    Parámetros: before (cursor: índice del primer mensaje ya recibido; sin él
+    se empieza por el final) y limit. La respuesta trae next_cursor para la
+    página anterior, o null cuando ya no quedan mensajes.
+
+    Solo sirve sesiones de /chat: el session_id aleatorio del cliente web es
+    su credencial. Las de WhatsApp usan el número como id y no se exponen.
+    """
+    if is_whatsapp_session(session_id):
+        # Mismo 404 que una sesión inexistente, sin tocar la memoria ni el registro
+        return jsonify({"error": "Sesión no encontrada", "session_id": session_id}), 404
+    limit = max(1, min(request.args.get('limit', 20, type=int), CHAT_HISTORY_MAX_PAGE))
+    before = request.args.get('before', type=int)
+
+    # La sesión en memoria (o pendiente de guardar) es más reciente que el registro
+    pending = memory_persister.pending(session_id)
+    if isinstance(pending, PendingTurns):
+        # Turnos anexados sin cargar la sesión: se escriben antes de leer el registro
+        memory_persister.flush(session_id)
+        pending = memory_persister.pending(session_id)
+    if isinstance(pending, PendingTurns):
+        pending = None
+    memory = user_memories.get(session_id) or pending
+    if memory is not None:
+        messages = memory.chat_memory.messages
+        total = len(messages)
+    else:
+        with _memory_io_lock:
+            if not memory_log.exists(session_id):
+                _restore_archived_session(session_id)
+            if before is None:
+                data = memory_log.tail(session_id, limit)
+            else:
+                data = memory_log.read_range(session_id, max(0, before - limit), before)
+        if data is None:
+            return jsonify({"error": "Sesión no encontrada", "session_id": session_id}), 404
+        total = data["total"]
+
+    stop = total if before is None else max(0, min(before, total))
+    start = min(stop, max(0, (total if before is None else before) - limit))
+    page = messages_to_dict(messages[start:stop]) if memory is not None else data["messages"]
+
+    return jsonify({
+        "session_id": session_id,
+        "messages": page,
+        "start": start,
+        "total": total,
+        "next_cursor": start or None,
     })
 
 # Endpoint para obtener todas las reservas Conexion con el frontend
@@ -3887,84 +4664,13 @@ def extraer_parametros_consulta(consulta):
     consulta_lower = consulta.lower()
     print(f"[ANALISIS] Analizando consulta: '{consulta_lower}'")
 
-    # PATRONES DE FECHA MEJORADOS PARA WHATSAPP
-    patrones_fecha = [
-        # DD/MM/YYYY o DD-MM-YYYY
-        (r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', 'dmy'),
-        # YYYY-MM-DD
-        (r'(\d{4})-(\d{1,2})-(\d{1,2})', 'ymd'),
-        # "24 de diciembre del 2025" - NUEVO PATRÓN ESPECÍFICO
-        (r'(\d{1,2})\s+de\s+(\w+)\s+del?\s+(\d{4})', 'dmy_texto_con_año'),
-        # "24 de diciembre" (sin año)
-        (r'(\d{1,2})\s+de\s+(\w+)(?!\s+del?\s+\d)', 'dmy_texto_sin_año'),
-        # "diciembre 24, 2025"
-        (r'(\w+)\s+(\d{1,2}),?\s+(\d{4})', 'mdy_texto'),
-    ]
-
-    meses_espanol = {
-        'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
-        'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
-        'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
-        'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
-        'jul': 7, 'ago': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12
-    }
-
-    # Buscar fechas
-    for patron, tipo in patrones_fecha:
-        matches = re.findall(patron, consulta_lower)
-        if matches:
-            try:
-                match = matches[0]
-                print(f"📅 Fecha encontrada: {match}, tipo: {tipo}")
-
-                if tipo == 'dmy':
-                    dia, mes, año = int(match[0]), int(match[1]), int(match[2])
-                    fecha_obj = datetime(año, mes, dia).date()
-                elif tipo == 'ymd':
-                    año, mes, dia = int(match[0]), int(match[1]), int(match[2])
-                    fecha_obj = datetime(año, mes, dia).date()
-                elif tipo == 'dmy_texto_con_año':
-                    dia = int(match[0])
-                    mes_nombre = match[1].lower()
-                    año = int(match[2])
-                    
-                    if mes_nombre in meses_espanol:
-                        mes = meses_espanol[mes_nombre]
-                        fecha_obj = datetime(año, mes, dia).date()
-                    else:
-                        continue
-                elif tipo == 'dmy_texto_sin_año':
-                    dia = int(match[0])
-                    mes_nombre = match[1].lower()
-                    año = datetime.now().year
-                    
-                    if mes_nombre in meses_espanol:
-                        mes = meses_espanol[mes_nombre]
-                        # Si la fecha ya pasó este año, usar el próximo año
-                        fecha_tentativa = datetime(año, mes, dia).date()
-                        if fecha_tentativa < datetime.now().date():
-                            año += 1
-                        fecha_obj = datetime(año, mes, dia).date()
-                    else:
-                        continue
-                elif tipo == 'mdy_texto':
-                    mes_nombre = match[0].lower()
-                    dia = int(match[1])
-                    año = int(match[2])
-                    
-                    if mes_nombre in meses_espanol:
-                        mes = meses_espanol[mes_nombre]
-                        fecha_obj = datetime(año, mes, dia).date()
-                    else:
-                        continue
-
-                parametros['fecha_inicio'] = fecha_obj.strftime('%Y-%m-%d')
-                print(f"✅ Fecha procesada: {parametros['fecha_inicio']}")
-                break
-
-            except Exception as e:
-                print(f"ERROR Error procesando fecha {match}: {e}")
-                continue
+    # Fechas y rangos en español: "del 15 al 17 de diciembre", "este fin de semana", "puente festivo"
+    rango = parse_date_range(consulta)
+    if rango:
+        parametros['fecha_inicio'] = rango.start.strftime('%Y-%m-%d')
+        if rango.end:
+            parametros['fecha_fin'] = rango.end.strftime('%Y-%m-%d')
+        print(f"📅 Fechas encontradas ({rango.kind}): {parametros['fecha_inicio']} - {parametros['fecha_fin']}")
 
     # Detectar domos
     domos_nombres = {
@@ -3984,7 +4690,7 @@ def extraer_parametros_consulta(consulta):
     # Detectar número de personas
     patrones_personas = [
         r'(\d+)\s+persona[s]?',
-        r'para\s+(\d+)',
+        r'para\s+(\d+)\b(?![/.-]\d|\s+noches?|\s+de\s)',
         r'somos\s+(\d+)',
         r'(\d+)\s+huespedes?'
     ]
@@ -4065,6 +4771,68 @@ def generar_respuesta_natural_disponibilidades(datos_disponibilidades, parametro
         print(f"ERROR Error generando respuesta natural: {e}")
         return "Tenemos domos disponibles. ¿Te gustaría hacer una reserva?"
 
+@app.route('/api/conversaciones/buscar', methods=['GET']) # Búsqueda de texto completo en las conversaciones
+def buscar_conversaciones():
+    """
+    Busca turnos de conversación por palabras, los más relevantes primero.
+
+    Parámetros: q (obligatorio), canal (whatsapp|web), telefono, session_id,
+    fecha_inicio y fecha_fin (YYYY-MM-DD, ambas inclusive), pagina, por_pagina.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'El parámetro q es obligatorio', 'resultados': []}), 400
+
+        try:
+            fecha_inicio = request.args.get('fecha_inicio')
+            fecha_fin = request.args.get('fecha_fin')
+            since = datetime.strptime(fecha_inicio, '%Y-%m-%d').timestamp() if fecha_inicio else None
+            until = (datetime.strptime(fecha_fin, '%Y-%m-%d') + timedelta(days=1)).timestamp() if fecha_fin else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Las fechas deben tener formato YYYY-MM-DD', 'resultados': []}), 400
+
+        resultado = conversation_search.search(
+            query,
+            channel=request.args.get('canal'),
+            phone=request.args.get('telefono'),
+            session_id=request.args.get('session_id'),
+            since=since,
+            until=until,
+            page=request.args.get('pagina', 1, type=int),
+            per_page=request.args.get('por_pagina', 20, type=int),
+        )
+        resultados = [
+            {
+                'session_id': fila['session_id'],
+                'canal': fila['channel'],
+                'telefono': fila['phone'],
+                'indice_mensaje': fila['message_index'],
+                'rol': fila['role'],
+                'fecha': datetime.fromtimestamp(fila['ts']).isoformat(timespec='seconds'),
+                'fragmento': fila['snippet'],
+                'relevancia': round(-fila['score'], 3),
+            }
+            for fila in resultado['results']
+        ]
+        return jsonify({
+            'success': True,
+            'query': query,
+            'total': resultado['total'],
+            'pagina': resultado['page'],
+            'por_pagina': resultado['per_page'],
+            'resultados': resultados,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        print(f"Error en endpoint GET /api/conversaciones/buscar: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Error interno del servidor',
+            'resultados': []
+        }), 500
+
 @app.route('/health', methods=['GET']) # Endpoint de salud mejorado
 def health_check():
     """Health check endpoint para monitoreo mejorado"""
@@ -4081,7 +4849,27 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat(),
             'database': db_status,
             'database_url_configured': bool(database_url),
-            'sqlalchemy_initialized': db is not None
+            'sqlalchemy_initialized': db is not None,
+            'session_turns': session_turns.get_stats(),
+            'llm_scheduler': llm_scheduler.get_stats(),
+            'llm_deadlines': llm_deadline.get_stats(),
+            'circuit_breakers': openai_breakers.get_stats(),
+            'last_good_answers': last_good_answers.get_stats(),
+            'single_flight': llm_flights.get_stats(),
+            'semantic_recall': recall_index.get_stats(),
+            'tool_selection': tool_selector.get_stats(),
+            'parallel_tools': parallel_agent.get_stats(),
+            'model_routing': model_router.get_stats(),
+            'memory_log': memory_log.get_stats(),
+            'memory_store': get_memory_system_health(),
+            'conversation_search': conversation_search.get_stats(),
+            'memory_write_behind': memory_persister.get_stats(),
+            'session_cache': user_memories.get_stats(),
+            'lazy_sessions': LazySessionMemory.get_stats(),
+            'session_state': user_states.get_stats(),
+            'reservation_parsing': get_parse_stats("reservation"),
+            'availability_parsing': get_parse_stats("availability"),
+            'system_prompt': {'version': SYSTEM_PROMPT_VERSION, 'hash': SYSTEM_PROMPT_HASH}
         }
 
         # Si la BD no está disponible, devolver 503 
@@ -4415,5 +5203,7 @@ def home():
     return "Servidor Flask con Agente RAG y WhatsApp conectado. La memoria del agente ahora es persistente."
 
 if __name__ == "__main__":
+    init_memory_storage()
+    start_memory_retention()
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,249 @@
+# circuit_breaker.py
+"""
+Circuit breaker por modelo para las llamadas a OpenAI.
+
+Lleva la tasa de fallos reciente de cada modelo en una ventana deslizante y
+abre el circuito al superar un umbral. Mientras está abierto las solicitudes
+no esperan reintentos: se rechazan al instante para que el bot responda por
+rutas locales (palabras clave, respuestas en caché, menú). Tras un tiempo el
+circuito pasa a semiabierto y deja pasar pocas sondas; si responden bien, se
+restablece el servicio normal.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Códigos HTTP que indican un problema del proveedor (credenciales, cuota, servidor) y no de la solicitud
+_PROVIDER_STATUS_CODES = {401, 403, 408, 429}
+# Textos de errores que LangChain relanza sin conservar la excepción original de OpenAI
+_PROVIDER_ERROR_HINTS = (
+    "rate limit", "timed out", "connection error", "invalid_api_key", "overloaded", "service unavailable",
+)
+
+
+class CircuitOpenError(Exception):
+    """Se lanza cuando se intenta llamar a un modelo con el circuito abierto"""
+
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Circuito abierto: modelo '{name}' no disponible temporalmente")
+
+
+def _status_code(error: Exception):
+    """Código HTTP de un error de OpenAI (APIStatusError) o de httpx (HTTPStatusError)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """Indica si la excepción proviene de OpenAI (red, cuota, servidor) y debe contar como fallo"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, "local", False):
+            # Plazo agotado antes de salir hacia el proveedor (p. ej. pool lleno): es carga propia
+            return False
+        if isinstance(error, TimeoutError):
+            return True
+        if type(error).__module__.split(".")[0] in ("openai", "httpx"):
+            status = _status_code(error)
+            # Sin código: red o timeout; con código, solo los que no dependen de nuestra solicitud
+            return status is None or status in _PROVIDER_STATUS_CODES or status >= 500
+        message = str(error).lower()
+        if any(hint in message for hint in _PROVIDER_ERROR_HINTS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """Circuito cerrado/abierto/semiabierto basado en la tasa de fallos reciente"""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 5,
+                 window_seconds: float = 60.0, open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, int(min_calls))
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, int(half_open_probes))
+        self._lock = threading.Lock()
+        self._results = deque()  # (momento, éxito)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    def _current_state(self) -> str:
+        # Pasar a semiabierto cuando vence el tiempo de apertura
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._results.clear()
+        self._stats["opened"] += 1
+        print(f"[CIRCUITO] Abierto para '{self.name}' durante {self.open_seconds:.0f}s")
+
+    def _prune(self, now: float):
+        while self._results and now - self._results[0][0] > self.window_seconds:
+            self._results.popleft()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def is_open(self) -> bool:
+        """True si el circuito rechaza llamadas; no consume sondas del estado semiabierto"""
+        return self.state == STATE_OPEN
+
+    def allow_request(self) -> bool:
+        """Decide si una llamada puede ir a OpenAI; en semiabierto reserva una sonda"""
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            if self._current_state() == STATE_HALF_OPEN:
+                self._state = STATE_CLOSED
+                self._probes_in_flight = 0
+                self._results.clear()
+                print(f"[CIRCUITO] Cerrado para '{self.name}': servicio restablecido")
+                return
+            now = time.monotonic()
+            self._results.append((now, True))
+            self._prune(now)
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["failures"] += 1
+            state = self._current_state()
+            if state == STATE_HALF_OPEN:
+                self._open()
+                return
+            if state == STATE_OPEN:
+                return
+            now = time.monotonic()
+            self._results.append((now, False))
+            self._prune(now)
+            failures = sum(1 for _, ok in self._results if not ok)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._open()
+
+    def release_probe(self):
+        """Libera una sonda semiabierta cuyo resultado no dice nada del proveedor"""
+        with self._lock:
+            if self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    @contextmanager
+    def protect(self):
+        """Context manager que rechaza si el circuito está abierto y registra el resultado"""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name)
+        try:
+            yield
+        except Exception as e:
+            if is_provider_failure(e):
+                self.record_failure()
+            else:
+                self.release_probe()
+            raise
+        self.record_success()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            total = len(self._results)
+            failures = sum(1 for _, ok in self._results if not ok)
+            stats = dict(self._stats)
+        stats["state"] = state
+        stats["recent_failure_rate"] = round(failures / total, 2) if total else 0.0
+        return stats
+
+
+class BreakerRegistry:
+    """Un circuit breaker por modelo, creado bajo demanda con la misma configuración"""
+
+    def __init__(self, **breaker_kwargs):
+        self._breaker_kwargs = breaker_kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, **self._breaker_kwargs)
+                self._breakers[name] = breaker
+            return breaker
+
+    def is_open(self, name: str) -> bool:
+        return self.get(name).is_open()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.get_stats() for name, breaker in breakers.items()}
+
+
+class LastGoodCache:
+    """Guarda la última respuesta exitosa por clave para servirla cuando OpenAI no responde"""
+
+    def __init__(self, max_entries: int = 200):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _normalize(key: str) -> str:
+        return " ".join((key or "").lower().split())
+
+    def put(self, key: str, value: str):
+        if not value:
+            return
+        key = self._normalize(key)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        key = self._normalize(key)
+        with self._lock:
+            value = self._entries.get(key)
+            self._stats["hits" if value is not None else "misses"] += 1
+            return value
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+__all__ = [
+    'CircuitBreaker', 'BreakerRegistry', 'CircuitOpenError', 'LastGoodCache', 'is_provider_failure',
+    'STATE_CLOSED', 'STATE_OPEN', 'STATE_HALF_OPEN',
+]
@@ -0,0 +1,226 @@
+# conversation_search.py
+"""
+Búsqueda de texto completo sobre los turnos de todas las conversaciones.
+
+Cada guardado de memoria agrega al índice solo los mensajes nuevos de la
+sesión (y vuelve a indexar el último si se reescribió). El índice es una
+tabla SQLite con un índice FTS5 externo sincronizado por triggers; las
+búsquedas se ordenan por relevancia (bm25) y se filtran por fecha, canal y
+número de teléfono sin recorrer los archivos de memoria.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS turns ("
+    "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, channel TEXT NOT NULL, phone TEXT, "
+    "message_index INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, ts REAL NOT NULL, "
+    "UNIQUE (session_id, message_index))",
+    "CREATE INDEX IF NOT EXISTS turns_ts ON turns (ts)",
+    "CREATE INDEX IF NOT EXISTS turns_phone ON turns (phone, ts)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5("
+    "content, content='turns', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN "
+    "INSERT INTO turns_fts (rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN "
+    "INSERT INTO turns_fts (turns_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS turns_au AFTER UPDATE OF content ON turns BEGIN "
+    "INSERT INTO turns_fts (turns_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO turns_fts (rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TABLE IF NOT EXISTS progress (session_id TEXT PRIMARY KEY, indexed INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+)
+
+
+def session_channel(session_id: str) -> tuple:
+    """(canal, teléfono) de una sesión: las de WhatsApp usan el número de Twilio como id"""
+    if session_id.startswith("whatsapp"):
+        return "whatsapp", "".join(c for c in session_id if c.isdigit())
+    return "web", None
+
+
+def build_match_query(text: str) -> str:
+    """Convierte el texto libre del panel en una consulta FTS5 (todas las palabras, sin sintaxis)"""
+    return " ".join(f'"{token}"' for token in _TOKEN_RE.findall(text or ""))
+
+
+class ConversationSearchIndex:
+    """Índice FTS5 de los turnos de todas las sesiones"""
+
+    def __init__(self, path: str, background: bool = True, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index") if background else None
+        self._stats = {"indexed_messages": 0, "searches": 0, "search_ms": 0.0, "errors": 0}
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add_messages(self, session_id: str, messages: list, ts: float = None, offset: int = 0):
+        """
+        Indexa los mensajes nuevos de la sesión; en segundo plano si está habilitado.
+
+        `messages` es el historial completo o, con `offset`, solo su parte
+        final a partir del mensaje número `offset`.
+        """
+        messages = list(messages)
+        ts = ts or time.time()
+        if self._executor is not None:
+            self._executor.submit(self._safe_index, session_id, messages, ts, offset)
+        else:
+            self._safe_index(session_id, messages, ts, offset)
+
+    def _safe_index(self, session_id, messages, ts, offset=0):
+        try:
+            self._index_messages(session_id, messages, ts, offset)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            print(f"ERROR: Error indexando búsqueda para {session_id}: {e}")
+
+    def _index_messages(self, session_id: str, messages: list, ts: float, offset: int = 0):
+        conn = self._conn()
+        channel, phone = session_channel(session_id)
+        total = offset + len(messages)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT indexed FROM progress WHERE session_id = ?", (session_id,)).fetchone()
+            indexed = row[0] if row else 0
+            if indexed > total:
+                # La sesión se reinició: se indexa desde el principio
+                conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                indexed = 0
+            # El último mensaje ya indexado puede haberse reescrito; se revisa junto con los nuevos
+            start = max(offset, indexed - 1)
+            rows = []
+            for i in range(start, total):
+                message = messages[i - offset]
+                content = message.content if isinstance(message.content, str) else str(message.content)
+                rows.append((session_id, channel, phone, i, message.type, content, ts))
+            conn.executemany(
+                "INSERT INTO turns (session_id, channel, phone, message_index, role, content, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_id, message_index) DO UPDATE SET content = excluded.content, "
+                "role = excluded.role WHERE content != excluded.content",
+                rows,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO progress (session_id, indexed) VALUES (?, ?)", (session_id, total)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._stats["indexed_messages"] += total - max(indexed, offset)
+
+    def search(self, text: str, channel: str = None, phone: str = None, session_id: str = None,
+               since: float = None, until: float = None, page: int = 1, per_page: int = 20) -> dict:
+        """
+        Turnos que contienen todas las palabras de `text`, los más relevantes primero.
+
+        `phone` acepta el número con o sin indicativo (se compara por el final).
+        Devuelve {"total", "page", "per_page", "results"}.
+        """
+        match = build_match_query(text)
+        page, per_page = max(1, page), max(1, min(per_page, 100))
+        if not match:
+            return {"total": 0, "page": page, "per_page": per_page, "results": []}
+
+        where, params = ["turns_fts MATCH ?"], [match]
+        if channel:
+            where.append("t.channel = ?")
+            params.append(channel)
+        digits = "".join(c for c in (phone or "") if c.isdigit())
+        if digits:
+            where.append("t.phone LIKE ?")
+            params.append(f"%{digits}")
+        if session_id:
+            where.append("t.session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            where.append("t.ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("t.ts < ?")
+            params.append(until)
+        condition = " AND ".join(where)
+
+        start = time.perf_counter()
+        conn = self._conn()
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid WHERE {condition}", params
+        ).fetchone()[0]
+        rows = conn.execute(
+            "SELECT t.session_id, t.channel, t.phone, t.message_index, t.role, t.ts, "
+            "snippet(turns_fts, 0, '[', ']', '…', 12) AS snippet, bm25(turns_fts) AS score "
+            f"FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid WHERE {condition} "
+            "ORDER BY score LIMIT ? OFFSET ?",
+            params + [per_page, (page - 1) * per_page],
+        ).fetchall()
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["search_ms"] += (time.perf_counter() - start) * 1000
+        return {"total": total, "page": page, "per_page": per_page, "results": [dict(row) for row in rows]}
+
+    def backfill(self, load_sessions):
+        """
+        Indexa una sola vez las sesiones guardadas antes de que existiera el índice.
+
+        `load_sessions()` produce (session_id, mensajes, ts); se consume en el
+        hilo de indexación para no demorar el arranque.
+        """
+        if self.get_meta("backfilled"):
+            return
+
+        def run():
+            count = 0
+            for session_id, messages, ts in load_sessions():
+                self._safe_index(session_id, messages, ts)
+                count += 1
+            self.set_meta("backfilled", count)
+            print(f"OK: Índice de búsqueda de conversaciones construido ({count} sesiones)")
+
+        if self._executor is not None:
+            self._executor.submit(run)
+        else:
+            run()
+
+    def get_meta(self, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def drain(self):
+        """Espera a que termine la indexación pendiente (pruebas y cierre)"""
+        if self._executor is not None:
+            self._executor.submit(lambda: None).result()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_search_ms"] = round(stats.pop("search_ms") / stats["searches"], 2) if stats["searches"] else 0
+        return stats
+
+
+__all__ = ['ConversationSearchIndex', 'build_match_query', 'session_channel']
@@ -0,0 +1,304 @@
+# date_ranges.py
+"""
+Interpretación determinista de fechas y rangos de fechas en español.
+
+Convierte expresiones como "del 15 al 17 de diciembre", "15/12/2025 al
+17/12/2025", "este fin de semana", "el próximo viernes", "mañana por 2 noches"
+o "el puente de noviembre" en fechas de entrada y salida, sin llamar al LLM.
+Los puentes y la Semana Santa se calculan con el calendario de festivos de
+Colombia (Ley Emiliani). Todas las funciones reciben `today` para poder
+probarlas y medirlas con fechas fijas.
+"""
+
+import re
+import unicodedata
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+MESES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6,
+    'julio': 7, 'agosto': 8, 'septiembre': 9, 'setiembre': 9, 'octubre': 10,
+    'noviembre': 11, 'diciembre': 12,
+    'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6, 'jul': 7,
+    'ago': 8, 'sept': 9, 'sep': 9, 'set': 9, 'oct': 10, 'nov': 11, 'dic': 12,
+}
+DIAS_SEMANA = {'lunes': 0, 'martes': 1, 'miercoles': 2, 'jueves': 3, 'viernes': 4, 'sabado': 5, 'domingo': 6}
+NUMEROS = {'un': 1, 'una': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5, 'seis': 6, 'siete': 7}
+
+# Abreviaturas que también son palabras ("vista al mar", "un set de toallas"): solo con punto o seguidas del año
+_AMBIGUOUS_MONTHS = ('mar', 'sep', 'set')
+_MES = "(" + "|".join(
+    name + r"(?=\.|,?\s+(?:de\s+|del\s+)?\d{4}\b)" if name in _AMBIGUOUS_MONTHS else name
+    for name in sorted(MESES, key=len, reverse=True)
+) + r")\.?"
+_ANIO = r"(?:,?\s+(?:de\s+|del\s+)?(\d{4}))?"
+
+# Rango con el mes al final: "del 15 al 17 de diciembre", "15-17 dic", "entre el 15 y el 17 de diciembre"
+_SHARED_MONTH_RANGE = re.compile(
+    r"\b(\d{1,2})\s*(?:al|a|hasta(?:\s+el)?|-|y(?:\s+el)?)\s*(\d{1,2})\s+(?:de\s+)?" + _MES + _ANIO + r"\b"
+)
+# Rango sin mes ("del 15 al 17"): solo con preposición inicial para no confundirlo con cantidades
+_BARE_RANGE = re.compile(
+    r"\b(?:del|desde\s+el|entre\s+el)\s+(\d{1,2})\s+(?:al|hasta\s+el|y\s+el)\s+(\d{1,2})\b(?!\s*(?:[/.-]\d|personas|huesped|noches))"
+)
+# Día final suelto después de una fecha: "15 de diciembre al 20"
+_TRAILING_DAY = re.compile(
+    r"^\s*(?:al|a|hasta(?:\s+el)?|-)\s+(\d{1,2})\b(?!\s*(?:[/.-]\d|(?:de\s+)?" + _MES + r"|personas|huesped|noches))"
+)
+_DATE_PATTERNS = (
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("dmy", re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b")),
+    ("texto", re.compile(r"\b(\d{1,2})\s+(?:de\s+)?" + _MES + _ANIO + r"\b")),
+    ("texto_mdy", re.compile(r"\b" + _MES + r"\s+(\d{1,2})" + _ANIO + r"\b")),
+    ("dm", re.compile(r"\b(\d{1,2})/(\d{1,2})\b(?![/.-]\d)")),
+    ("relativo", re.compile(r"\b(pasado\s+manana|manana|hoy)\b")),
+    ("dia_semana", re.compile(
+        r"\b(?:(?:el|este|esta)\s+)?(proximo\s+|siguiente\s+)?(" + "|".join(DIAS_SEMANA) +
+        r")(?:\s+(?:que\s+viene|entrante))?\b(?!\s+\d)"
+    )),
+)
+_NIGHTS = re.compile(r"\b(\d{1,2}|" + "|".join(NUMEROS) + r")\s+noches?\b")
+_WEEKEND = re.compile(r"\b(proximo\s+|siguiente\s+)?(?:fin\s+de\s+semana|finde)\b")
+_PUENTE = re.compile(r"\bpuente(?:\s+festivo)?(?:\s+de\s+" + _MES + r")?")
+_SEMANA_SANTA = re.compile(r"\bsemana\s+santa\b")
+
+
+class DateRange(NamedTuple):
+    """Fechas de una estadía; `end` es la fecha de salida o None si solo se mencionó un día"""
+    start: date
+    end: Optional[date]
+    kind: str
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes, para que "Sábado" y "sabado" coincidan"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _easter(year: int) -> date:
+    """Domingo de Pascua (algoritmo de Meeus/Jones/Butcher)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def _next_monday(day: date) -> date:
+    return day + timedelta(days=(7 - day.weekday()) % 7)
+
+
+@lru_cache(maxsize=16)
+def colombian_holidays(year: int) -> dict:
+    """Festivos de Colombia del año: fecha -> nombre"""
+    easter = _easter(year)
+    holidays = {
+        date(year, 1, 1): "Año Nuevo",
+        date(year, 5, 1): "Día del Trabajo",
+        date(year, 7, 20): "Día de la Independencia",
+        date(year, 8, 7): "Batalla de Boyacá",
+        date(year, 12, 8): "Inmaculada Concepción",
+        date(year, 12, 25): "Navidad",
+        easter - timedelta(days=3): "Jueves Santo",
+        easter - timedelta(days=2): "Viernes Santo",
+        # Ley Emiliani: estos festivos se trasladan al lunes siguiente
+        _next_monday(date(year, 1, 6)): "Reyes Magos",
+        _next_monday(date(year, 3, 19)): "San José",
+        _next_monday(date(year, 6, 29)): "San Pedro y San Pablo",
+        _next_monday(date(year, 8, 15)): "Asunción de la Virgen",
+        _next_monday(date(year, 10, 12)): "Día de la Raza",
+        _next_monday(date(year, 11, 1)): "Todos los Santos",
+        _next_monday(date(year, 11, 11)): "Independencia de Cartagena",
+        easter + timedelta(days=43): "Ascensión del Señor",
+        easter + timedelta(days=64): "Corpus Christi",
+        easter + timedelta(days=71): "Sagrado Corazón",
+    }
+    return dict(sorted(holidays.items()))
+
+
+def is_holiday(day: date) -> bool:
+    return day in colombian_holidays(day.year)
+
+
+def _is_day_off(day: date) -> bool:
+    return day.weekday() >= 5 or is_holiday(day)
+
+
+def _stay_for_block(day: date, today: date) -> tuple:
+    """Estadía que cubre el bloque de días no laborables que contiene `day`: llegada la víspera, salida el último día"""
+    first = last = day
+    while _is_day_off(first - timedelta(days=1)):
+        first -= timedelta(days=1)
+    while _is_day_off(last + timedelta(days=1)):
+        last += timedelta(days=1)
+    return max(first - timedelta(days=1), today), last, (last - first).days + 1
+
+
+def _year_for(day: int, month: int, reference: date) -> date:
+    """Primera fecha con ese día y mes a partir de la referencia"""
+    candidate = date(reference.year, month, day)
+    return candidate if candidate >= reference else date(reference.year + 1, month, day)
+
+
+def _resolve(kind: str, groups: tuple, reference: date, today: date) -> Optional[date]:
+    if kind == "iso":
+        return date(int(groups[0]), int(groups[1]), int(groups[2]))
+    if kind in ("dmy", "dm", "texto", "texto_mdy"):
+        if kind == "texto_mdy":
+            month, day, year = MESES[groups[0]], int(groups[1]), groups[2]
+        elif kind == "texto":
+            day, month, year = int(groups[0]), MESES[groups[1]], groups[2]
+        else:
+            day, month = int(groups[0]), int(groups[1])
+            year = groups[2] if kind == "dmy" else None
+        if year:
+            year = int(year)
+            return date(year + 2000 if year < 100 else year, month, day)
+        return _year_for(day, month, reference)
+    if kind == "relativo":
+        offsets = {"hoy": 0, "manana": 1}
+        return today + timedelta(days=offsets.get(groups[0], 2))
+    if kind == "dia_semana":
+        weekday = DIAS_SEMANA[groups[1]]
+        return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    return None
+
+
+def _find_dates(text: str) -> list:
+    """Menciones de fechas (inicio, fin, tipo, grupos) en orden de aparición, sin solapamientos"""
+    found = []
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if kind == "relativo" and match.group(1) == "manana" and text[max(0, match.start() - 3):match.start()] == "la ":
+                continue  # "en la mañana" es una hora, no una fecha
+            if not any(match.start() < end and start < match.end() for start, end, _, _ in found):
+                found.append((match.start(), match.end(), kind, match.groups()))
+    if len(found) > 1:
+        # "hoy quiero reservar del 15/12 al 17/12": "hoy" no es parte de las fechas
+        found = [item for item in found if item[3] != ("hoy",)]
+    return sorted(found)
+
+
+def _nights(text: str) -> Optional[int]:
+    match = _NIGHTS.search(text)
+    if not match:
+        return None
+    value = match.group(1)
+    return int(value) if value.isdigit() else NUMEROS[value]
+
+
+def parse_date(text: str, today: date = None) -> Optional[date]:
+    """Primera fecha mencionada en el texto, o None. No valida si ya pasó"""
+    today = today or date.today()
+    norm = normalize(text)
+    for _, _, kind, groups in _find_dates(norm):
+        try:
+            return _resolve(kind, groups, today, today)
+        except (ValueError, KeyError):
+            continue
+    return None
+
+
+def parse_date_range(text: str, today: date = None) -> Optional[DateRange]:
+    """
+    Rango de fechas de una estadía mencionado en el texto, o None.
+
+    Las fechas explícitas tienen prioridad sobre "fin de semana", "puente" y
+    "Semana Santa". Si solo hay una fecha, la salida se toma de "al 20" o de
+    "por N noches"; si no aparece, `end` queda en None.
+    """
+    today = today or date.today()
+    norm = normalize(text)
+
+    try:
+        match = _SHARED_MONTH_RANGE.search(norm)
+        if match:
+            month = MESES[match.group(3)]
+            start_day, end_day = int(match.group(1)), int(match.group(2))
+            if end_day < start_day:
+                # "del 29 al 2 de enero": el mes es el de la salida y la llegada cae en el mes anterior
+                if match.group(4):
+                    end = date(int(match.group(4)), month, end_day)
+                else:
+                    end = _year_for(end_day, month, today)
+                start = (end.replace(day=1) - timedelta(days=1)).replace(day=start_day)
+                return DateRange(start, end, "fechas")
+            if match.group(4):
+                start = date(int(match.group(4)), month, start_day)
+            else:
+                start = _year_for(start_day, month, today)
+            return DateRange(start, date(start.year, month, end_day), "fechas")
+
+        match = _BARE_RANGE.search(norm)
+        if match:
+            start_day, end_day = int(match.group(1)), int(match.group(2))
+            month_start = date(today.year, today.month, 1) if start_day >= today.day else \
+                (date(today.year, today.month, 28) + timedelta(days=4)).replace(day=1)
+            start = month_start.replace(day=start_day)
+            end = start.replace(day=end_day) if end_day > start_day else \
+                (start.replace(day=28) + timedelta(days=4)).replace(day=end_day)
+            return DateRange(start, end, "fechas")
+    except ValueError:
+        pass
+
+    dates = []
+    for start_pos, end_pos, kind, groups in _find_dates(norm):
+        try:
+            dates.append((end_pos, _resolve(kind, groups, dates[-1][1] if dates else today, today)))
+        except (ValueError, KeyError):
+            continue
+    if len(dates) >= 2:
+        return DateRange(dates[0][1], dates[1][1], "fechas")
+    if dates:
+        end_pos, start = dates[0]
+        trailing = _TRAILING_DAY.match(norm[end_pos:])
+        if trailing:
+            try:
+                end_day = int(trailing.group(1))
+                end = start.replace(day=end_day) if end_day > start.day else \
+                    (start.replace(day=28) + timedelta(days=4)).replace(day=end_day)
+                return DateRange(start, end, "fechas")
+            except ValueError:
+                pass
+        nights = _nights(norm)
+        return DateRange(start, start + timedelta(days=nights) if nights else None, "fecha")
+
+    if _SEMANA_SANTA.search(norm):
+        thursday = _easter(today.year) - timedelta(days=3)
+        if thursday + timedelta(days=3) < today:
+            thursday = _easter(today.year + 1) - timedelta(days=3)
+        start, end, _ = _stay_for_block(thursday, today)
+        return DateRange(start, end, "semana_santa")
+
+    match = _PUENTE.search(norm)
+    if match:
+        month = MESES.get(match.group(1)) if match.group(1) else None
+        for year in (today.year, today.year + 1):
+            for holiday in colombian_holidays(year):
+                if holiday < today or (month and holiday.month != month):
+                    continue
+                start, end, length = _stay_for_block(holiday, today)
+                if length >= 3:
+                    return DateRange(start, end, "puente")
+        return None
+
+    match = _WEEKEND.search(norm)
+    if match:
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if match.group(1) and today.weekday() in (4, 5):
+            saturday += timedelta(days=7)
+        start, end, _ = _stay_for_block(saturday, today)
+        return DateRange(start, end, "fin_de_semana")
+
+    return None
+
+
+__all__ = ['DateRange', 'parse_date', 'parse_date_range', 'colombian_holidays', 'is_holiday', 'normalize']
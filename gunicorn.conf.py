@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+"""
+Configuración de Gunicorn.
+
+Las tareas de arranque que tocan el directorio de memoria (migración y el
+hilo de retención que archiva sesiones) corren aquí, una vez cargada la
+aplicación en el worker, y no al importar agente: los tests y los scripts
+importan el módulo sin querer migrar ni archivar nada.
+"""
+
+
+def post_worker_init(worker):
+    import agente
+    agente.init_memory_storage()
+    agente.start_memory_retention()
@@ -0,0 +1,141 @@
+# lazy_session.py
+"""
+Memoria de sesión que se carga solo cuando un paso del turno la necesita.
+
+Los turnos de menú, las respuestas de disponibilidad y los pasos de la
+reserva no leen el historial: solo agregan el intercambio. Con
+LazySessionMemory esos turnos no abren el registro de la sesión; los
+mensajes quedan en un búfer y al cerrar el turno se entregan al guardado
+diferido como PendingTurns, que se anexan al registro sin reproducirlo.
+La memoria completa se carga (desde la caché, lo pendiente o el disco) la
+primera vez que se pide `memory`, por ejemplo para el agente, y el búfer se
+aplica sobre ella. Un turno que no cambió nada no escribe.
+"""
+
+import threading
+
+
+class PendingTurns:
+    """Mensajes nuevos de una sesión no cargada, pendientes de anexar a su registro"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def merged(self, newer: "PendingTurns") -> "PendingTurns":
+        return PendingTurns(self.messages + newer.messages)
+
+
+def combine_pending(current, newer):
+    """
+    Junta dos guardados pendientes de la misma sesión (para WriteBehindPersister).
+
+    Los turnos nuevos se suman a lo pendiente, sea otro PendingTurns o una
+    memoria completa; una memoria completa más nueva reemplaza lo anterior.
+    """
+    if not isinstance(newer, PendingTurns):
+        return newer
+    if isinstance(current, PendingTurns):
+        return current.merged(newer)
+    for message in newer.messages:
+        current.chat_memory.add_message(message)
+    return current
+
+
+def _fingerprint(memory):
+    messages = memory.chat_memory.messages
+    return len(messages), getattr(memory, "summary", None), messages[-1].content if messages else None
+
+
+class LazySessionMemory:
+    """Acceso a la memoria de una sesión durante un turno, cargándola solo si hace falta"""
+
+    _stats = {"turns": 0, "hydrated": 0, "deferred_turns": 0, "unchanged": 0}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, session_id: str, cache, loader, persister, has_history):
+        # loader(session_id) -> memoria; has_history(session_id) -> True/False, o None si no se sabe sin cargar
+        self.session_id = session_id
+        self.cache = cache
+        self.loader = loader
+        self.persister = persister
+        self.has_history = has_history
+        self._memory = None
+        self._fingerprint = None
+        self._buffer = []
+        self._count("turns")
+
+    @classmethod
+    def _count(cls, key: str):
+        with cls._stats_lock:
+            cls._stats[key] += 1
+
+    @property
+    def loaded(self) -> bool:
+        return self._memory is not None
+
+    @property
+    def memory(self):
+        """Memoria completa de la sesión; se carga la primera vez con los mensajes del búfer aplicados"""
+        if self._memory is None:
+            memory = self.cache.get_or_load(self.session_id, self.loader)
+            self._fingerprint = _fingerprint(memory)
+            for message in self._buffer:
+                memory.chat_memory.add_message(message)
+            self._buffer = []
+            self._memory = memory
+            self._count("hydrated")
+        return self._memory
+
+    def _memory_in_ram(self):
+        """La memoria si ya está en el proceso (cargada, en caché o pendiente de guardar), sin ir al disco"""
+        if self._memory is None:
+            pending = self.persister.pending(self.session_id)
+            if self.session_id not in self.cache and (pending is None or isinstance(pending, PendingTurns)):
+                return None
+        return self.memory
+
+    def is_new(self) -> bool:
+        """¿La sesión aún no tiene turnos? Se responde sin leer el registro cuando se puede"""
+        memory = self._memory_in_ram()
+        if memory is not None:
+            return not memory.chat_memory.messages
+        if self._buffer or self.persister.pending(self.session_id) is not None:
+            return False
+        known = self.has_history(self.session_id)
+        if known is None:
+            return not self.memory.chat_memory.messages
+        return not known
+
+    def add_messages(self, messages: list):
+        """Agrega mensajes a la sesión: a la memoria si ya está en el proceso, si no al búfer"""
+        memory = self._memory_in_ram()
+        if memory is None:
+            self._buffer.extend(messages)
+            return
+        for message in messages:
+            memory.chat_memory.add_message(message)
+
+    def commit(self):
+        """Cierra el turno: marca la memoria si cambió o entrega los mensajes del búfer al guardado diferido"""
+        if self._memory is not None:
+            if _fingerprint(self._memory) != self._fingerprint:
+                self.persister.mark_dirty(self.session_id, self._memory)
+                self._fingerprint = _fingerprint(self._memory)
+            else:
+                self._count("unchanged")
+        elif self._buffer:
+            self.persister.merge(self.session_id, PendingTurns(self._buffer))
+            self._buffer = []
+            self._count("deferred_turns")
+        else:
+            self._count("unchanged")
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        stats["hydration_rate"] = round(stats["hydrated"] / stats["turns"], 3) if stats["turns"] else 0
+        return stats
+
+
+__all__ = ['LazySessionMemory', 'PendingTurns', 'combine_pending']
@@ -0,0 +1,288 @@
+# llm_deadline.py
+"""
+Plazos por turno para llamadas al LLM, embeddings y herramientas.
+
+Cada turno de conversación recibe un deadline absoluto que se propaga por
+contextvars a todo el trabajo que se hace en su nombre. Las llamadas se
+ejecutan con un timeout por intento acotado por el tiempo restante, los
+reintentos que no alcanzan a terminar antes del deadline se omiten y, de forma
+opcional, una llamada que supera su p95 histórico lanza una copia de respaldo
+(hedging) y se usa la primera respuesta que llegue.
+
+Una llamada abandonada por timeout o una copia que pierde sigue ocupando su
+cupo del planificador LLM hasta que termina de verdad (el planificador deja su
+cupo en `_slot_lease`), y el pool nunca acepta más llamadas que hilos, así el
+trabajo abandonado no se acumula en cola ni supera el límite de concurrencia.
+"""
+
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+# Timeout de cada petición HTTP a OpenAI y reintentos internos del cliente
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "10"))
+OPENAI_CLIENT_MAX_RETRIES = int(os.getenv("OPENAI_CLIENT_MAX_RETRIES", "0"))
+
+# Muestras mínimas antes de usar el p95 de un punto de llamada para hedging
+_MIN_SAMPLES_FOR_HEDGE = 20
+
+# Momento (time.monotonic) en el que vence el turno actual; None = sin límite
+_deadline = contextvars.ContextVar("turn_deadline", default=None)
+# Cupo del planificador LLM que cubre las llamadas del contexto actual (lo fija LLMScheduler.slot)
+_slot_lease = contextvars.ContextVar("llm_slot_lease", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Se lanza cuando una llamada no termina dentro de su presupuesto de tiempo.
+
+    local=True indica que la llamada ni siquiera salió hacia el proveedor
+    (turno sin tiempo o pool lleno): es carga propia, no una falla de OpenAI.
+    """
+
+    def __init__(self, message: str = "", local: bool = False):
+        super().__init__(message)
+        self.local = local
+
+
+def openai_client_kwargs() -> dict:
+    """Parámetros de timeout para construir clientes OpenAI de LangChain"""
+    return {"timeout": OPENAI_REQUEST_TIMEOUT, "max_retries": OPENAI_CLIENT_MAX_RETRIES}
+
+
+@contextmanager
+def turn_deadline(seconds: float):
+    """Fija el deadline del turno; un deadline anidado nunca extiende al externo"""
+    new_deadline = time.monotonic() + max(0.0, float(seconds))
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(current, new_deadline)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def slot_lease(lease):
+    """
+    Asocia las llamadas del bloque al cupo del planificador que las cubre.
+
+    `lease` ofrece hold(future) (el cupo no se libera antes de que termine la
+    llamada) y try_extra() / release_extra_when_done(future) / release_extra()
+    para la copia de hedging, que necesita un cupo propio.
+    """
+    token = _slot_lease.set(lease)
+    try:
+        yield
+    finally:
+        _slot_lease.reset(token)
+
+
+def remaining():
+    """Segundos que le quedan al turno actual, o None si no hay deadline"""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return max(0.0, current - time.monotonic())
+
+
+def has_budget(min_seconds: float = 0.5) -> bool:
+    """Indica si queda tiempo suficiente para intentar otra llamada"""
+    left = remaining()
+    return left is None or left > min_seconds
+
+
+def _budget(timeout):
+    left = remaining()
+    if timeout is None:
+        return left
+    if left is None:
+        return timeout
+    return min(timeout, left)
+
+
+class _LatencyTracker:
+    """Ventana deslizante de latencias exitosas por punto de llamada"""
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, site: str, seconds: float):
+        with self._lock:
+            samples = self._samples.setdefault(site, deque(maxlen=self._window))
+            samples.append(seconds)
+
+    def p95(self, site: str):
+        with self._lock:
+            samples = self._samples.get(site)
+            if not samples or len(samples) < _MIN_SAMPLES_FOR_HEDGE:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def sites(self):
+        with self._lock:
+            return list(self._samples.keys())
+
+
+LLM_CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", "16"))
+_executor = ThreadPoolExecutor(max_workers=LLM_CALL_THREADS, thread_name_prefix="llm-call")
+# Llamadas en el pool (también las abandonadas): nunca más que hilos, así no se acumulan en cola
+_pool_slots = threading.BoundedSemaphore(LLM_CALL_THREADS)
+_latency = _LatencyTracker()
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0, "hedges_skipped": 0,
+    "skipped_retries": 0, "abandoned": 0, "pool_full": 0,
+}
+
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _submit(fn, args, kwargs, wait_for=None):
+    """Lanza fn en el pool; None si no se liberó un hilo en wait_for segundos (0 = sin esperar)"""
+    acquired = _pool_slots.acquire(blocking=False) if wait_for == 0 else _pool_slots.acquire(timeout=wait_for)
+    if not acquired:
+        _count("pool_full")
+        return None
+    # Cada ejecución necesita su propia copia del contexto (deadline, prioridad, cupo LLM)
+    ctx = contextvars.copy_context()
+    try:
+        future = _executor.submit(ctx.run, fn, *args, **kwargs)
+    except Exception:
+        _pool_slots.release()
+        raise
+    future.add_done_callback(lambda _: _pool_slots.release())
+    return future
+
+
+def _abandon(futures):
+    """Descarta las llamadas que siguen en curso; terminan en segundo plano con su cupo tomado"""
+    running = sum(1 for future in futures if not future.done())
+    if running:
+        _count("abandoned", running)
+
+
+def call_with_deadline(fn, *args, timeout: float = None, hedge: bool = False, site: str = None, **kwargs):
+    """
+    Ejecuta fn con un timeout por intento acotado por el deadline del turno.
+
+    Con hedge=True, si la llamada supera el p95 de su punto de llamada se lanza
+    una segunda copia y se devuelve la primera respuesta exitosa. Usar solo con
+    llamadas sin efectos secundarios; la copia solo se lanza si el planificador
+    tiene un cupo libre para ella. Una llamada abandonada por timeout termina
+    en segundo plano, sin liberar su cupo hasta entonces, y su resultado se
+    descarta.
+    """
+    budget = _budget(timeout)
+    if budget is not None and budget <= 0:
+        _count("timeouts")
+        raise DeadlineExceeded("Timeout: deadline del turno agotado antes de llamar al LLM", local=True)
+
+    _count("calls")
+    started = time.monotonic()
+    end = None if budget is None else started + budget
+    lease = _slot_lease.get()
+    first = _submit(fn, args, kwargs, wait_for=budget)
+    if first is None:
+        _count("timeouts")
+        raise DeadlineExceeded("Timeout: todos los hilos de llamadas LLM siguen ocupados", local=True)
+    if lease is not None:
+        lease.hold(first)
+    futures = [first]
+
+    hedge_after = _latency.p95(site) if (hedge and site) else None
+    if hedge_after is not None and (end is None or started + hedge_after < end):
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            _hedge(fn, args, kwargs, lease, futures)
+
+    pending = set(futures)
+    last_error = None
+    while pending:
+        wait_for = None if end is None else max(0.0, end - time.monotonic())
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        if not done:
+            _count("timeouts")
+            _abandon(futures)
+            raise DeadlineExceeded(f"Timeout: sin respuesta tras {time.monotonic() - started:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                if site:
+                    _latency.record(site, time.monotonic() - started)
+                if len(futures) > 1 and future is futures[1]:
+                    _count("hedge_wins")
+                _abandon(futures)
+                return future.result()
+            last_error = future.exception()
+    raise last_error
+
+
+def _hedge(fn, args, kwargs, lease, futures):
+    """Lanza la copia de respaldo con un cupo propio del planificador; sin cupo libre no hay copia"""
+    if lease is not None and not lease.try_extra():
+        _count("hedges_skipped")
+        return
+    future = _submit(fn, args, kwargs, wait_for=0)
+    if future is None:
+        if lease is not None:
+            lease.release_extra()
+        _count("hedges_skipped")
+        return
+    if lease is not None:
+        lease.release_extra_when_done(future)
+    futures.append(future)
+    _count("hedged")
+
+
+def backoff_sleep(attempt: int, base: float = 1.0, cap: float = 8.0, min_attempt: float = 1.0) -> bool:
+    """
+    Espera con backoff exponencial y jitter antes de reintentar.
+
+    Devuelve False sin esperar si después de la espera no quedaría al menos
+    min_attempt segundos para el siguiente intento.
+    """
+    delay = min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+    left = remaining()
+    if left is not None and left - delay < min_attempt:
+        _count("skipped_retries")
+        return False
+    time.sleep(delay)
+    return True
+
+
+def skip_retry():
+    """Registra un reintento omitido por falta de tiempo"""
+    _count("skipped_retries")
+
+
+def get_stats() -> dict:
+    """Estadísticas de timeouts y hedging para monitoreo"""
+    with _stats_lock:
+        stats = dict(_stats)
+    p95 = {}
+    for site in _latency.sites():
+        value = _latency.p95(site)
+        if value is not None:
+            p95[site] = round(value * 1000, 1)
+    stats["p95_ms"] = p95
+    stats["openai_request_timeout_seconds"] = OPENAI_REQUEST_TIMEOUT
+    return stats
+
+
+__all__ = [
+    'DeadlineExceeded', 'turn_deadline', 'remaining', 'has_budget',
+    'call_with_deadline', 'slot_lease', 'backoff_sleep', 'skip_retry', 'openai_client_kwargs', 'get_stats',
+]
@@ -0,0 +1,258 @@
+# llm_scheduler.py
+"""
+Control de admisión y planificación por prioridad para trabajo ligado al LLM.
+
+Limita cuántas llamadas a OpenAI se ejecutan a la vez en el proceso y, cuando
+hay cola, atiende primero a las clases más importantes: flujo de reserva,
+luego disponibilidad, luego preguntas frecuentes y por último temas fuera de
+contexto. Cada clase tiene un tiempo máximo de espera en cola; si se supera,
+la solicitud se descarta con SchedulerBusyError para responder "estamos ocupados".
+
+El cupo de un bloque slot() se devuelve cuando terminan el bloque y las
+llamadas que lanzó: una llamada abandonada por timeout sigue contando hasta
+que OpenAI responde, y la copia de hedging necesita un cupo libre propio.
+"""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from llm_deadline import remaining, slot_lease
+
+# Clases de prioridad (menor número = mayor prioridad)
+PRIORITY_RESERVA = 0
+PRIORITY_DISPONIBILIDAD = 1
+PRIORITY_FAQ = 2
+PRIORITY_OFF_TOPIC = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_RESERVA: "reserva",
+    PRIORITY_DISPONIBILIDAD: "disponibilidad",
+    PRIORITY_FAQ: "faq",
+    PRIORITY_OFF_TOPIC: "off_topic",
+}
+
+# Tiempo máximo en cola por clase (segundos)
+DEFAULT_QUEUE_TIMEOUTS = {
+    PRIORITY_RESERVA: 20.0,
+    PRIORITY_DISPONIBILIDAD: 10.0,
+    PRIORITY_FAQ: 5.0,
+    PRIORITY_OFF_TOPIC: 2.0,
+}
+
+# Prioridad del turno actual y profundidad de slots tomados en este contexto
+_current_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_FAQ)
+_held_depth = contextvars.ContextVar("llm_slot_depth", default=0)
+
+
+class SchedulerBusyError(Exception):
+    """Se lanza cuando una solicitud supera su tiempo máximo de espera en cola"""
+
+    def __init__(self, priority: int, waited: float):
+        self.priority = priority
+        self.waited = waited
+        super().__init__(
+            f"Sistema ocupado: solicitud '{PRIORITY_NAMES.get(priority, priority)}' "
+            f"descartada tras {waited:.1f}s en cola"
+        )
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class _SlotLease:
+    """Cupo tomado por un bloque slot(); se devuelve al terminar el bloque y sus llamadas en curso"""
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._holders = 1  # el propio bloque
+
+    def hold(self, future):
+        with self._lock:
+            self._holders += 1
+        future.add_done_callback(lambda _: self.close())
+
+    def close(self):
+        with self._lock:
+            self._holders -= 1
+            last = self._holders == 0
+        if last:
+            self._scheduler._release()
+
+    def try_extra(self) -> bool:
+        return self._scheduler._try_acquire()
+
+    def release_extra(self):
+        self._scheduler._release()
+
+    def release_extra_when_done(self, future):
+        future.add_done_callback(lambda _: self._scheduler._release())
+
+
+def without_slot(fn, *args, **kwargs):
+    """
+    Ejecuta fn sin el cupo LLM heredado del contexto: sus llamadas toman un cupo propio.
+
+    Para trabajo que corre en paralelo en nombre del mismo turno (varias
+    herramientas de un paso del agente); si heredaran el cupo del turno, cada
+    una llamaría a OpenAI a la vez sin pasar por el límite de concurrencia.
+    """
+    token = _held_depth.set(0)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _held_depth.reset(token)
+
+
+class LLMScheduler:
+    """Semáforo con cola de prioridad y plazos de espera por clase"""
+
+    def __init__(self, max_concurrency: int = 4, queue_timeouts: dict = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS)
+        if queue_timeouts:
+            self.queue_timeouts.update(queue_timeouts)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = []  # heap de (prioridad, secuencia, waiter)
+        self._counter = itertools.count()
+        self._stats = {
+            name: {"admitted": 0, "shed": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self._extra_slots = 0
+
+    @contextmanager
+    def priority(self, level: int):
+        """Define la clase de prioridad para todas las llamadas LLM del turno actual"""
+        token = _current_priority.set(level)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    def current_priority(self) -> int:
+        return _current_priority.get()
+
+    def _record(self, priority: int, waited: float, admitted: bool):
+        stats = self._stats[PRIORITY_NAMES.get(priority, "faq")]
+        if admitted:
+            stats["admitted"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        else:
+            stats["shed"] += 1
+
+    def _acquire(self, priority: int, timeout: float):
+        started = time.monotonic()
+        with self._lock:
+            # Admitir directamente si hay capacidad y nadie espera delante
+            if self._active < self.max_concurrency and not self._queue:
+                self._active += 1
+                self._record(priority, 0.0, True)
+                return
+            waiter = _Waiter()
+            heapq.heappush(self._queue, (priority, next(self._counter), waiter))
+
+        waiter.event.wait(timeout)
+        waited = time.monotonic() - started
+
+        with self._lock:
+            if waiter.granted:
+                self._record(priority, waited, True)
+                return
+            # No fue admitida a tiempo: sacarla de la cola
+            self._queue = [item for item in self._queue if item[2] is not waiter]
+            heapq.heapify(self._queue)
+            self._record(priority, waited, False)
+        raise SchedulerBusyError(priority, waited)
+
+    def _try_acquire(self) -> bool:
+        """Cupo adicional solo si hay capacidad libre y nadie en cola (copias de hedging)"""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._queue:
+                self._active += 1
+                self._extra_slots += 1
+                return True
+            return False
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+            while self._queue and self._active < self.max_concurrency:
+                _, _, waiter = heapq.heappop(self._queue)
+                waiter.granted = True
+                self._active += 1
+                waiter.event.set()
+
+    @contextmanager
+    def slot(self, priority: int = None, timeout: float = None):
+        """
+        Ocupa un cupo de concurrencia LLM durante el bloque.
+
+        Es reentrante dentro del mismo contexto: las llamadas anidadas (por
+        ejemplo, herramientas que invoca el agente) reutilizan el cupo del padre.
+        """
+        depth = _held_depth.get()
+        if depth > 0:
+            token = _held_depth.set(depth + 1)
+            try:
+                yield
+            finally:
+                _held_depth.reset(token)
+            return
+
+        if priority is None:
+            priority = _current_priority.get()
+        if timeout is None:
+            timeout = self.queue_timeouts.get(priority, DEFAULT_QUEUE_TIMEOUTS[PRIORITY_FAQ])
+        # No esperar en cola más allá del deadline del turno
+        left = remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+
+        self._acquire(priority, timeout)
+        lease = _SlotLease(self)
+        token = _held_depth.set(1)
+        try:
+            with slot_lease(lease):
+                yield
+        finally:
+            _held_depth.reset(token)
+            # Las llamadas abandonadas que siguen en curso retienen el cupo hasta terminar
+            lease.close()
+
+    def get_stats(self) -> dict:
+        """Estadísticas de admisión por clase para monitoreo"""
+        with self._lock:
+            by_class = {}
+            for name, stats in self._stats.items():
+                admitted = stats["admitted"]
+                by_class[name] = {
+                    "admitted": admitted,
+                    "shed": stats["shed"],
+                    "avg_wait_ms": round(stats["total_wait"] / admitted * 1000, 1) if admitted else 0.0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 1),
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "queued": len(self._queue),
+                "hedge_slots": self._extra_slots,
+                "classes": by_class,
+            }
+
+
+__all__ = [
+    'LLMScheduler', 'SchedulerBusyError', 'without_slot',
+    'PRIORITY_RESERVA', 'PRIORITY_DISPONIBILIDAD', 'PRIORITY_FAQ', 'PRIORITY_OFF_TOPIC',
+]
@@ -0,0 +1,197 @@
+# memory_manifest.py
+"""
+Índice de las sesiones guardadas en el directorio de memoria.
+
+Cada guardado actualiza la fila de su sesión (archivo, tamaño, fecha,
+número de mensajes y si se pudo leer), así el chequeo de salud y la limpieza
+de archivos corruptos consultan el índice en lugar de abrir y parsear todo
+el directorio al arrancar. El índice es un archivo SQLite en modo WAL dentro
+del mismo directorio, compartido por los workers del servidor.
+
+Con `key`, los ids se normalizan al registrar y al consultar (p. ej. con el
+mismo saneado que da nombre al registro de la sesión), así dos formas del
+mismo id no tienen filas separadas que apunten al mismo archivo.
+
+Las sesiones archivadas conservan su fila con el paquete y el miembro donde
+quedó el registro, para devolverlas al almacenamiento activo cuando el
+cliente vuelve a escribir.
+"""
+
+import sqlite3
+import threading
+
+
+class MemoryManifest:
+    """Tamaño, fecha, mensajes y validez de cada sesión guardada"""
+
+    def __init__(self, path: str, timeout: float = 5.0, key=None):
+        # key(session_id) -> clave de la fila; por defecto el id tal cual
+        self.path = path
+        self.timeout = timeout
+        self.key = key or (lambda session_id: session_id)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"updates": 0, "errors": 0}
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, "
+            "mtime REAL NOT NULL, messages INTEGER NOT NULL, valid INTEGER NOT NULL, error TEXT)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        for column, ddl in (("archived", "INTEGER NOT NULL DEFAULT 0"), ("bundle", "TEXT"), ("member", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {ddl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_mtime ON sessions (mtime)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_valid ON sessions (valid)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_archived_mtime ON sessions (archived, mtime)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo: el guardado diferido escribe desde su propio hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params=()):
+        try:
+            self._conn().execute(sql, params)
+            with self._lock:
+                self._stats["updates"] += 1
+        except sqlite3.Error as e:
+            print(f"WARNING:  No se pudo actualizar el índice de memoria: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def record(self, session_id: str, filename: str, size: int, mtime: float, messages: int,
+               valid: bool = True, error: str = None):
+        """Registra (o actualiza) la sesión como activa; se conserva la referencia a su último archivo"""
+        self._execute(
+            "INSERT INTO sessions (session_id, filename, size, mtime, messages, valid, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET filename = excluded.filename, size = excluded.size, "
+            "mtime = excluded.mtime, messages = excluded.messages, valid = excluded.valid, "
+            "error = excluded.error, archived = 0",
+            (self.key(session_id), filename, size, mtime, messages, 1 if valid else 0, error),
+        )
+
+    def mark_archived(self, session_id: str, bundle: str, member: str):
+        self._execute(
+            "UPDATE sessions SET archived = 1, bundle = ?, member = ? WHERE session_id = ?",
+            (bundle, member, self.key(session_id)),
+        )
+
+    def mark_restored(self, session_id: str):
+        self._execute("UPDATE sessions SET archived = 0 WHERE session_id = ?", (self.key(session_id),))
+
+    def idle(self, before: float, limit: int = 200) -> list:
+        """Sesiones activas y legibles sin cambios desde `before` (las más viejas primero)"""
+        rows = self._conn().execute(
+            "SELECT * FROM sessions WHERE archived = 0 AND valid = 1 AND mtime < ? ORDER BY mtime LIMIT ?",
+            (before, limit),
+        )
+        return [dict(row) for row in rows]
+
+    def active(self) -> list:
+        """Sesiones legibles del almacenamiento activo"""
+        return [dict(row) for row in self._conn().execute("SELECT * FROM sessions WHERE archived = 0 AND valid = 1")]
+
+    def mark_invalid(self, session_id: str, filename: str, error: str):
+        """Marca la sesión como ilegible; se crea la fila si aún no estaba indexada"""
+        self._execute(
+            "INSERT INTO sessions (session_id, filename, size, mtime, messages, valid, error) "
+            "VALUES (?, ?, 0, 0, 0, 0, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET valid = 0, error = excluded.error",
+            (self.key(session_id), filename, error),
+        )
+
+    def remove(self, session_id: str):
+        self._execute("DELETE FROM sessions WHERE session_id = ?", (self.key(session_id),))
+
+    def get(self, session_id: str):
+        row = self._conn().execute("SELECT * FROM sessions WHERE session_id = ?", (self.key(session_id),)).fetchone()
+        return dict(row) if row else None
+
+    def normalize_keys(self) -> int:
+        """
+        Pasa a su clave normalizada las filas guardadas con otra forma del id.
+
+        Si varias filas caen en la misma clave se conserva la más reciente.
+        Devuelve cuántas claves se corrigieron.
+        """
+        conn = self._conn()
+        fixed = 0
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            groups = {}
+            for row in conn.execute("SELECT * FROM sessions ORDER BY mtime"):
+                groups.setdefault(self.key(row["session_id"]), []).append(dict(row))
+            for key, rows in groups.items():
+                if len(rows) == 1 and rows[0]["session_id"] == key:
+                    continue
+                conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(row["session_id"],) for row in rows])
+                newest = dict(rows[-1], session_id=key)
+                conn.execute(
+                    f"INSERT INTO sessions ({', '.join(newest)}) VALUES ({', '.join('?' * len(newest))})",
+                    tuple(newest.values()),
+                )
+                fixed += 1
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"WARNING:  No se pudo normalizar el índice de memoria: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return 0
+        return fixed
+
+    def invalid(self) -> list:
+        """Sesiones activas marcadas como ilegibles"""
+        return [dict(row) for row in self._conn().execute("SELECT * FROM sessions WHERE valid = 0 AND archived = 0")]
+
+    def summary(self) -> dict:
+        """Totales del almacenamiento activo y del archivo sin recorrer los archivos"""
+        conn = self._conn()
+        total_files, total_bytes, total_messages, corrupted = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(messages), 0), "
+            "COALESCE(SUM(valid = 0), 0) FROM sessions WHERE archived = 0"
+        ).fetchone()
+        archived, archived_messages = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM sessions WHERE archived = 1"
+        ).fetchone()
+        oldest = conn.execute(
+            "SELECT filename FROM sessions WHERE valid = 1 AND archived = 0 ORDER BY mtime LIMIT 1"
+        ).fetchone()
+        newest = conn.execute(
+            "SELECT filename FROM sessions WHERE valid = 1 AND archived = 0 ORDER BY mtime DESC LIMIT 1"
+        ).fetchone()
+        return {
+            "total_files": total_files,
+            "total_bytes": total_bytes,
+            "total_messages": total_messages,
+            "corrupted_files": corrupted,
+            "archived_sessions": archived,
+            "archived_messages": archived_messages,
+            "oldest_file": oldest[0] if oldest else None,
+            "newest_file": newest[0] if newest else None,
+        }
+
+    def get_meta(self, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+__all__ = ['MemoryManifest']
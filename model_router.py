@@ -0,0 +1,159 @@
+# model_router.py
+"""
+Política central de modelos por punto de llamada.
+
+Cada punto de llamada (filtro de temas, parsing de reservas, parsing de
+disponibilidad, agente, empatía...) tiene una cadena de niveles de modelo, del
+más rápido al más capaz. La llamada se hace con el primer nivel y solo se
+escala al siguiente cuando la salida no pasa la validación del punto de
+llamada (JSON inválido, campos requeridos faltantes) o el modelo falla. Así la
+mayor parte del tráfico corre en el modelo más rápido que funciona, y se
+reporta latencia y tasa de escalamiento por punto de llamada.
+"""
+
+import threading
+import time
+
+from llm_deadline import DeadlineExceeded, has_budget
+from llm_scheduler import SchedulerBusyError
+
+
+class EscalationExhausted(Exception):
+    """Ningún nivel de la cadena produjo una salida válida"""
+
+    def __init__(self, site: str, result=None):
+        self.site = site
+        self.result = result
+        super().__init__(f"Ningún modelo produjo una salida válida para '{site}'")
+
+
+def parse_routes(spec: str) -> dict:
+    """
+    Convierte "filtro=fast,parse=fast>strong" en {"filtro": ["fast"], "parse": ["fast", "strong"]}.
+    """
+    routes = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        site, chain = item.split("=", 1)
+        tiers = [tier.strip() for tier in chain.split(">") if tier.strip()]
+        if site.strip() and tiers:
+            routes[site.strip()] = tiers
+    return routes
+
+
+class ModelRouter:
+    """Asigna niveles de modelo a cada punto de llamada y escala cuando la salida no es válida"""
+
+    def __init__(self, tiers: dict, routes: dict, factory=None, instances: dict = None, default_route=None):
+        # tiers: nivel -> nombre del modelo; instances: nivel -> instancia ya construida
+        self.tiers = dict(tiers)
+        self.routes = {site: list(chain) for site, chain in routes.items()}
+        self.factory = factory
+        self.instances = dict(instances or {})
+        self.default_route = list(default_route or [next(iter(self.tiers))])
+        self._models = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def chain(self, site: str) -> list:
+        """Niveles que se prueban, en orden, para el punto de llamada"""
+        return [tier for tier in self.routes.get(site, self.default_route) if tier in self.tiers]
+
+    def model_name(self, tier: str) -> str:
+        return self.tiers[tier]
+
+    def get_model(self, tier: str, temperature: float = 0):
+        """Instancia del modelo del nivel, creada una vez por temperatura"""
+        if tier in self.instances:
+            return self.instances[tier]
+        key = (tier, temperature)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self.factory(self.tiers[tier], temperature)
+            return self._models[key]
+
+    def _record(self, site: str, model_name: str, elapsed: float, escalated: bool = False):
+        with self._lock:
+            stats = self._stats.setdefault(site, {"calls": 0, "escalations": 0, "failures": 0, "by_model": {}})
+            model_stats = stats["by_model"].setdefault(model_name, {"calls": 0, "total_ms": 0.0})
+            model_stats["calls"] += 1
+            model_stats["total_ms"] += elapsed * 1000
+            if escalated:
+                stats["escalations"] += 1
+
+    def observe(self, site: str, model_name: str, elapsed: float):
+        """Registra una llamada cronometrada por fuera de run() (p. ej. la ejecución del agente)"""
+        with self._lock:
+            self._stats.setdefault(site, {"calls": 0, "escalations": 0, "failures": 0, "by_model": {}})["calls"] += 1
+        self._record(site, model_name, elapsed)
+
+    def _fail(self, site: str):
+        with self._lock:
+            self._stats[site]["failures"] += 1
+
+    def run(self, site: str, call, validate=None, temperature: float = 0):
+        """
+        Ejecuta call(modelo, nombre_modelo) con el primer nivel de la cadena del sitio.
+
+        Si validate(resultado) es falso o el modelo falla, se repite con el
+        siguiente nivel mientras quede tiempo en el turno. Devuelve el primer
+        resultado válido; si ninguno lo es, lanza EscalationExhausted con el
+        último resultado (o la última excepción del modelo).
+        """
+        chain = self.chain(site)
+        with self._lock:
+            self._stats.setdefault(site, {"calls": 0, "escalations": 0, "failures": 0, "by_model": {}})["calls"] += 1
+
+        result = None
+        for position, tier in enumerate(chain):
+            is_last = position == len(chain) - 1
+            model_name = self.tiers[tier]
+            start = time.monotonic()
+            try:
+                result = call(self.get_model(tier, temperature), model_name)
+            except (SchedulerBusyError, DeadlineExceeded):
+                self._record(site, model_name, time.monotonic() - start)
+                self._fail(site)
+                raise
+            except Exception as e:
+                can_escalate = not is_last and has_budget()
+                self._record(site, model_name, time.monotonic() - start, escalated=can_escalate)
+                if not can_escalate:
+                    self._fail(site)
+                    raise
+                print(f"[ROUTER] {site}: {model_name} falló ({e}), escalando")
+                continue
+
+            valid = validate is None or validate(result)
+            can_escalate = not valid and not is_last and has_budget()
+            self._record(site, model_name, time.monotonic() - start, escalated=can_escalate)
+            if valid:
+                return result
+            if not can_escalate:
+                break
+            print(f"[ROUTER] {site}: salida de {model_name} no válida, escalando")
+
+        self._fail(site)
+        raise EscalationExhausted(site, result)
+
+    def get_stats(self) -> dict:
+        """Latencia por modelo y tasa de escalamiento por punto de llamada"""
+        with self._lock:
+            report = {}
+            for site, stats in self._stats.items():
+                report[site] = {
+                    "route": [self.tiers[tier] for tier in self.chain(site)],
+                    "calls": stats["calls"],
+                    "escalations": stats["escalations"],
+                    "escalation_rate": round(stats["escalations"] / stats["calls"], 3) if stats["calls"] else 0,
+                    "failures": stats["failures"],
+                    "avg_ms": {
+                        model: round(data["total_ms"] / data["calls"], 1)
+                        for model, data in stats["by_model"].items() if data["calls"]
+                    },
+                }
+            return report
+
+
+__all__ = ['ModelRouter', 'EscalationExhausted', 'parse_routes']
@@ -0,0 +1,132 @@
+# parallel_agent.py
+"""
+Pasos del agente con varias herramientas ejecutadas en paralelo.
+
+El agente conversacional ReAct solo acepta una acción por paso, así que una
+pregunta compuesta ("¿cuánto cuesta el Polaris y qué actividades hay cerca?")
+necesita una llamada de razonamiento al LLM por cada herramienta. Aquí el
+parser acepta varios pares Action/Action Input en una misma respuesta y el
+executor ejecuta esas herramientas independientes a la vez en un pool de
+hilos, devolviendo todas las observaciones en un solo paso.
+"""
+
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+from langchain.agents import AgentExecutor
+from langchain.agents.conversational.output_parser import ConvoOutputParser
+from langchain.agents.conversational.prompt import FORMAT_INSTRUCTIONS
+from langchain.schema import AgentAction, AgentFinish
+from pydantic import PrivateAttr
+
+from llm_scheduler import without_slot
+
+# Formato del agente con la opción de pedir varias herramientas en un mismo paso
+MULTI_ACTION_FORMAT_INSTRUCTIONS = FORMAT_INSTRUCTIONS.replace(
+    "When you have a response",
+    "If the question needs several independent tools, write one Action / Action Input pair per tool, "
+    "one after another, before the Observation; they will run at the same time:\n\n"
+    "```\n"
+    "Thought: Do I need to use a tool? Yes\n"
+    "Action: first tool\n"
+    "Action Input: input for the first tool\n"
+    "Action: second tool\n"
+    "Action Input: input for the second tool\n"
+    "```\n\n"
+    "When you have a response",
+    1,
+)
+
+_ACTION_RE = re.compile(r"Action\s*:\s*(.*?)\s*\n+\s*Action\s*Input\s*:\s*(.*?)(?=\n+\s*Action\s*:|\Z)", re.DOTALL)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_TOOL_THREADS", "8")),
+    thread_name_prefix="agent-tool",
+)
+_stats_lock = threading.Lock()
+_stats = {"steps": 0, "parallel_steps": 0, "parallel_tool_calls": 0}
+
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+class MultiActionConvoOutputParser(ConvoOutputParser):
+    """Parser conversacional que devuelve una lista de acciones si el LLM propone varias"""
+
+    format_instructions: str = MULTI_ACTION_FORMAT_INSTRUCTIONS
+
+    def parse(self, text: str) -> Union[AgentAction, AgentFinish, list]:
+        if f"{self.ai_prefix}:" in text:
+            return super().parse(text)
+        matches = list(_ACTION_RE.finditer(text))
+        if len(matches) < 2:
+            return super().parse(text)
+
+        actions = []
+        seen = set()
+        for n, match in enumerate(matches):
+            tool = match.group(1).strip()
+            tool_input = match.group(2).strip().strip("`").strip().strip('"')
+            if (tool, tool_input) in seen:
+                continue
+            seen.add((tool, tool_input))
+            # El primer log conserva el razonamiento; cada acción aporta su propio bloque al scratchpad
+            log = text[:matches[1].start()] if n == 0 else match.group(0)
+            actions.append(AgentAction(tool, tool_input, log.rstrip() + "\n"))
+        return actions if len(actions) > 1 else actions[0]
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """AgentExecutor que ejecuta en paralelo las acciones propuestas en un mismo paso"""
+
+    _step_actions: list = PrivateAttr(default_factory=list)
+    _step_results: dict = PrivateAttr(default_factory=dict)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # El executor base entrega todas las acciones del paso antes de ejecutar la primera
+        self._step_actions = []
+        self._step_results = {}
+        _count("steps")
+        for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps,
+                                            run_manager):
+            if isinstance(item, AgentAction):
+                self._step_actions.append(item)
+            yield item
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        batch = self._step_actions
+        if len(batch) < 2 or not any(action is agent_action for action in batch):
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+        if not self._step_results:
+            _count("parallel_steps")
+            _count("parallel_tool_calls", len(batch))
+            futures = []
+            for index, action in enumerate(batch):
+                # Cada herramienta hereda el deadline del turno. La primera usa el cupo LLM del turno
+                # (que espera sin llamar al LLM); las demás piden el suyo, así el paso no supera el límite
+                ctx = contextvars.copy_context()
+                perform = super()._perform_agent_action
+                args = (name_to_tool_map, color_mapping, action, run_manager)
+                if index:
+                    args = (perform,) + args
+                    perform = without_slot
+                futures.append((action, _executor.submit(ctx.run, perform, *args)))
+            for action, future in futures:
+                self._step_results[id(action)] = future.result()
+        return self._step_results.pop(id(agent_action))
+
+
+def get_stats() -> dict:
+    """Estadísticas de pasos con herramientas en paralelo"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+__all__ = ['MultiActionConvoOutputParser', 'ParallelAgentExecutor', 'MULTI_ACTION_FORMAT_INSTRUCTIONS', 'get_stats']
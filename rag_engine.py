@@ -2,6 +2,7 @@
 
 import os
 from dotenv import load_dotenv
+from llm_deadline import openai_client_kwargs
 # Imports compatibles para eliminar deprecation warnings
 try:
     from langchain_community.document_loaders import TextLoader
@@ -41,11 +42,11 @@ os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 try:
     # Usar langchain_openai para evitar deprecation warnings
     from langchain_openai import OpenAI as OpenAI_New
-    llm = OpenAI_New(temperature=0)
+    llm = OpenAI_New(temperature=0, **openai_client_kwargs())
     print("OK LLM RAG inicializado (langchain_openai)")
 except ImportError:
     # Fallback al import original si langchain_openai no está disponible
-    llm = OpenAI(temperature=0)
+    llm = OpenAI(temperature=0, **openai_client_kwargs())
     print("OK LLM RAG inicializado (fallback)")
 except Exception as e:
     print(f"ERROR Error LLM RAG: {e}")
@@ -55,11 +56,11 @@ except Exception as e:
 try:
     # Usar langchain_openai para evitar deprecation warnings
     from langchain_openai import OpenAIEmbeddings as OpenAIEmbeddings_New
-    embedding_model = OpenAIEmbeddings_New()
+    embedding_model = OpenAIEmbeddings_New(**openai_client_kwargs())
     print("OK Embeddings RAG inicializados (langchain_openai)")
 except ImportError:
     # Fallback al import original si langchain_openai no está disponible
-    embedding_model = OpenAIEmbeddings()
+    embedding_model = OpenAIEmbeddings(**openai_client_kwargs())
     print("OK Embeddings RAG inicializados (fallback)")
 except Exception as e:
     print(f"ERROR Error embeddings RAG: {e}")
@@ -0,0 +1,75 @@
+# reservation_schemas.py
+"""
+Esquemas de salida estructurada para el parsing de reservas y disponibilidad.
+
+Con estos modelos el LLM responde por function calling con los campos ya
+tipados, en lugar de escribir "SOLO JSON" en texto libre que luego había que
+rescatar con expresiones regulares. Los valores por defecto son los mismos que
+el flujo de reservas ya usaba para los campos opcionales.
+"""
+
+from datetime import date
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+DOMOS = ("Antares", "Polaris", "Sirius", "Centaury")
+
+
+class ReservationDetails(BaseModel):
+    """Datos de una solicitud de reserva del Glamping Brillo de Luna"""
+
+    nombres_huespedes: List[str] = Field(
+        default_factory=list,
+        description="Nombres completos de todos los huéspedes, incluido quien reserva; pueden venir en varias líneas",
+    )
+    numero_acompanantes: Optional[int] = Field(
+        default=None,
+        description="Total de personas incluyendo al solicitante ('voy con 2 más' = 3, 'somos 4' = 4)",
+    )
+    domo: str = Field(default="N/A", description=f"Domo elegido: {', '.join(DOMOS)}")
+    fecha_entrada: str = Field(default="N/A", description="Fecha de entrada tal como la escribió el usuario, DD/MM/AAAA")
+    fecha_salida: str = Field(default="N/A", description="Fecha de salida tal como la escribió el usuario, DD/MM/AAAA")
+    servicio_elegido: str = Field(default="ninguno", description="Servicios adicionales: masajes, decoraciones, etc.")
+    adicciones: str = Field(default="ninguno", description="Adiciones especiales: mascotas, otro servicio, etc.")
+    numero_contacto: str = Field(default="N/A", description="Número de teléfono de contacto")
+    email_contacto: str = Field(default="N/A", description="Correo electrónico de contacto")
+    metodo_pago: str = Field(default="No especificado", description="Efectivo, transferencia, tarjeta, etc.")
+    comentarios_especiales: str = Field(default="Ninguno", description="Observaciones o solicitudes especiales")
+
+    @field_validator("nombres_huespedes", mode="before")
+    @classmethod
+    def _names_as_list(cls, value):
+        if isinstance(value, str):
+            return [name.strip() for name in value.split(",") if name.strip()]
+        return value or []
+
+    def missing_required(self) -> list:
+        """Campos obligatorios que el modelo no pudo extraer"""
+        missing = [] if self.nombres_huespedes else ["nombres_huespedes"]
+        for field in ("domo", "fecha_entrada", "fecha_salida"):
+            if not getattr(self, field) or getattr(self, field).strip().lower() in ("n/a", "na", ""):
+                missing.append(field)
+        return missing
+
+    def to_dict(self) -> dict:
+        """Diccionario con el formato que espera validate_and_process_reservation_data"""
+        data = self.model_dump()
+        data["numero_acompanantes"] = str(self.numero_acompanantes) if self.numero_acompanantes else "N/A"
+        return data
+
+
+class AvailabilityQuery(BaseModel):
+    """Parámetros de una consulta de disponibilidad"""
+
+    fechas_claras: bool = Field(description="False si el mensaje no permite determinar las fechas de la estadía")
+    fecha_inicio: Optional[date] = Field(default=None, description="Primera noche de la estadía")
+    fecha_fin: Optional[date] = Field(default=None, description="Fecha de salida")
+    personas: Optional[int] = Field(default=None, description="Número de huéspedes, si lo menciona")
+    domo_tipo: Optional[str] = Field(default=None, description=f"Domo preferido si lo menciona: {', '.join(DOMOS)}")
+
+    def is_complete(self) -> bool:
+        return not self.fechas_claras or (self.fecha_inicio is not None and self.fecha_fin is not None)
+
+
+__all__ = ['ReservationDetails', 'AvailabilityQuery', 'DOMOS']
@@ -0,0 +1,224 @@
+# semantic_recall.py
+"""
+Recuerdo semántico de largo plazo sobre los turnos pasados de cada usuario.
+
+Cada usuario tiene un índice local (texto de los turnos + matriz de embeddings)
+que se amplía de forma incremental cada vez que se guarda su memoria. Ante un
+mensaje nuevo se recuperan solo los k turnos pasados más parecidos, de modo que
+el prompt mantiene un tamaño constante sin importar cuánto tiempo lleve el
+usuario conversando con nosotros. Si los embeddings no están disponibles se usa
+una búsqueda léxica por palabras compartidas.
+"""
+
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# Los turnos más largos no son mensajes reales de usuario (p. ej. instrucciones de sistema)
+MAX_TURN_CHARS = 1000
+
+_WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+
+
+def _safe_id(user_id: str) -> str:
+    return "".join(c for c in user_id if c.isalnum() or c in ('-', '_', '.'))[:50]
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+
+class _UserIndex:
+    """Turnos indexados de un usuario, cargados desde disco bajo demanda"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []          # dicts con session, message_index, text, ts
+        self.vectors = None        # np.ndarray (n, dim) normalizado, o None
+        self.progress = {}         # session -> número de mensajes ya indexados
+
+
+class SemanticRecallIndex:
+    """Índice vectorial local por usuario, construido incrementalmente"""
+
+    def __init__(self, base_dir: str, embed_documents=None, embed_query=None, top_k: int = 3,
+                 min_score: float = 0.3, background: bool = True):
+        self.base_dir = base_dir
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.top_k = top_k
+        self.min_score = min_score
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recall-index") if background else None
+        self._stats = {"indexed_turns": 0, "searches": 0, "lexical_fallbacks": 0, "embedding_errors": 0}
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _paths(self, user_id: str):
+        base = os.path.join(self.base_dir, _safe_id(user_id))
+        return f"{base}.jsonl", f"{base}.npy"
+
+    def _get(self, user_id: str) -> _UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                return index
+            index = _UserIndex()
+            # Bloquear el índice antes de publicarlo para que nadie lo lea a medio cargar
+            index.lock.acquire()
+            self._indexes[user_id] = index
+
+        try:
+            entries_path, vectors_path = self._paths(user_id)
+            if os.path.exists(entries_path):
+                with open(entries_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            index.entries.append(json.loads(line))
+            if os.path.exists(vectors_path):
+                vectors = np.load(vectors_path)
+                if len(vectors) == len(index.entries):
+                    index.vectors = vectors
+                else:
+                    print(f"WARNING:  Índice de recuerdo desalineado para {user_id}, se usará búsqueda léxica")
+            for entry in index.entries:
+                session = entry.get("session", "")
+                index.progress[session] = max(index.progress.get(session, 0), entry["message_index"] + 2)
+        finally:
+            index.lock.release()
+        return index
+
+    @staticmethod
+    def _turns(messages, start: int):
+        """Pares (índice, texto) de turnos usuario→asistente a partir de start"""
+        turns = []
+        i = start
+        while i + 1 < len(messages):
+            human, ai = messages[i], messages[i + 1]
+            if getattr(human, "type", "") == "human" and getattr(ai, "type", "") == "ai":
+                if len(str(human.content)) <= MAX_TURN_CHARS:
+                    turns.append((i, f"Usuario: {human.content}\nMaría: {ai.content}"))
+                i += 2
+            else:
+                i += 1
+        return turns
+
+    def _index_messages(self, user_id: str, session_id: str, messages: list):
+        index = self._get(user_id)
+        with index.lock:
+            start = index.progress.get(session_id, 0)
+            if start > len(messages):
+                # La sesión se reinició: indexar desde el principio
+                start = 0
+            turns = self._turns(messages, start)
+            # Un mensaje de usuario sin respuesta todavía se indexa en el próximo guardado
+            last_is_ai = bool(messages) and getattr(messages[-1], "type", "") == "ai"
+            index.progress[session_id] = len(messages) if last_is_ai else max(start, len(messages) - 1)
+            if not turns:
+                return
+
+            vectors = None
+            if self.embed_documents is not None and (index.vectors is not None or not index.entries):
+                try:
+                    vectors = np.asarray(self.embed_documents([text for _, text in turns]), dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+                except Exception as e:
+                    self._stats["embedding_errors"] += 1
+                    print(f"WARNING:  No se pudieron generar embeddings de recuerdo para {user_id}: {e}")
+
+            now = datetime.utcnow().isoformat()
+            new_entries = [{"session": session_id, "message_index": i, "text": text, "ts": now} for i, text in turns]
+            entries_path, vectors_path = self._paths(user_id)
+            with open(entries_path, 'a', encoding='utf-8') as f:
+                for entry in new_entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            index.entries.extend(new_entries)
+
+            if vectors is not None:
+                index.vectors = vectors if index.vectors is None else np.vstack([index.vectors, vectors])
+                np.save(vectors_path, index.vectors)
+            elif index.vectors is not None:
+                # Sin embeddings para estos turnos el índice vectorial deja de estar alineado
+                index.vectors = None
+                try:
+                    os.remove(vectors_path)
+                except OSError:
+                    pass
+            self._stats["indexed_turns"] += len(new_entries)
+
+    def add_messages(self, user_id: str, session_id: str, messages: list):
+        """Indexa los turnos nuevos de la sesión; en segundo plano si está habilitado"""
+        messages = list(messages)
+        if self._executor is not None:
+            self._executor.submit(self._safe_index, user_id, session_id, messages)
+        else:
+            self._safe_index(user_id, session_id, messages)
+
+    def _safe_index(self, user_id, session_id, messages):
+        try:
+            self._index_messages(user_id, session_id, messages)
+        except Exception as e:
+            print(f"ERROR: Error indexando recuerdo para {user_id}: {e}")
+
+    def search(self, user_id: str, query: str, session_id: str = None, before_message_index: int = None,
+               k: int = None) -> list:
+        """
+        Devuelve los textos de los k turnos pasados más relevantes para query.
+
+        Se excluyen los turnos de la sesión actual desde before_message_index,
+        porque ya van literales en la ventana reciente de la memoria.
+        """
+        k = k or self.top_k
+        if not query:
+            return []
+        index = self._get(user_id)
+        with index.lock:
+            candidates = [
+                i for i, entry in enumerate(index.entries)
+                if not (session_id is not None and before_message_index is not None
+                        and entry.get("session") == session_id and entry["message_index"] >= before_message_index)
+            ]
+            texts = [index.entries[i]["text"] for i in candidates]
+            vectors = index.vectors[candidates] if index.vectors is not None and candidates else None
+        if not candidates:
+            return []
+        self._stats["searches"] += 1
+
+        # El embedding de la consulta se calcula sin bloquear la indexación en segundo plano
+        scores = None
+        min_score = self.min_score
+        if vectors is not None and self.embed_query is not None:
+            try:
+                query_vector = np.asarray(self.embed_query(query), dtype=np.float32)
+                query_vector /= np.linalg.norm(query_vector) + 1e-9
+                scores = vectors @ query_vector
+            except Exception as e:
+                self._stats["embedding_errors"] += 1
+                print(f"WARNING:  Recuerdo semántico sin embeddings, usando búsqueda léxica: {e}")
+
+        if scores is None:
+            self._stats["lexical_fallbacks"] += 1
+            query_words = _words(query)
+            scores = np.array([
+                len(query_words & _words(text)) / (len(query_words) or 1) for text in texts
+            ], dtype=np.float32)
+            min_score = 0.2
+
+        order = np.argsort(-scores)[:k]
+        return [texts[j] for j in order if scores[j] >= min_score]
+
+    def get_stats(self) -> dict:
+        """Estadísticas del índice de recuerdo para monitoreo"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["loaded_users"] = len(self._indexes)
+        return stats
+
+
+__all__ = ['SemanticRecallIndex', 'MAX_TURN_CHARS']
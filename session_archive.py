@@ -0,0 +1,93 @@
+# session_archive.py
+"""
+Archivo comprimido de las sesiones inactivas.
+
+Cada pasada de retención escribe un paquete zip nuevo con los registros de
+las sesiones que llevan demasiado tiempo sin mensajes. El paquete se escribe
+en un archivo temporal y se mueve en su lugar antes de borrar los registros
+del almacenamiento activo, así una caída a mitad de camino no pierde
+historial. Los paquetes zip permiten leer una sola sesión sin descomprimir
+el resto, que es lo que se necesita cuando un cliente archivado vuelve a
+escribir.
+"""
+
+import os
+import threading
+import time
+import zipfile
+
+
+class SessionArchive:
+    """Paquetes zip con los registros de sesiones inactivas"""
+
+    def __init__(self, directory: str, compresslevel: int = 9):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._stats = {"bundles": 0, "archived": 0, "archived_bytes": 0, "bundle_bytes": 0, "restored": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _bundle_path(self, bundle: str) -> str:
+        # Solo nombres generados aquí: nada de rutas relativas
+        return os.path.join(self.directory, os.path.basename(bundle))
+
+    def write_bundle(self, files: dict) -> str:
+        """
+        Empaqueta {miembro: ruta} en un zip nuevo y devuelve su nombre.
+
+        Los archivos originales no se tocan; el llamador los borra cuando el
+        paquete ya está en su lugar.
+        """
+        with self._lock:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+            bundle, suffix = f"{stamp}.zip", 0
+            while os.path.exists(self._bundle_path(bundle)):
+                suffix += 1
+                bundle = f"{stamp}_{suffix}.zip"
+            path = self._bundle_path(bundle)
+            temp_path = f"{path}.tmp"
+            raw_bytes = 0
+            try:
+                with zipfile.ZipFile(
+                    temp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=self.compresslevel, strict_timestamps=False
+                ) as zf:
+                    for member, file_path in files.items():
+                        zf.write(file_path, member)
+                        raw_bytes += os.path.getsize(file_path)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self._stats["bundles"] += 1
+            self._stats["archived"] += len(files)
+            self._stats["archived_bytes"] += raw_bytes
+            self._stats["bundle_bytes"] += os.path.getsize(path)
+        return bundle
+
+    def read(self, bundle: str, member: str) -> bytes:
+        with zipfile.ZipFile(self._bundle_path(bundle)) as zf:
+            return zf.read(member)
+
+    def restore(self, bundle: str, member: str, dest_path: str):
+        """Devuelve un registro archivado al almacenamiento activo (escritura atómica)"""
+        data = self.read(bundle, member)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        temp_path = f"{dest_path}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, dest_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self._stats["restored"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["ratio"] = round(stats["archived_bytes"] / stats["bundle_bytes"], 2) if stats["bundle_bytes"] else 0
+        return stats
+
+
+__all__ = ['SessionArchive']
@@ -0,0 +1,127 @@
+# session_cache.py
+"""
+Caché acotada de sesiones en memoria con desalojo LRU y por inactividad.
+
+Reemplaza los diccionarios de módulo que nunca olvidaban una sesión: cada
+número de WhatsApp y cada session_id aleatorio de /chat quedaban en RAM
+mientras viviera el proceso. La caché guarda como máximo `max_entries`
+sesiones y desaloja las que llevan más de `idle_ttl` segundos sin uso. Antes
+de desalojar una sesión se llama a `on_evict` para escribir lo pendiente; la
+siguiente vez que escriba el usuario se vuelve a cargar desde el almacenamiento.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionCache:
+    """Sesiones recientes en orden de uso; la menos usada sale primero"""
+
+    def __init__(self, max_entries: int = 1000, idle_ttl: float = 6 * 3600, on_evict=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evicted_lru": 0, "evicted_idle": 0}
+
+    def _collect_evictions(self) -> list:
+        """Saca (con el lock tomado) las entradas inactivas y las que exceden la capacidad"""
+        evicted = []
+        now = self._clock()
+        while self._entries:
+            key, (value, last_used) = next(iter(self._entries.items()))
+            if self.idle_ttl and now - last_used > self.idle_ttl:
+                self._stats["evicted_idle"] += 1
+            elif len(self._entries) > self.max_entries:
+                self._stats["evicted_lru"] += 1
+            else:
+                break
+            del self._entries[key]
+            evicted.append((key, value))
+        return evicted
+
+    def _evict(self, evicted: list):
+        for key, value in evicted:
+            if self.on_evict:
+                try:
+                    self.on_evict(key, value)
+                except Exception as e:
+                    print(f"WARNING:  Error al desalojar sesión {key}: {e}")
+
+    def get_or_load(self, key: str, loader):
+        """Devuelve la sesión; si no está en caché (o expiró) la crea con loader(key)"""
+        with self._lock:
+            evicted = self._collect_evictions()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], self._clock())
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                value = entry[0]
+            else:
+                self._stats["misses"] += 1
+                value = None
+        self._evict(evicted)
+        if value is not None:
+            return value
+
+        value = loader(key)
+        with self._lock:
+            # Otro hilo pudo cargarla mientras tanto: gana la primera
+            entry = self._entries.get(key)
+            if entry is not None:
+                value = entry[0]
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            evicted = self._collect_evictions()
+        self._evict(evicted)
+        return value
+
+    def put(self, key: str, value):
+        """Guarda o reemplaza la sesión y la marca como la más reciente"""
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            evicted = self._collect_evictions()
+        self._evict(evicted)
+
+    def get(self, key: str, default=None):
+        """Consulta sin cargar ni cambiar el orden de uso"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else default
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def pop(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def evict_idle(self) -> int:
+        """Desaloja ya las sesiones inactivas; devuelve cuántas salieron"""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._evict(evicted)
+        return len(evicted)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0
+        return stats
+
+
+__all__ = ['SessionCache']
@@ -0,0 +1,427 @@
+# session_log.py
+"""
+Registro de solo anexado para la memoria de cada sesión.
+
+Cada sesión es un archivo JSONL. El primer registro guarda el resumen
+acumulado y cada mensaje ocupa una línea; en cada turno solo se agregan los
+mensajes nuevos (y el resumen si cambió), con una sola escritura al final del
+archivo. Así el costo de guardar un turno no depende de la longitud del
+historial.
+
+Recuperación ante caídas: una línea incompleta o inválida al final del
+archivo (escritura interrumpida) se descarta al leer y el archivo se trunca
+en el último registro válido. La compactación reescribe la sesión en un
+archivo temporal y lo mueve en su lugar de forma atómica.
+
+Formato 2: los mensajes se guardan sin el sobre de messages_to_dict
+({"r": rol, "c": contenido, "d": solo los campos no vacíos}) y, si la
+instantánea supera `compress_above` bytes, se escribe comprimida con zlib en
+un único registro "pack". Los registros del formato 1 (sobre completo) se
+siguen leyendo y pasan al formato 2 en la siguiente compactación.
+
+Los archivos se reparten en subdirectorios según el hash del id de sesión
+(`shard_chars` caracteres hexadecimales, 256 carpetas con 2), así ningún
+directorio crece con el número total de sesiones.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+FORMAT_VERSION = 2
+
+_ROLE_CODES = {"human": "h", "ai": "a", "system": "s", "tool": "t", "function": "f", "chat": "c"}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+_MSG_PREFIX = b'{"t":"msg",'
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _is_empty(value) -> bool:
+    return value is None or value is False or value == {} or value == []
+
+
+def encode_message(message: dict) -> dict:
+    """Forma compacta de un mensaje de messages_to_dict; los ya compactos quedan igual"""
+    if "r" in message or message.get("type") not in _ROLE_CODES:
+        return message
+    data = message.get("data")
+    if not isinstance(data, dict) or "content" not in data:
+        return message
+    compact = {"r": _ROLE_CODES[message["type"]], "c": data["content"]}
+    # El tipo se repite dentro de data y los campos vacíos son los valores por defecto del mensaje
+    extra = {key: value for key, value in data.items() if key not in ("content", "type") and not _is_empty(value)}
+    if extra:
+        compact["d"] = extra
+    return compact
+
+
+def decode_message(message: dict) -> dict:
+    """Devuelve el mensaje en la forma de messages_to_dict (acepta ambos formatos)"""
+    if "r" not in message:
+        return message
+    return {"type": _ROLE_NAMES[message["r"]], "data": {"content": message["c"], **message.get("d", {})}}
+
+
+def _pack(lines: str) -> str:
+    payload = base64.b64encode(zlib.compress(lines.encode("utf-8"), 6)).decode("ascii")
+    return _dumps({"t": "pack", "v": FORMAT_VERSION, "z": payload})
+
+
+def _unpack(record: dict) -> list:
+    return zlib.decompress(base64.b64decode(record["z"])).splitlines(keepends=True)
+
+
+class SessionLogStore:
+    """Memoria de sesiones en archivos JSONL de solo anexado"""
+
+    def __init__(self, directory: str, compact_after: int = 50, fsync: bool = False, compress_above: int = 0,
+                 shard_chars: int = 2):
+        # compact_after: registros obsoletos (resúmenes y mensajes reescritos) que disparan la compactación
+        # compress_above: tamaño desde el que la instantánea se comprime (0 = sin compresión)
+        self.directory = directory
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.compress_above = compress_above
+        self.shard_chars = shard_chars
+        self._known_dirs = set()
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._stats = {
+            "appends": 0, "records": 0, "bytes": 0, "compactions": 0, "compacted_bytes": 0,
+            "packed_snapshots": 0, "uncompressed_bytes": 0, "recovered": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def safe_id(session_id: str) -> str:
+        """Id saneado que da nombre al registro: ids distintos con el mismo saneado comparten archivo"""
+        # Sanitizar el id para evitar path traversal
+        return "".join(c for c in session_id if c.isalnum() or c in ('-', '_', '.'))[:50]
+
+    def path(self, session_id: str) -> str:
+        safe_id = self.safe_id(session_id)
+        if not self.shard_chars:
+            return os.path.join(self.directory, f"{safe_id}.jsonl")
+        shard = hashlib.sha1(safe_id.encode("utf-8")).hexdigest()[:self.shard_chars]
+        return os.path.join(self.directory, shard, f"{safe_id}.jsonl")
+
+    def flat_path(self, session_id: str) -> str:
+        """Ubicación del registro en el directorio plano anterior a la distribución por hash"""
+        return os.path.join(self.directory, os.path.basename(self.path(session_id)))
+
+    def is_shard_dir(self, name: str) -> bool:
+        return len(name) == self.shard_chars and all(c in "0123456789abcdef" for c in name)
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self.path(session_id))
+
+    def _write(self, path: str, data: bytes, mode: str):
+        parent = os.path.dirname(path)
+        if parent not in self._known_dirs:
+            os.makedirs(parent, exist_ok=True)
+            self._known_dirs.add(parent)
+        with open(path, mode) as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _remember(self, session_id: str, summary: str, summarized_count: int, count: int, last, dead: int,
+                  packed: int = 0, loose: int = 0):
+        # last se guarda en forma compacta; packed/loose: bytes de la instantánea comprimida y lo anexado después
+        self._sessions[self.safe_id(session_id)] = {
+            "count": count,
+            "last": last,
+            "summary": summary,
+            "summarized_count": summarized_count,
+            "dead": dead,
+            "packed": packed,
+            "loose": loose,
+        }
+
+    def _scan(self, session_id: str, keep: int = None, start: int = 0, stop: int = None):
+        """
+        Lee el registro de principio a fin sin cargarlo entero en memoria.
+
+        Solo se conservan los mensajes con índice en [start, stop) y, con
+        `keep`, solo los últimos `keep` de ellos. En esas lecturas parciales
+        las líneas de mensaje se guardan crudas y se decodifican al final.
+        """
+        path = self.path(session_id)
+        if not os.path.exists(path):
+            return None
+
+        scan = {"summary": "", "summarized_count": 0, "count": 0, "dead": 0, "packed": 0, "loose": 0, "valid_bytes": 0}
+        partial = keep is not None or start > 0 or stop is not None
+        window = {}
+
+        def add(item):
+            index = scan["count"]
+            scan["count"] += 1
+            if index >= start and (stop is None or index < stop):
+                window[index] = item
+                if keep is not None:
+                    window.pop(index - keep, None)
+
+        def apply(raw: bytes):
+            if partial and raw.startswith(_MSG_PREFIX):
+                # Los mensajes fuera de la ventana no se decodifican
+                add(raw)
+                return
+            record = json.loads(raw)
+            kind = record.get("t")
+            if kind == "msg":
+                add(record["m"])
+            elif kind == "set":
+                if record["i"] in window:
+                    window[record["i"]] = record["m"]
+                scan["dead"] += 1
+            elif kind == "meta":
+                scan["summary"] = record.get("summary") or ""
+                scan["summarized_count"] = int(record.get("summarized_count") or 0)
+                scan["dead"] += 1
+            elif kind == "pack":
+                for line in _unpack(record):
+                    apply(line)
+                scan["packed"] = len(raw)
+
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    apply(raw)
+                except (ValueError, KeyError, zlib.error):
+                    break
+                scan["valid_bytes"] += len(raw)
+                if raw.startswith(b'{"t":"pack"'):
+                    # Lo anexado se cuenta desde la última instantánea comprimida
+                    scan["loose"] = 0
+                else:
+                    scan["loose"] += len(raw)
+
+        scan["messages"] = [
+            encode_message(json.loads(item)["m"] if isinstance(item, bytes) else item) for item in window.values()
+        ]
+        scan["size"] = os.path.getsize(path)
+        return scan
+
+    def load(self, session_id: str):
+        """
+        Reconstruye la sesión reproduciendo el registro.
+
+        Devuelve {"summary", "summarized_count", "messages"} o None si la
+        sesión no tiene registro.
+        """
+        scan = self._scan(session_id)
+        if scan is None:
+            return None
+
+        if scan["valid_bytes"] < scan["size"]:
+            # Escritura interrumpida: se conserva hasta el último registro completo
+            print(f"WARNING:  Registro de sesión {session_id} con cola incompleta, recuperando {scan['count']} mensajes")
+            with open(self.path(session_id), "r+b") as f:
+                f.truncate(scan["valid_bytes"])
+            with self._lock:
+                self._stats["recovered"] += 1
+
+        messages = scan["messages"]
+        with self._lock:
+            self._remember(
+                session_id, scan["summary"], scan["summarized_count"], len(messages),
+                messages[-1] if messages else None, max(0, scan["dead"] - 1),
+                scan["packed"], scan["loose"],
+            )
+        return {
+            "summary": scan["summary"],
+            "summarized_count": scan["summarized_count"],
+            "messages": [decode_message(message) for message in messages],
+        }
+
+    def tail(self, session_id: str, n: int):
+        """
+        Últimos `n` mensajes de la sesión sin decodificar el resto del historial.
+
+        Devuelve {"summary", "summarized_count", "messages", "total"} o None si
+        la sesión no tiene registro. No modifica el archivo ni el estado.
+        """
+        scan = self._scan(session_id, keep=max(0, n))
+        if scan is None:
+            return None
+        return {
+            "summary": scan["summary"],
+            "summarized_count": scan["summarized_count"],
+            "messages": [decode_message(message) for message in scan["messages"]],
+            "total": scan["count"],
+        }
+
+    def read_range(self, session_id: str, start: int, stop: int = None):
+        """
+        Mensajes con índice en [start, stop) sin decodificar el resto del historial.
+
+        Devuelve {"summary", "summarized_count", "messages", "total"} o None si
+        la sesión no tiene registro. No modifica el archivo ni el estado.
+        """
+        scan = self._scan(session_id, start=max(0, start), stop=stop)
+        if scan is None:
+            return None
+        return {
+            "summary": scan["summary"],
+            "summarized_count": scan["summarized_count"],
+            "messages": [decode_message(message) for message in scan["messages"]],
+            "total": scan["count"],
+        }
+
+    def compact(self, session_id: str, summary: str, summarized_count: int, messages: list):
+        """Reescribe la sesión completa (mensajes ya serializados) de forma atómica"""
+        path = self.path(session_id)
+        temp_path = f"{path}.tmp"
+        messages = [encode_message(message) for message in messages]
+        lines = [_dumps({"t": "meta", "v": FORMAT_VERSION, "summary": summary, "summarized_count": summarized_count})]
+        lines.extend(_dumps({"t": "msg", "m": message}) for message in messages)
+        text = "".join(lines)
+        raw_size = len(text.encode("utf-8"))
+        packed = self.compress_above and raw_size > self.compress_above
+        data = (_pack(text) if packed else text).encode("utf-8")
+        try:
+            self._write(temp_path, data, "wb")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self._remember(
+                session_id, summary, summarized_count, len(messages), messages[-1] if messages else None, 0,
+                len(data) if packed else 0, 0 if packed else len(data),
+            )
+            self._stats["compactions"] += 1
+            self._stats["compacted_bytes"] += len(data)
+            self._stats["uncompressed_bytes"] += raw_size
+            if packed:
+                self._stats["packed_snapshots"] += 1
+
+    def _needs_compaction(self, state: dict, messages: list) -> bool:
+        if state is None or len(messages) < state["count"] or state["dead"] >= self.compact_after:
+            return True
+        # Con compresión, lo anexado se vuelve a empaquetar cuando iguala a la instantánea comprimida
+        return bool(self.compress_above) and state["loose"] >= max(self.compress_above, state["packed"])
+
+    def append(self, session_id: str, summary: str, summarized_count: int, messages: list, serialize=None) -> int:
+        """
+        Agrega al registro lo que cambió desde la última escritura de la sesión.
+
+        `messages` es el historial completo; `serialize` convierte un mensaje en
+        dict y solo se aplica a los mensajes nuevos y al último ya guardado.
+        Devuelve el número de registros escritos.
+        """
+        serialize = serialize or (lambda message: message)
+        with self._lock:
+            state = self._sessions.get(self.safe_id(session_id))
+        if state is None and self.exists(session_id):
+            self.load(session_id)
+            with self._lock:
+                state = self._sessions.get(self.safe_id(session_id))
+
+        # Sesión nueva, historial reiniciado, demasiados registros obsoletos o cola sin comprimir: instantánea completa
+        if self._needs_compaction(state, messages):
+            self.compact(session_id, summary, summarized_count, [serialize(m) for m in messages])
+            return len(messages) + 1
+
+        records = []
+        dead = 0
+        if summary != state["summary"] or summarized_count != state["summarized_count"]:
+            records.append({"t": "meta", "v": FORMAT_VERSION, "summary": summary, "summarized_count": summarized_count})
+            dead += 1
+        count = state["count"]
+        if count:
+            # El último mensaje guardado puede haberse reescrito (p. ej. un centinela del agente)
+            last = encode_message(serialize(messages[count - 1]))
+            if last != state["last"]:
+                records.append({"t": "set", "i": count - 1, "m": last})
+                dead += 1
+        new_messages = [encode_message(serialize(m)) for m in messages[count:]]
+        records.extend({"t": "msg", "m": message} for message in new_messages)
+        if not records:
+            return 0
+
+        data = "".join(_dumps(record) for record in records).encode("utf-8")
+        self._write(self.path(session_id), data, "ab")
+        with self._lock:
+            # Si la sesión se olvidó mientras tanto, el próximo append la relee del archivo
+            state = self._sessions.get(self.safe_id(session_id))
+            if state is not None:
+                state["count"] = len(messages)
+                if new_messages:
+                    state["last"] = new_messages[-1]
+                elif count:
+                    state["last"] = last
+                state["summary"] = summary
+                state["summarized_count"] = summarized_count
+                state["dead"] += dead
+                state["loose"] += len(data)
+            self._stats["appends"] += 1
+            self._stats["records"] += len(records)
+            self._stats["bytes"] += len(data)
+        return len(records)
+
+    def _ends_with_complete_record(self, path: str) -> bool:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def append_messages(self, session_id: str, messages: list) -> int:
+        """
+        Anexa mensajes nuevos (ya serializados) sin leer el historial de la sesión.
+
+        Solo si el archivo termina en un registro incompleto se reproduce antes
+        para recuperarlo; una sesión sin registro se crea con una instantánea.
+        Devuelve el número de registros escritos.
+        """
+        messages = [encode_message(message) for message in messages]
+        if not messages:
+            return 0
+        path = self.path(session_id)
+        if not os.path.exists(path):
+            self.compact(session_id, "", 0, messages)
+            return len(messages) + 1
+        if not self._ends_with_complete_record(path):
+            self.load(session_id)
+
+        data = "".join(_dumps({"t": "msg", "m": message}) for message in messages).encode("utf-8")
+        self._write(path, data, "ab")
+        with self._lock:
+            state = self._sessions.get(self.safe_id(session_id))
+            if state is not None:
+                state["count"] += len(messages)
+                state["last"] = messages[-1]
+                state["loose"] += len(data)
+            self._stats["appends"] += 1
+            self._stats["records"] += len(messages)
+            self._stats["bytes"] += len(data)
+        return len(messages)
+
+    def forget(self, session_id: str):
+        """Olvida el estado en memoria de la sesión (el archivo se conserva)"""
+        with self._lock:
+            self._sessions.pop(self.safe_id(session_id), None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked_sessions"] = len(self._sessions)
+        stats["avg_bytes_per_append"] = round(stats["bytes"] / stats["appends"], 1) if stats["appends"] else 0
+        uncompressed = stats.pop("uncompressed_bytes")
+        stats["snapshot_ratio"] = round(uncompressed / stats["compacted_bytes"], 2) if stats["compacted_bytes"] else 0
+        return stats
+
+
+__all__ = ['SessionLogStore', 'FORMAT_VERSION', 'encode_message', 'decode_message']
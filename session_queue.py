@@ -0,0 +1,136 @@
+# session_queue.py
+"""
+Procesamiento ordenado por sesión con agrupación de ráfagas de mensajes.
+
+Los usuarios de WhatsApp suelen enviar varios mensajes cortos seguidos
+("hola", "quiero info", "del antares"). Este módulo garantiza que los turnos
+de una misma sesión nunca se ejecuten en paralelo y permite fusionar los
+mensajes que llegan dentro de una ventana corta en un solo turno del agente.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _SessionSlot:
+    """Estado interno de una sesión: cola de turnos y mensajes pendientes"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.next_ticket = 0      # Siguiente turno a entregar
+        self.serving = 0          # Turno que se está atendiendo
+        self.pending = []         # Mensajes esperando a ser agrupados
+        self.collecting = False   # Hay un líder abierto recolectando mensajes
+        self.last_arrival = 0.0   # Momento del último mensaje recibido
+        self.users = 0            # Hilos que todavía usan este slot
+
+
+class SessionTurnQueue:
+    """Serializa los turnos por sesión y agrupa mensajes consecutivos rápidos"""
+
+    def __init__(self, coalesce_window: float = 0.0, max_coalesce_wait: float = None, separator: str = "\n"):
+        self.coalesce_window = max(0.0, float(coalesce_window or 0))
+        # Tope de espera total para que un usuario que escribe sin parar no bloquee su turno
+        if max_coalesce_wait is None:
+            max_coalesce_wait = self.coalesce_window * 3
+        self.max_coalesce_wait = max(self.coalesce_window, float(max_coalesce_wait))
+        self.separator = separator
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._stats = {"messages": 0, "turns": 0, "coalesced": 0}
+
+    def _acquire_slot(self, session_id: str) -> _SessionSlot:
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is None:
+                slot = _SessionSlot()
+                self._slots[session_id] = slot
+            slot.users += 1
+            return slot
+
+    def _release_slot(self, session_id: str, slot: _SessionSlot):
+        with self._lock:
+            slot.users -= 1
+            # Liberar el slot cuando nadie lo usa para no acumular sesiones inactivas
+            if slot.users <= 0 and not slot.pending and self._slots.get(session_id) is slot:
+                del self._slots[session_id]
+
+    def collect(self, session_id: str, message: str):
+        """
+        Registra un mensaje entrante y espera la ventana de agrupación.
+
+        Devuelve el texto fusionado si este hilo es el líder del turno, o None
+        si el mensaje fue absorbido por un turno que ya está recolectando.
+        """
+        with self._lock:
+            self._stats["messages"] += 1
+
+        if self.coalesce_window <= 0:
+            with self._lock:
+                self._stats["turns"] += 1
+            return message
+
+        slot = self._acquire_slot(session_id)
+        try:
+            with slot.condition:
+                slot.pending.append(message)
+                slot.last_arrival = time.monotonic()
+
+                if slot.collecting:
+                    # Otro hilo ya está recolectando: su turno incluirá este mensaje
+                    slot.condition.notify_all()
+                    with self._lock:
+                        self._stats["coalesced"] += 1
+                    return None
+
+                slot.collecting = True
+                started = time.monotonic()
+
+                # Esperar hasta que pase la ventana sin mensajes nuevos (con tope máximo)
+                while True:
+                    now = time.monotonic()
+                    quiet_deadline = slot.last_arrival + self.coalesce_window
+                    hard_deadline = started + self.max_coalesce_wait
+                    wait_for = min(quiet_deadline, hard_deadline) - now
+                    if wait_for <= 0:
+                        break
+                    slot.condition.wait(wait_for)
+
+                merged = self.separator.join(m for m in slot.pending if m)
+                slot.pending = []
+                slot.collecting = False
+
+            with self._lock:
+                self._stats["turns"] += 1
+            return merged
+        finally:
+            self._release_slot(session_id, slot)
+
+    @contextmanager
+    def turn(self, session_id: str):
+        """Context manager que garantiza un solo turno activo por sesión, en orden de llegada"""
+        slot = self._acquire_slot(session_id)
+        with slot.condition:
+            ticket = slot.next_ticket
+            slot.next_ticket += 1
+            while slot.serving != ticket:
+                slot.condition.wait()
+        try:
+            yield
+        finally:
+            with slot.condition:
+                slot.serving += 1
+                slot.condition.notify_all()
+            self._release_slot(session_id, slot)
+
+    def get_stats(self) -> dict:
+        """Estadísticas de agrupación para monitoreo"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active_sessions"] = len(self._slots)
+        stats["coalesce_window_seconds"] = self.coalesce_window
+        return stats
+
+
+__all__ = ['SessionTurnQueue']
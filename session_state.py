@@ -0,0 +1,265 @@
+# session_state.py
+"""
+Estado de conversación por sesión (flujo actual, paso de la reserva, datos
+pendientes, espera de fechas) fuera de la memoria del proceso.
+
+El estado se lee al empezar el turno y, si cambió, se escribe al terminar
+con una actualización atómica por sesión: solo se aplican las claves que el
+turno modificó sobre el valor guardado. Con un backend compartido (SQLite
+en el mismo servidor o Postgres) varios workers o réplicas ven el mismo flujo
+de reserva.
+
+Backends:
+- MemoryStateBackend: en el proceso, con la caché acotada de sesiones.
+- SQLiteStateBackend: archivo local en modo WAL, transacción BEGIN IMMEDIATE.
+- SQLAlchemyStateBackend: tabla de la base de datos de la app (Postgres),
+  con SELECT ... FOR UPDATE.
+"""
+
+import copy
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_MISSING = object()
+
+
+class MemoryStateBackend:
+    """Estado en el proceso; solo sirve con un worker"""
+
+    name = "memory"
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str):
+        return copy.deepcopy(self.cache.get(session_id))
+
+    def update(self, session_id: str, mutate) -> dict:
+        with self._lock:
+            state = mutate(copy.deepcopy(self.cache.get(session_id)))
+            self.cache.put(session_id, copy.deepcopy(state))
+        return state
+
+    def delete(self, session_id: str):
+        self.cache.pop(session_id)
+
+    def get_stats(self) -> dict:
+        return self.cache.get_stats()
+
+
+class SQLiteStateBackend:
+    """Estado en un archivo SQLite compartido por los workers del mismo servidor"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo; las transacciones se abren explícitamente
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str):
+        row = self._conn().execute("SELECT state FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, session_id: str, mutate) -> dict:
+        conn = self._conn()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura: nadie más modifica la sesión en medio
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+            state = mutate(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT INTO session_state (session_id, state, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, "
+                "version = session_state.version + 1, updated_at = excluded.updated_at",
+                (session_id, json.dumps(state, ensure_ascii=False), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    def get_stats(self) -> dict:
+        count = self._conn().execute("SELECT COUNT(*) FROM session_state").fetchone()[0]
+        return {"sessions": count, "path": self.path}
+
+
+class SQLAlchemyStateBackend:
+    """Estado en la base de datos de la aplicación (Postgres en producción)"""
+
+    name = "postgres"
+
+    def __init__(self, db, app, model):
+        # model: tabla con session_id, state (texto JSON), version y updated_at
+        self.db = db
+        self.app = app
+        self.model = model
+
+    def load(self, session_id: str):
+        with self.app.app_context():
+            row = self.db.session.get(self.model, session_id)
+            state = json.loads(row.state) if row else None
+            self.db.session.remove()
+        return state
+
+    def update(self, session_id: str, mutate) -> dict:
+        from sqlalchemy.exc import IntegrityError
+
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                for attempt in range(2):
+                    try:
+                        row = session.query(self.model).filter_by(session_id=session_id).with_for_update().one_or_none()
+                        state = mutate(json.loads(row.state) if row else None)
+                        if row is None:
+                            row = self.model(session_id=session_id, version=0)
+                            session.add(row)
+                        row.state = json.dumps(state, ensure_ascii=False)
+                        row.version = (row.version or 0) + 1
+                        row.updated_at = datetime.utcnow()
+                        session.commit()
+                        return state
+                    except IntegrityError:
+                        # Otro worker insertó la misma sesión a la vez: se repite sobre su fila
+                        session.rollback()
+                        if attempt:
+                            raise
+                    except Exception:
+                        session.rollback()
+                        raise
+            finally:
+                session.remove()
+
+    def delete(self, session_id: str):
+        with self.app.app_context():
+            self.db.session.query(self.model).filter_by(session_id=session_id).delete()
+            self.db.session.commit()
+            self.db.session.remove()
+
+    def get_stats(self) -> dict:
+        with self.app.app_context():
+            count = self.db.session.query(self.model).count()
+            self.db.session.remove()
+        return {"sessions": count}
+
+
+class SessionStateStore:
+    """Estado de las sesiones con lectura al inicio del turno y escritura atómica al final"""
+
+    def __init__(self, backend, default_factory):
+        self.backend = backend
+        self.default_factory = default_factory
+        self._open = {}
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "writes": 0, "unchanged": 0, "errors": 0}
+
+    def load(self, session_id: str) -> dict:
+        """Estado guardado de la sesión, o uno nuevo si no existe"""
+        with self._lock:
+            self._stats["loads"] += 1
+        try:
+            state = self.backend.load(session_id)
+        except Exception as e:
+            print(f"WARNING:  No se pudo leer el estado de {session_id}: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            state = None
+        return state if state is not None else self.default_factory(session_id)
+
+    def get(self, session_id: str, default=None):
+        """Estado del turno en curso de la sesión; si no hay turno abierto, el guardado"""
+        with self._lock:
+            state = self._open.get(session_id)
+        if state is not None:
+            return state
+        try:
+            state = self.backend.load(session_id)
+        except Exception:
+            state = None
+        return state if state is not None else default
+
+    def current(self, session_id: str) -> dict:
+        """Estado mutable del turno en curso (o cargado si se llama fuera de un turno)"""
+        with self._lock:
+            state = self._open.get(session_id)
+        return state if state is not None else self.load(session_id)
+
+    @contextmanager
+    def turn(self, session_id: str):
+        """Abre el estado de la sesión durante el turno y guarda al final lo que cambió"""
+        state = self.load(session_id)
+        before = copy.deepcopy(state)
+        with self._lock:
+            self._open[session_id] = state
+        try:
+            yield state
+        finally:
+            with self._lock:
+                if self._open.get(session_id) is state:
+                    del self._open[session_id]
+            self._commit(session_id, before, state)
+
+    def _commit(self, session_id: str, before: dict, after: dict):
+        if after == before:
+            with self._lock:
+                self._stats["unchanged"] += 1
+            return
+
+        changed = {key: value for key, value in after.items() if before.get(key, _MISSING) != value}
+        removed = [key for key in before if key not in after]
+
+        def merge(current):
+            # Solo las claves que tocó este turno; lo demás queda como está guardado
+            merged = dict(current if current is not None else before)
+            merged.update(copy.deepcopy(changed))
+            for key in removed:
+                merged.pop(key, None)
+            return merged
+
+        try:
+            self.backend.update(session_id, merge)
+            with self._lock:
+                self._stats["writes"] += 1
+        except Exception as e:
+            print(f"ERROR: No se pudo guardar el estado de {session_id}: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_turns"] = len(self._open)
+        stats["backend"] = self.backend.name
+        try:
+            stats.update(self.backend.get_stats())
+        except Exception as e:
+            stats["backend_error"] = str(e)
+        return stats
+
+
+__all__ = ['SessionStateStore', 'MemoryStateBackend', 'SQLiteStateBackend', 'SQLAlchemyStateBackend']
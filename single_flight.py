@@ -0,0 +1,100 @@
+# single_flight.py
+"""
+Agrupación de solicitudes idénticas concurrentes (single-flight).
+
+Cuando varios usuarios piden lo mismo al mismo tiempo (la opción "1" del menú,
+la misma pregunta de precios), solo la primera solicitud llama a OpenAI; las
+demás esperan ese resultado en curso y lo reciben también. La clave es el
+punto de llamada más el texto de entrada normalizado.
+
+Si el líder falla por algo propio de su turno (su deadline venció o el
+planificador lo descartó por su prioridad), los seguidores no heredan ese
+error: vuelven a intentar con su propio deadline y prioridad.
+"""
+
+import re
+import threading
+
+from llm_deadline import DeadlineExceeded, remaining
+from llm_scheduler import SchedulerBusyError
+
+# Errores que dependen del turno del líder y no de la respuesta del proveedor
+_TURN_BOUND_ERRORS = (DeadlineExceeded, SchedulerBusyError)
+
+
+def normalize_key(text) -> str:
+    """Normaliza el texto de entrada: minúsculas, sin signos de puntuación ni espacios repetidos"""
+    text = str(text or "").lower()
+    text = re.sub(r"[¿?¡!.,;:\"']", " ", text)
+    return " ".join(text.split())
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Comparte una sola llamada en curso entre solicitudes concurrentes con la misma clave"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"calls": 0, "shared": 0, "retried": 0}
+
+    def do(self, site: str, key, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) o espera a la ejecución idéntica que ya está en curso.
+
+        Los seguidores reciben el mismo resultado o la misma excepción que el líder,
+        salvo un timeout o un descarte del planificador del líder: entonces repiten
+        la llamada en su propio contexto. Su espera queda acotada por el deadline del turno.
+        """
+        flight_key = (site, normalize_key(key))
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[flight_key] = flight
+                self._stats["calls"] += 1
+            else:
+                flight.waiters += 1
+                self._stats["shared"] += 1
+
+        if not leader:
+            if not flight.event.wait(remaining()):
+                raise DeadlineExceeded(f"Timeout: esperando respuesta compartida de '{site}'", local=True)
+            if isinstance(flight.error, _TURN_BOUND_ERRORS):
+                with self._lock:
+                    self._stats["retried"] += 1
+                return self.do(site, key, fn, *args, **kwargs)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(flight_key, None)
+            flight.event.set()
+
+    def get_stats(self) -> dict:
+        """Estadísticas de llamadas compartidas para monitoreo"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+__all__ = ['SingleFlight', 'normalize_key']
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+Configuración común de los tests: la memoria y el recuerdo van a un directorio temporal
+"""
+
+import os
+import tempfile
+
+# Antes de que algún test importe agente: así nunca escribe en user_memories_data del repositorio
+_DATA_DIR = tempfile.mkdtemp(prefix="glamping-test-")
+os.environ.setdefault("MEMORY_DIR", os.path.join(_DATA_DIR, "user_memories_data"))
+os.environ.setdefault("USER_RECALL_DIR", os.path.join(_DATA_DIR, "user_recall_data"))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test de la memoria en las respuestas de /chat y del historial paginado
+"""
+
+import sys
+import os
+import uuid
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from session_log import SessionLogStore
+
+
+def _mensaje(i):
+    return {"type": "human" if i % 2 == 0 else "ai", "data": {"content": f"mensaje {i}"}}
+
+
+def test_respuesta_con_ultimos_mensajes_o_sin_memoria():
+    """La memoria devuelta no crece con la conversación salvo que se pida completa"""
+    import agente
+    memoria = agente._new_memory()
+    for i in range(40):
+        memoria.chat_memory.add_user_message(f"mensaje {i}")
+
+    ultimos = agente._chat_memory_payload(memoria, {"mode": "last", "last": 5})
+    assert [m["data"]["content"] for m in ultimos["memory"]] == [f"mensaje {i}" for i in range(35, 40)]
+    assert ultimos["memory_total"] == 40
+    assert ultimos["memory_cursor"] == 35
+    assert agente._chat_memory_payload(memoria, {"mode": "none"}) == {}
+    assert len(agente._chat_memory_payload(memoria, {"mode": "full"})["memory"]) == 40
+    assert agente._parse_memory_echo({"memory": "NONE", "memory_last": "3"}) == {"mode": "none", "last": 3}
+    assert agente._parse_memory_echo({"memory": "otra"})["mode"] is None
+
+
+def test_chat_respeta_la_opcion_de_memoria(tmp_path, monkeypatch):
+    """El saludo de una sesión nueva responde sin memoria cuando se pide memory=none"""
+    import agente
+    from conversation_search import ConversationSearchIndex
+    from lazy_session import combine_pending
+    from memory_manifest import MemoryManifest
+    from session_cache import SessionCache
+    from write_behind import WriteBehindPersister
+
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+    monkeypatch.setattr(agente, "conversation_search", ConversationSearchIndex(str(tmp_path / "_search.db"), background=False))
+    monkeypatch.setattr(agente, "user_memories", SessionCache())
+    monkeypatch.setattr(agente, "memory_persister", WriteBehindPersister(
+        agente._persist_session, interval=60, combine=combine_pending
+    ))
+    client = agente.app.test_client()
+    session_id = f"test-{uuid.uuid4()}"
+
+    datos = client.post("/chat", json={"input": "hola", "session_id": session_id, "memory": "none"}).get_json()
+    assert "memory" not in datos
+    assert datos["response"]
+    agente.memory_persister.close()
+    assert agente.memory_log.exists(session_id)
+
+
+def test_historial_paginado_desde_el_registro(tmp_path, monkeypatch):
+    """El historial se recorre hacia atrás con el cursor, leyendo solo la página pedida"""
+    import agente
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    agente.memory_log.append("s1", "", 0, [_mensaje(i) for i in range(25)])
+    client = agente.app.test_client()
+
+    pagina = client.get("/chat/s1/history?limit=10").get_json()
+    assert [m["data"]["content"] for m in pagina["messages"]] == [f"mensaje {i}" for i in range(15, 25)]
+    assert pagina["total"] == 25
+    assert pagina["next_cursor"] == 15
+
+    pagina = client.get("/chat/s1/history?limit=10&before=15").get_json()
+    assert pagina["start"] == 5
+    pagina = client.get("/chat/s1/history?limit=10&before=5").get_json()
+    assert [m["data"]["content"] for m in pagina["messages"]] == [f"mensaje {i}" for i in range(5)]
+    assert pagina["next_cursor"] is None
+
+    assert client.get("/chat/no-existe/history").status_code == 404
+
+
+def test_historial_de_sesion_en_memoria():
+    """Una sesión cargada en caché se pagina desde la memoria, que es la más reciente"""
+    import agente
+    session_id = f"test-{uuid.uuid4()}"
+    memoria = agente._new_memory()
+    for i in range(12):
+        memoria.chat_memory.add_user_message(f"mensaje {i}")
+    agente.user_memories.put(session_id, memoria)
+    try:
+        pagina = agente.app.test_client().get(f"/chat/{session_id}/history?limit=5&before=7").get_json()
+        assert [m["data"]["content"] for m in pagina["messages"]] == [f"mensaje {i}" for i in range(2, 7)]
+        assert pagina["next_cursor"] == 2
+    finally:
+        agente.user_memories.pop(session_id)
+
+
+def test_historial_no_expone_sesiones_de_whatsapp(monkeypatch):
+    """Una sesión de WhatsApp no se lee ni se guarda desde /chat/<id>/history"""
+    import agente
+    numero = "whatsapp:+573001234567"
+    memoria = agente._new_memory()
+    memoria.chat_memory.add_user_message("mi número de reserva es 123")
+    agente.user_memories.put(numero, memoria)
+    monkeypatch.setattr(agente.memory_persister, "flush", lambda *args: pytest.fail("no debe guardarse"))
+    try:
+        respuesta = agente.app.test_client().get(f"/chat/{numero}/history")
+        assert respuesta.status_code == 404
+        assert "messages" not in respuesta.get_json()
+    finally:
+        agente.user_memories.pop(numero)
+
+
+def test_historial_no_expone_whatsapp_con_otra_forma_del_id(tmp_path, monkeypatch):
+    """":whatsapp:+57…" o "+whatsapp+57…" caen en el registro del número: también se rechazan"""
+    import agente
+    from urllib.parse import quote
+
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    agente.memory_log.append("whatsapp:+573001112233", "", 0, [_mensaje(0), _mensaje(1)])
+    client = agente.app.test_client()
+
+    for session_id in (":whatsapp:+573001112233", "+whatsapp+573001112233", "whatsapp573001112233", "WhatsApp:+573001112233"):
+        respuesta = client.get(f"/chat/{quote(session_id, safe='')}/history")
+        assert respuesta.status_code == 404, session_id
+        assert "messages" not in respuesta.get_json()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test del circuit breaker por modelo y la caché de últimas respuestas buenas
+"""
+
+import sys
+import os
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from circuit_breaker import (
+    CircuitBreaker, BreakerRegistry, CircuitOpenError, LastGoodCache,
+    STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN,
+)
+
+
+def _fail(breaker, message="Rate limit reached"):
+    with pytest.raises(RuntimeError):
+        with breaker.protect():
+            raise RuntimeError(message)
+
+
+def test_abre_tras_superar_tasa_de_fallos():
+    """Con suficientes fallos recientes el circuito se abre y rechaza al instante"""
+    breaker = CircuitBreaker("gpt-test", failure_rate=0.5, min_calls=4, open_seconds=60)
+    with breaker.protect():
+        pass
+    for _ in range(3):
+        _fail(breaker)
+
+    assert breaker.state == STATE_OPEN
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        with breaker.protect():
+            pass
+    assert time.monotonic() - started < 0.05
+    assert breaker.get_stats()["rejected"] == 1
+
+
+def test_errores_propios_no_abren_el_circuito():
+    """Errores de parsing o lógica local no cuentan como fallos del proveedor"""
+    breaker = CircuitBreaker("gpt-test", min_calls=2)
+    for _ in range(5):
+        _fail(breaker, "Could not parse LLM output")
+    assert breaker.state == STATE_CLOSED
+
+
+def test_clasifica_por_tipo_y_codigo_http():
+    """Se cuenta el código de estado del error de OpenAI, no números sueltos en el mensaje"""
+    import httpx
+    import openai
+    from circuit_breaker import is_provider_failure
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+    def status_error(code):
+        return openai.APIStatusError("error", response=httpx.Response(code, request=request), body=None)
+
+    assert is_provider_failure(status_error(429))
+    assert is_provider_failure(status_error(503))
+    assert is_provider_failure(status_error(401))
+    assert not is_provider_failure(status_error(400))
+    assert is_provider_failure(openai.APIConnectionError(request=request))
+    assert not is_provider_failure(ValueError("El precio total es 500000 COP"))
+    assert not is_provider_failure(ValueError("Domo 502 no existe"))
+
+    try:
+        try:
+            raise status_error(502)
+        except openai.APIStatusError as e:
+            raise ValueError("fallo del agente") from e
+    except ValueError as envuelto:
+        assert is_provider_failure(envuelto)
+
+
+def test_pool_saturado_no_abre_el_circuito(monkeypatch):
+    """Un DeadlineExceeded local (pool lleno o turno sin tiempo) no cuenta contra el proveedor"""
+    import threading
+    import llm_deadline
+
+    monkeypatch.setattr(llm_deadline, "_pool_slots", threading.BoundedSemaphore(1))
+    llm_deadline._pool_slots.acquire()
+    breaker = CircuitBreaker("gpt-test", failure_rate=0.5, min_calls=2)
+    for _ in range(4):
+        with pytest.raises(llm_deadline.DeadlineExceeded):
+            with breaker.protect():
+                llm_deadline.call_with_deadline(lambda: "ok", timeout=0.05)
+    with pytest.raises(llm_deadline.DeadlineExceeded):
+        with breaker.protect():
+            with llm_deadline.turn_deadline(0):
+                llm_deadline.call_with_deadline(lambda: "ok")
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_stats()["failures"] == 0
+
+    # Una llamada que sí salió y no respondió a tiempo sigue contando
+    llm_deadline._pool_slots.release()
+    with pytest.raises(llm_deadline.DeadlineExceeded):
+        with breaker.protect():
+            llm_deadline.call_with_deadline(time.sleep, 0.2, timeout=0.05)
+    assert breaker.get_stats()["failures"] == 1
+    time.sleep(0.3)  # la llamada abandonada devuelve su hilo antes de restaurar el pool
+
+
+def test_sonda_semiabierta_restablece_o_reabre():
+    """Tras el tiempo de apertura una sonda exitosa cierra el circuito y una fallida lo reabre"""
+    breaker = CircuitBreaker("gpt-test", min_calls=1, open_seconds=0.05)
+    _fail(breaker)
+    assert breaker.state == STATE_OPEN
+
+    time.sleep(0.06)
+    assert breaker.state == STATE_HALF_OPEN
+    _fail(breaker, "Connection error")
+    assert breaker.state == STATE_OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow_request() is True
+    # Solo se permite una sonda a la vez
+    assert breaker.allow_request() is False
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_registro_separa_modelos():
+    """Cada modelo tiene su propio circuito"""
+    registry = BreakerRegistry(min_calls=1)
+    _fail(registry.get("gpt-4o"))
+    assert registry.is_open("gpt-4o")
+    assert not registry.is_open("gpt-4o-mini")
+    assert registry.get_stats()["gpt-4o"]["state"] == STATE_OPEN
+
+
+def test_cache_ultima_respuesta_buena():
+    """La caché normaliza la clave y conserva solo las entradas más recientes"""
+    cache = LastGoodCache(max_entries=2)
+    cache.put("menu:1", "domos")
+    assert cache.get("  MENU:1 ") == "domos"
+    cache.put("menu:2", "servicios")
+    cache.put("menu:4", "info")
+    assert cache.get("menu:1") is None
+    assert cache.get("menu:4") == "info"
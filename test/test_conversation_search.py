@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test de la búsqueda de texto completo sobre las conversaciones
+"""
+
+import sys
+import os
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import HumanMessage, AIMessage
+
+from conversation_search import ConversationSearchIndex, build_match_query
+
+
+def _conversacion(*textos):
+    return [(HumanMessage if i % 2 == 0 else AIMessage)(content=texto) for i, texto in enumerate(textos)]
+
+
+def test_consulta_sin_sintaxis_fts():
+    """Las palabras del panel se citan para que comillas o guiones no rompan la consulta"""
+    assert build_match_query('mascotas "Polaris" -niños') == '"mascotas" "Polaris" "niños"'
+    assert build_match_query("¿?") == ""
+
+
+def test_busca_por_palabras_sin_tildes_y_filtra(tmp_path):
+    """Se encuentran los turnos con todas las palabras, sin importar tildes, con filtros de canal y teléfono"""
+    index = ConversationSearchIndex(str(tmp_path / "search.db"), background=False)
+    index.add_messages("whatsapp:+573001234567", _conversacion(
+        "¿Puedo llevar mi perro al domo Polaris?", "Sí, Polaris admite mascotas pequeñas."))
+    index.add_messages("web-123", _conversacion("Quiero reservar Antares con mascotas", "Con gusto."))
+
+    resultado = index.search("mascotas polaris")
+    assert resultado["total"] == 1
+    assert resultado["results"][0]["session_id"] == "whatsapp:+573001234567"
+    assert "[mascotas]" in resultado["results"][0]["snippet"]
+
+    assert index.search("mascotas")["total"] == 2
+    assert index.search("pequenas")["total"] == 1
+    assert index.search("mascotas", channel="web")["results"][0]["session_id"] == "web-123"
+    assert index.search("mascotas", phone="3001234567")["total"] == 1
+    assert index.search("mascotas", until=time.time() - 3600)["total"] == 0
+
+
+def test_indexa_solo_lo_nuevo_y_pagina(tmp_path):
+    """Los guardados sucesivos no duplican turnos; el último reescrito se actualiza"""
+    index = ConversationSearchIndex(str(tmp_path / "search.db"), background=False)
+    mensajes = _conversacion(*[f"consulta {i} sobre el jacuzzi" for i in range(30)])
+    index.add_messages("s1", mensajes[:10])
+    index.add_messages("s1", mensajes)
+    mensajes[-1] = AIMessage(content="respuesta final sobre la piscina")
+    index.add_messages("s1", mensajes)
+
+    assert index.search("jacuzzi")["total"] == 29
+    assert index.search("piscina")["total"] == 1
+    paginas = [index.search("jacuzzi", page=p, per_page=10)["results"] for p in (1, 2, 3)]
+    assert [len(p) for p in paginas] == [10, 10, 9]
+    assert len({r["message_index"] for p in paginas for r in p}) == 29
+    assert index.get_stats()["indexed_messages"] == 30
+
+
+def test_endpoint_del_panel(tmp_path, monkeypatch):
+    """GET /api/conversaciones/buscar devuelve resultados paginados y valida los parámetros"""
+    import agente
+    index = ConversationSearchIndex(str(tmp_path / "search.db"), background=False)
+    index.add_messages("whatsapp:+573009998877", _conversacion("¿Aceptan mascotas en Polaris?", "Sí."))
+    monkeypatch.setattr(agente, "conversation_search", index)
+    client = agente.app.test_client()
+
+    hoy = time.strftime("%Y-%m-%d")
+    respuesta = client.get(f"/api/conversaciones/buscar?q=mascotas&canal=whatsapp&fecha_inicio={hoy}&fecha_fin={hoy}")
+    datos = respuesta.get_json()
+    assert respuesta.status_code == 200
+    assert datos["total"] == 1
+    assert datos["resultados"][0]["telefono"] == "573009998877"
+
+    assert client.get("/api/conversaciones/buscar").status_code == 400
+    assert client.get("/api/conversaciones/buscar?q=x&fecha_inicio=ayer").status_code == 400
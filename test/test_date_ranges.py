@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test del intérprete determinista de fechas y rangos en español
+"""
+
+import sys
+import os
+import time
+from datetime import date
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_ranges import parse_date, parse_date_range, colombian_holidays
+
+# Domingo 18 de octubre de 2026
+HOY = date(2026, 10, 18)
+
+
+def test_rangos_explicitos():
+    """Rangos con mes compartido, entre meses y con formato numérico"""
+    casos = {
+        "del 15 al 17 de diciembre, 2 personas": (date(2026, 12, 15), date(2026, 12, 17)),
+        "entre el 5 y el 7 de noviembre": (date(2026, 11, 5), date(2026, 11, 7)),
+        "15/12/2026 al 17/12/2026": (date(2026, 12, 15), date(2026, 12, 17)),
+        "del 30 de diciembre al 2 de enero": (date(2026, 12, 30), date(2027, 1, 2)),
+        "del 29 al 2 de enero": (date(2026, 12, 29), date(2027, 1, 2)),
+        "del 28 al 3 de marzo de 2027": (date(2027, 2, 28), date(2027, 3, 3)),
+        "15 de diciembre al 20": (date(2026, 12, 15), date(2026, 12, 20)),
+        "del 20 al 22": (date(2026, 10, 20), date(2026, 10, 22)),
+        "mañana por 2 noches": (date(2026, 10, 19), date(2026, 10, 21)),
+        "del 2 al 5 sep. con vista al mar": (date(2027, 9, 2), date(2027, 9, 5)),
+        "15 mar 2027 al 17 mar 2027": (date(2027, 3, 15), date(2027, 3, 17)),
+    }
+    for texto, esperado in casos.items():
+        rango = parse_date_range(texto, today=HOY)
+        assert (rango.start, rango.end) == esperado, texto
+
+
+def test_expresiones_relativas_y_festivos():
+    """Fin de semana, día de la semana, puente festivo y Semana Santa"""
+    fin_de_semana = parse_date_range("este fin de semana", today=HOY)
+    assert (fin_de_semana.start, fin_de_semana.end) == (date(2026, 10, 23), date(2026, 10, 25))
+    assert parse_date("el próximo viernes", today=HOY) == date(2026, 10, 23)
+    # Todos los Santos se traslada al lunes 2 de noviembre: puente de viernes a lunes
+    puente = parse_date_range("queremos ir el puente festivo", today=HOY)
+    assert (puente.start, puente.end, puente.kind) == (date(2026, 10, 30), date(2026, 11, 2), "puente")
+    semana_santa = parse_date_range("semana santa", today=HOY)
+    assert (semana_santa.start, semana_santa.end) == (date(2027, 3, 24), date(2027, 3, 28))
+
+
+def test_calendario_de_festivos_de_colombia():
+    """Festivos fijos, trasladados al lunes y dependientes de la Pascua"""
+    festivos = colombian_holidays(2026)
+    assert festivos[date(2026, 1, 12)] == "Reyes Magos"
+    assert festivos[date(2026, 4, 3)] == "Viernes Santo"
+    assert festivos[date(2026, 12, 25)] == "Navidad"
+    assert len(festivos) == 18
+
+
+def test_sin_fechas_no_inventa_rangos():
+    """Cantidades, teléfonos y "en la mañana" no se toman como fechas"""
+    for texto in ("Antares para 2 personas", "3001234567", "llegamos en la mañana", "correo@email.com",
+                  "vista al mar 2 noches", "set de toallas 3", "quiero 3 set de toallas", "el mar 15 personas",
+                  "un sep 2 y algo"):
+        assert parse_date_range(texto, today=HOY) is None, texto
+    # Con una sola fecha la salida queda sin resolver
+    assert parse_date_range("llego el 17/11/2026 y me voy el otro fin de semana", today=HOY).end is None
+
+
+def test_interpretacion_en_microsegundos():
+    """El caso común se resuelve muy por debajo de una llamada al LLM"""
+    textos = ["del 15 al 17 de diciembre, 2 personas", "este fin de semana", "24/12/2026 al 26/12/2026",
+              "puente de noviembre", "el próximo viernes por 2 noches"]
+    inicio = time.perf_counter()
+    for _ in range(200):
+        for texto in textos:
+            parse_date_range(texto, today=HOY)
+    promedio_ms = (time.perf_counter() - inicio) * 1000 / (200 * len(textos))
+    assert promedio_ms < 1
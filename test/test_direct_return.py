@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test de las herramientas de retorno directo y sus centinelas
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.agents import initialize_agent, AgentType
+from langchain.memory import ConversationBufferMemory
+from langchain_community.llms.fake import FakeListLLM
+
+from agente import tools, apply_agent_sentinel, RESERVATION_DETAILS_PROMPT
+
+
+def _estado():
+    return {"current_flow": "none", "reserva_step": 0, "reserva_data": {}, "waiting_for_availability": False}
+
+
+def test_herramientas_directas_declaradas():
+    """Las herramientas cuya salida va tal cual al usuario se declaran de retorno directo"""
+    directas = {t.name for t in tools if t.return_direct}
+    assert {"SolicitarDatosReserva", "ConsultarDisponibilidades", "LinksImagenesWeb", "MenuPrincipal"} <= directas
+    assert "RespuestaEmpaticaYRedirection" not in directas
+
+
+def test_el_agente_no_reformula_la_salida():
+    """Con una herramienta directa el agente termina tras una sola llamada al LLM"""
+    llm = FakeListLLM(responses=[
+        "Thought: Do I need to use a tool? Yes\nAction: MenuPrincipal\nAction Input: menú",
+        "AI: esta respuesta no debería generarse",
+    ])
+    menu = next(t for t in tools if t.name == "MenuPrincipal")
+    memory = ConversationBufferMemory(memory_key="chat_history", input_key="input")
+    agent = initialize_agent(tools=[menu], llm=llm, agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+                             memory=memory, handle_parsing_errors=True, max_iterations=3)
+
+    salida = agent.invoke({"input": "muéstrame el menú"})["output"]
+    assert salida == menu.func("menú")
+    assert llm.i == 1
+
+
+def test_centinela_de_reserva_inicia_el_flujo():
+    """El centinela de SolicitarDatosReserva pasa la sesión al paso 1 de la reserva"""
+    estado = _estado()
+    memory = ConversationBufferMemory(memory_key="chat_history", input_key="input")
+    memory.save_context({"input": "quiero reservar"}, {"output": "REQUEST_RESERVATION_DETAILS"})
+
+    respuesta = apply_agent_sentinel("REQUEST_RESERVATION_DETAILS", estado, memory)
+    assert respuesta == RESERVATION_DETAILS_PROMPT
+    assert estado["current_flow"] == "reserva" and estado["reserva_step"] == 1
+    assert memory.chat_memory.messages[-1].content == RESERVATION_DETAILS_PROMPT
+
+    # Cualquier otra respuesta se deja igual
+    assert apply_agent_sentinel("Hola", _estado()) == "Hola"
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test de la carga diferida de la memoria de sesión
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import HumanMessage, AIMessage
+
+from lazy_session import LazySessionMemory, PendingTurns, combine_pending
+from session_cache import SessionCache
+from write_behind import WriteBehindPersister
+
+
+class _Memoria:
+    def __init__(self, textos=()):
+        from langchain.memory import ChatMessageHistory
+        self.chat_memory = ChatMessageHistory()
+        for texto in textos:
+            self.chat_memory.add_user_message(texto)
+
+
+def _sesion(cargas, persister, historial=False, cache=None):
+    def cargar(sid):
+        cargas.append(sid)
+        return _Memoria(["anterior"] if historial else ())
+    return LazySessionMemory("s1", cache or SessionCache(), cargar, persister, lambda sid: historial)
+
+
+def test_turno_sin_historial_no_carga_la_sesion():
+    """Un turno de menú solo anexa su intercambio; la memoria no se lee"""
+    cargas, guardados = [], []
+    persister = WriteBehindPersister(lambda sid, obj: guardados.append(obj), interval=60, combine=combine_pending)
+    sesion = _sesion(cargas, persister)
+
+    assert sesion.is_new()
+    sesion.add_messages([HumanMessage(content="1"), AIMessage(content="Domos")])
+    sesion.commit()
+    assert cargas == []
+    assert isinstance(persister.pending("s1"), PendingTurns)
+
+    # El siguiente turno diferido se suma a lo pendiente en lugar de reemplazarlo
+    otra = _sesion(cargas, persister)
+    assert not otra.is_new()
+    otra.add_messages([HumanMessage(content="2"), AIMessage(content="Servicios")])
+    otra.commit()
+    assert persister.flush() == 1
+    assert [m.content for m in guardados[0].messages] == ["1", "Domos", "2", "Servicios"]
+    assert cargas == []
+    persister.close()
+
+
+def test_la_memoria_se_carga_al_pedirla_y_aplica_el_bufer():
+    """Al pedir la memoria se carga una vez, con los mensajes del turno ya agregados"""
+    cargas = []
+    persister = WriteBehindPersister(lambda sid, obj: True, interval=60)
+    sesion = _sesion(cargas, persister, historial=True)
+
+    assert not sesion.is_new()
+    sesion.add_messages([HumanMessage(content="hola")])
+    assert [m.content for m in sesion.memory.chat_memory.messages] == ["anterior", "hola"]
+    assert sesion.memory is sesion.memory
+    sesion.commit()
+    assert cargas == ["s1"]
+    assert persister.pending("s1") is sesion.memory
+    persister.close()
+
+
+def test_turno_sin_cambios_no_escribe():
+    """Si el turno no tocó la memoria (p. ej. un paso de la reserva) no se marca para guardar"""
+    cache = SessionCache()
+    cache.put("s1", _Memoria(["anterior"]))
+    persister = WriteBehindPersister(lambda sid, obj: True, interval=60)
+
+    sesion = _sesion([], persister, cache=cache)
+    sesion.commit()
+    assert not sesion.is_new()
+    sesion.commit()
+    assert not persister.is_dirty("s1")
+    persister.close()
+
+
+def test_saludo_de_sesion_desconocida_sin_leer_el_registro(tmp_path, monkeypatch):
+    """El saludo de un número nuevo se responde y se guarda sin cargar ni crear la memoria antes"""
+    import agente
+    from conversation_search import ConversationSearchIndex
+    from memory_manifest import MemoryManifest
+    from session_log import SessionLogStore
+
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+    monkeypatch.setattr(agente, "conversation_search", ConversationSearchIndex(str(tmp_path / "_search.db"), background=False))
+    monkeypatch.setattr(agente, "user_memories", SessionCache())
+    monkeypatch.setattr(agente, "memory_persister", WriteBehindPersister(
+        agente._persist_session, interval=60, combine=combine_pending
+    ))
+    cargas = []
+    load_user_memory = agente.load_user_memory
+    monkeypatch.setattr(agente, "load_user_memory", lambda sid: cargas.append(sid) or load_user_memory(sid))
+
+    numero = "whatsapp:+573009998877"
+    respuesta = agente._process_whatsapp_turn("buenas tardes", numero, None)
+    assert "Glamping Brillo de Luna" in respuesta
+    assert cargas == []
+    assert not agente.memory_log.exists(numero)
+
+    agente.memory_persister.flush()
+    assert cargas == []
+    assert agente.memory_manifest.get(numero)["messages"] == 2
+    assert agente.conversation_search.search("tardes", session_id=numero)["total"] == 1
+    assert not agente.open_session_memory(numero).is_new()
+
+    memoria = agente.rehydrate_user_memory(numero)
+    assert [m.content for m in memoria.chat_memory.messages][0] == "buenas tardes"
+    assert len(memoria.chat_memory.messages) == 2
+    agente.memory_persister.close()
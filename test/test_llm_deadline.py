@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test de los plazos por turno, timeouts por intento y hedging de llamadas LLM
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import llm_deadline
+from llm_deadline import (
+    DeadlineExceeded, turn_deadline, remaining, has_budget,
+    call_with_deadline, backoff_sleep,
+)
+
+
+def test_deadline_anidado_no_extiende_el_externo():
+    """Un deadline interno más largo queda acotado por el del turno"""
+    assert remaining() is None
+    with turn_deadline(1.0):
+        with turn_deadline(30.0):
+            assert remaining() <= 1.0
+    assert remaining() is None
+
+
+def test_timeout_por_intento_lanza_deadline_exceeded():
+    """Una llamada colgada se corta al vencer el deadline del turno"""
+    started = time.monotonic()
+    with turn_deadline(0.1):
+        with pytest.raises(DeadlineExceeded):
+            call_with_deadline(time.sleep, 2)
+    assert time.monotonic() - started < 1.0
+
+
+def test_deadline_se_propaga_al_hilo_de_la_llamada():
+    """La función ejecutada ve el mismo deadline que el turno"""
+    with turn_deadline(5.0):
+        seen = call_with_deadline(remaining)
+    assert seen is not None and 0 < seen <= 5.0
+
+
+def test_hedging_usa_la_respuesta_mas_rapida():
+    """Si la llamada supera su p95 se lanza una copia y gana la primera en responder"""
+    site = "test_hedge_site"
+    for _ in range(30):
+        call_with_deadline(lambda: "rapido", site=site)
+
+    calls = []
+    lock = threading.Lock()
+
+    def slow_then_fast():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.0)
+        return "hedge" if not first else "original"
+
+    before = llm_deadline.get_stats()["hedge_wins"]
+    result = call_with_deadline(slow_then_fast, timeout=2.0, hedge=True, site=site)
+    assert result == "hedge"
+    assert llm_deadline.get_stats()["hedge_wins"] == before + 1
+
+
+def test_reintento_se_omite_sin_tiempo():
+    """El backoff no duerme si el siguiente intento no alcanzaría a terminar"""
+    with turn_deadline(0.5):
+        started = time.monotonic()
+        assert backoff_sleep(attempt=2, min_attempt=1.0) is False
+        assert time.monotonic() - started < 0.1
+        assert has_budget(min_seconds=1.0) is False
+
+
+def test_llamada_abandonada_retiene_su_cupo_del_planificador():
+    """Tras un timeout la llamada sigue en curso y su cupo no se entrega a otra hasta que termina"""
+    from llm_scheduler import LLMScheduler
+    scheduler = LLMScheduler(max_concurrency=1)
+    terminar = threading.Event()
+
+    with turn_deadline(0.1):
+        with pytest.raises(DeadlineExceeded):
+            with scheduler.slot():
+                call_with_deadline(terminar.wait, 5)
+    assert scheduler.get_stats()["active"] == 1
+
+    terminar.set()
+    time.sleep(0.1)
+    assert scheduler.get_stats()["active"] == 0
+
+
+def test_hedging_sin_cupo_libre_no_lanza_copia():
+    """La copia de respaldo necesita un cupo propio; con el planificador lleno no se lanza"""
+    from llm_scheduler import LLMScheduler
+    site = "test_hedge_sin_cupo"
+    for _ in range(30):
+        call_with_deadline(lambda: "rapido", site=site)
+
+    scheduler = LLMScheduler(max_concurrency=1)
+    calls = []
+    before = llm_deadline.get_stats()["hedges_skipped"]
+    with scheduler.slot():
+        result = call_with_deadline(lambda: calls.append(1) or time.sleep(0.2) or "ok", timeout=2.0, hedge=True, site=site)
+    assert result == "ok"
+    assert len(calls) == 1
+    assert llm_deadline.get_stats()["hedges_skipped"] == before + 1
+    assert scheduler.get_stats()["active"] == 0
+
+
+def test_agente_y_cadenas_respetan_el_deadline_del_turno(monkeypatch):
+    """Una cadena o un paso lento del agente no pasan del deadline; el agente abandonado suelta la memoria"""
+    import agente
+
+    class _Lento:
+        memory = "memoria de la sesión"
+
+        def invoke(self, inputs):
+            time.sleep(2)
+            return {"result": "tarde", "output": "tarde"}
+
+    monkeypatch.setitem(agente.qa_chains, "concepto_glamping", _Lento())
+    started = time.monotonic()
+    with turn_deadline(0.2):
+        respuesta = agente.call_chain_safe("concepto_glamping", "¿qué es?")
+    assert respuesta != "tarde"
+    assert time.monotonic() - started < 1.0
+
+    lento = _Lento()
+    started = time.monotonic()
+    with turn_deadline(0.2):
+        ok, _, error = agente.run_agent_safe(lento, "hola")
+    assert not ok and "Timeout" in error
+    assert time.monotonic() - started < 1.0
+    assert lento.memory is None
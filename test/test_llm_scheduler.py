@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test del control de admisión y prioridades para llamadas LLM
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from llm_scheduler import (
+    LLMScheduler, SchedulerBusyError,
+    PRIORITY_RESERVA, PRIORITY_FAQ, PRIORITY_OFF_TOPIC,
+)
+
+
+def test_respeta_limite_de_concurrencia():
+    """Nunca hay más llamadas activas que el límite configurado"""
+    scheduler = LLMScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def work():
+        with scheduler.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak[0] == 2
+    assert scheduler.get_stats()["classes"]["faq"]["admitted"] == 6
+
+
+def test_reserva_se_atiende_antes_que_off_topic():
+    """Con la capacidad ocupada, la reserva en cola pasa antes que el mensaje fuera de tema"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+    release = threading.Event()
+
+    def holder():
+        with scheduler.slot():
+            release.wait(2)
+
+    def queued(priority, name):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    t_holder = threading.Thread(target=holder)
+    t_holder.start()
+    time.sleep(0.05)
+    t_off = threading.Thread(target=queued, args=(PRIORITY_OFF_TOPIC, "off_topic"))
+    t_off.start()
+    time.sleep(0.05)
+    t_res = threading.Thread(target=queued, args=(PRIORITY_RESERVA, "reserva"))
+    t_res.start()
+    time.sleep(0.05)
+
+    release.set()
+    for t in (t_holder, t_off, t_res):
+        t.join()
+
+    assert order == ["reserva", "off_topic"]
+
+
+def test_timeout_en_cola_descarta_solicitud():
+    """Superar el tiempo máximo de espera lanza SchedulerBusyError y cuenta como descarte"""
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeouts={PRIORITY_OFF_TOPIC: 0.05})
+    release = threading.Event()
+
+    def holder():
+        with scheduler.slot():
+            release.wait(2)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    time.sleep(0.05)
+
+    with pytest.raises(SchedulerBusyError):
+        with scheduler.slot(PRIORITY_OFF_TOPIC):
+            pass
+
+    release.set()
+    t.join()
+
+    stats = scheduler.get_stats()
+    assert stats["classes"]["off_topic"]["shed"] == 1
+    assert stats["queued"] == 0
+    # Tras el descarte la capacidad vuelve a estar disponible
+    with scheduler.slot(PRIORITY_FAQ):
+        assert scheduler.get_stats()["active"] == 1
+
+
+def test_slot_anidado_reutiliza_cupo():
+    """Las llamadas anidadas (herramientas del agente) no piden un cupo nuevo"""
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeouts={PRIORITY_FAQ: 0.05})
+
+    with scheduler.priority(PRIORITY_RESERVA):
+        assert scheduler.current_priority() == PRIORITY_RESERVA
+        with scheduler.slot():
+            with scheduler.slot():
+                assert scheduler.get_stats()["active"] == 1
+
+    stats = scheduler.get_stats()
+    assert stats["active"] == 0
+    assert stats["classes"]["reserva"]["admitted"] == 1
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test del índice de sesiones del directorio de memoria
+"""
+
+import sys
+import os
+import json
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_manifest import MemoryManifest
+from session_log import SessionLogStore
+
+
+def _mensaje(i):
+    return {"type": "human" if i % 2 == 0 else "ai", "data": {"content": f"mensaje {i}"}}
+
+
+def test_resumen_sin_recorrer_archivos(tmp_path):
+    """Los totales salen del índice y se actualizan con cada registro"""
+    manifest = MemoryManifest(str(tmp_path / "_manifest.db"))
+    manifest.record("a", "a.jsonl", 100, 10.0, 4)
+    manifest.record("b", "b.jsonl", 300, 20.0, 6)
+    manifest.record("a", "a.jsonl", 150, 30.0, 6)
+    manifest.mark_invalid("c", "c.jsonl", "JSON inválido")
+
+    resumen = manifest.summary()
+    assert resumen["total_files"] == 3
+    assert resumen["total_bytes"] == 450
+    assert resumen["total_messages"] == 12
+    assert resumen["corrupted_files"] == 1
+    assert resumen["oldest_file"] == "b.jsonl"
+    assert resumen["newest_file"] == "a.jsonl"
+    assert [fila["session_id"] for fila in manifest.invalid()] == ["c"]
+
+
+def test_migracion_unica_del_directorio(tmp_path, monkeypatch):
+    """Las memorias JSON se convierten e indexan una vez; las ilegibles van a corrupted/"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+    with open(tmp_path / "antiguo.json", "w", encoding="utf-8") as f:
+        json.dump([_mensaje(0), _mensaje(1)], f, indent=2)
+    with open(tmp_path / "antiguo_backup.json", "w", encoding="utf-8") as f:
+        json.dump([_mensaje(0)], f, indent=2)
+    (tmp_path / "roto.json").write_text("{no es json", encoding="utf-8")
+    agente.memory_log.append("nuevo", "", 0, [_mensaje(0), _mensaje(1), _mensaje(2)])
+    SessionLogStore(str(tmp_path), shard_chars=0).append("plano", "", 0, [_mensaje(0)])
+
+    agente.migrate_memory_layout()
+
+    assert sorted(os.listdir(tmp_path / "corrupted"))[0].startswith("roto.json")
+    assert not (tmp_path / "antiguo.json").exists()
+    assert not (tmp_path / "antiguo_backup.json").exists()
+    assert not (tmp_path / "plano.jsonl").exists()
+    assert agente.memory_log.load("plano")["messages"] == [_mensaje(0)]
+    salud = agente.get_memory_system_health()
+    assert salud["total_files"] == 3
+    assert salud["total_messages"] == 6
+    assert salud["status"] == "healthy"
+
+    # La segunda vez no se vuelve a recorrer el directorio
+    (tmp_path / "otro.json").write_text(json.dumps([_mensaje(0)]), encoding="utf-8")
+    agente.migrate_memory_layout()
+    assert (tmp_path / "otro.json").exists()
+
+
+def test_guardado_actualiza_indice_y_limpieza_usa_el_indice(tmp_path, monkeypatch):
+    """Cada guardado refresca la fila; un registro ilegible se marca y luego se aparta"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+
+    memoria = agente._new_memory("s1")
+    memoria.chat_memory.add_user_message("hola")
+    memoria.chat_memory.add_ai_message("¡Hola! Soy María")
+    assert agente.save_user_memory("s1", memoria)
+    fila = agente.memory_manifest.get("s1")
+    assert fila["messages"] == 2
+    assert fila["size"] == os.path.getsize(agente.memory_log.path("s1"))
+
+    os.makedirs(os.path.dirname(agente.memory_log.path("s2")), exist_ok=True)
+    with open(agente.memory_log.path("s2"), "w", encoding="utf-8") as f:
+        f.write('{"t":"msg","m":{"r":"x","c":"rol desconocido"}}\n')
+    agente.load_user_memory("s2")
+    agente.memory_persister.flush("s2")
+    # El registro ilegible se aparta antes de que el guardado de la memoria nueva lo reemplace
+    assert os.listdir(tmp_path / "corrupted")[0].startswith("s2.jsonl")
+    assert agente.get_memory_system_health()["corrupted_files"] == 0
+
+    agente.memory_manifest.mark_invalid("s1", "s1.jsonl", "prueba")
+    assert agente.get_memory_system_health()["status"] == "warning"
+    assert agente.cleanup_corrupted_memory_files() == 1
+    assert not os.path.exists(agente.memory_log.path("s1"))
+    assert agente.memory_manifest.get("s1") is None
+
+
+def test_una_fila_por_registro_aunque_cambie_la_forma_del_id(tmp_path, monkeypatch):
+    """El id de WhatsApp y su forma saneada comparten fila; la migración une las filas duplicadas"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    manifest = MemoryManifest(str(tmp_path / "_manifest.db"))
+    # Índice de la versión anterior: la migración guardó el nombre del archivo y los turnos el id original
+    manifest.record("whatsapp573001234567", "viejo.jsonl", 10, 10.0, 2)
+    manifest.record("whatsapp:+573001234567", "nuevo.jsonl", 20, 20.0, 4)
+    manifest.set_meta("layout_version", 3)
+    manifest.key = SessionLogStore.safe_id
+    monkeypatch.setattr(agente, "memory_manifest", manifest)
+
+    agente.migrate_memory_layout()
+    assert manifest.summary()["total_files"] == 1
+    assert manifest.get("whatsapp573001234567")["messages"] == 4
+
+    memoria = agente._new_memory("whatsapp:+573001234567")
+    memoria.chat_memory.add_user_message("hola")
+    assert agente.save_user_memory("whatsapp:+573001234567", memoria)
+    assert manifest.summary()["total_files"] == 1
+    assert manifest.get("whatsapp573001234567")["messages"] == 1
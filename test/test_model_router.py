@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test de la política de modelos por punto de llamada con escalamiento
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from model_router import ModelRouter, EscalationExhausted, parse_routes
+
+
+def _router(**kwargs):
+    return ModelRouter(
+        tiers={"fast": "modelo-rapido", "strong": "modelo-capaz"},
+        routes={"parse": ["fast", "strong"], "filter": ["fast"]},
+        factory=lambda name, temperature: name,
+        **kwargs
+    )
+
+
+def test_usa_el_modelo_rapido_si_la_salida_es_valida():
+    """La mayor parte del tráfico se queda en el nivel más rápido"""
+    router = _router()
+    usados = []
+
+    def call(model, name):
+        usados.append(name)
+        return '{"domo": "Antares"}'
+
+    assert router.run("parse", call, validate=lambda text: "domo" in text) == '{"domo": "Antares"}'
+    assert usados == ["modelo-rapido"]
+    assert router.get_stats()["parse"]["escalation_rate"] == 0
+
+
+def test_escala_cuando_la_validacion_falla():
+    """Solo se llama al modelo capaz cuando la salida del rápido no es válida"""
+    router = _router()
+    respuestas = {"modelo-rapido": "no entendí", "modelo-capaz": '{"domo": "Polaris"}'}
+
+    resultado = router.run("parse", lambda model, name: respuestas[name], validate=lambda text: "domo" in text)
+    assert resultado == '{"domo": "Polaris"}'
+    stats = router.get_stats()["parse"]
+    assert stats["escalations"] == 1 and stats["escalation_rate"] == 1.0
+    assert set(stats["avg_ms"]) == {"modelo-rapido", "modelo-capaz"}
+
+
+def test_escala_si_el_modelo_falla_y_reporta_agotamiento():
+    """Un error del modelo rápido escala; si el último tampoco sirve se entrega su salida"""
+    router = _router()
+
+    def call(model, name):
+        if name == "modelo-rapido":
+            raise RuntimeError("Connection error")
+        return "salida inválida"
+
+    with pytest.raises(EscalationExhausted) as excinfo:
+        router.run("parse", call, validate=lambda text: "domo" in text)
+    assert excinfo.value.result == "salida inválida"
+    assert router.get_stats()["parse"]["failures"] == 1
+
+
+def test_rutas_configurables_por_entorno():
+    """MODEL_ROUTES define la cadena de niveles de cada punto de llamada"""
+    assert parse_routes("filter=fast, parse=fast>strong,roto") == {"filter": ["fast"], "parse": ["fast", "strong"]}
+    router = _router()
+    assert router.chain("filter") == ["fast"]
+    assert router.chain("desconocido") == ["fast"]
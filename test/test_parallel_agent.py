@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test de pasos del agente con varias herramientas en paralelo
+"""
+
+import sys
+import os
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.agents import ConversationalAgent
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import AgentAction
+from langchain.tools import Tool
+from langchain_community.llms.fake import FakeListLLM
+
+from parallel_agent import MultiActionConvoOutputParser, ParallelAgentExecutor, MULTI_ACTION_FORMAT_INSTRUCTIONS
+
+PASO_COMPUESTO = (
+    "Thought: Do I need to use a tool? Yes\n"
+    "Action: DomosPreciosDetallados\n"
+    "Action Input: precio del Polaris\n"
+    "Action: ServiciosExternos\n"
+    "Action Input: actividades cerca"
+)
+
+
+def _lenta(nombre, llamadas):
+    def func(query):
+        time.sleep(0.3)
+        llamadas.append(nombre)
+        return f"{nombre}: {query}"
+    return Tool(name=nombre, func=func, description=f"Herramienta {nombre}")
+
+
+def test_parser_devuelve_varias_acciones():
+    """Varios pares Action/Action Input se convierten en una lista de acciones"""
+    acciones = MultiActionConvoOutputParser().parse(PASO_COMPUESTO)
+    assert [(a.tool, a.tool_input) for a in acciones] == [
+        ("DomosPreciosDetallados", "precio del Polaris"),
+        ("ServiciosExternos", "actividades cerca"),
+    ]
+    # Una sola acción sigue funcionando como antes
+    una = MultiActionConvoOutputParser().parse("Action: MenuPrincipal\nAction Input: menú")
+    assert isinstance(una, AgentAction) and una.tool == "MenuPrincipal"
+
+
+def test_pregunta_compuesta_en_una_ronda_y_en_paralelo():
+    """Las dos herramientas corren a la vez y el agente responde en la segunda llamada al LLM"""
+    llamadas = []
+    herramientas = [_lenta("DomosPreciosDetallados", llamadas), _lenta("ServiciosExternos", llamadas)]
+    llm = FakeListLLM(responses=[PASO_COMPUESTO, "Thought: Do I need to use a tool? No\nAI: listo",
+                               "AI: tercera llamada innecesaria"])
+    agente = ConversationalAgent.from_llm_and_tools(
+        llm=llm, tools=herramientas,
+        format_instructions=MULTI_ACTION_FORMAT_INSTRUCTIONS, output_parser=MultiActionConvoOutputParser(),
+    )
+    executor = ParallelAgentExecutor.from_agent_and_tools(
+        agent=agente, tools=herramientas, return_intermediate_steps=True, max_iterations=3,
+        memory=ConversationBufferMemory(memory_key="chat_history", input_key="input", output_key="output"),
+    )
+
+    inicio = time.monotonic()
+    resultado = executor.invoke({"input": "¿cuánto cuesta el Polaris y qué actividades hay cerca?"})
+    duracion = time.monotonic() - inicio
+
+    assert resultado["output"] == "listo"
+    assert llm.i == 2
+    assert sorted(llamadas) == ["DomosPreciosDetallados", "ServiciosExternos"]
+    assert [obs for _, obs in resultado["intermediate_steps"]] == [
+        "DomosPreciosDetallados: precio del Polaris", "ServiciosExternos: actividades cerca"
+    ]
+    assert duracion < 0.55
+
+
+def test_herramientas_en_paralelo_respetan_el_limite_del_planificador():
+    """Solo la primera herramienta reutiliza el cupo del turno; las demás piden uno propio"""
+    import threading
+    from llm_scheduler import LLMScheduler
+
+    scheduler = LLMScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    activas, pico = [0], [0]
+
+    def con_llm(nombre):
+        def func(query):
+            with scheduler.slot():
+                with lock:
+                    activas[0] += 1
+                    pico[0] = max(pico[0], activas[0])
+                time.sleep(0.2)
+                with lock:
+                    activas[0] -= 1
+            return f"{nombre}: {query}"
+        return Tool(name=nombre, func=func, description=f"Herramienta {nombre}")
+
+    nombres = ["DomosPreciosDetallados", "ServiciosExternos", "Actividades"]
+    herramientas = [con_llm(nombre) for nombre in nombres]
+    paso = "Thought: Do I need to use a tool? Yes\n" + "\n".join(
+        f"Action: {nombre}\nAction Input: consulta {nombre}" for nombre in nombres
+    )
+    llm = FakeListLLM(responses=[paso, "Thought: Do I need to use a tool? No\nAI: listo"])
+    agente = ConversationalAgent.from_llm_and_tools(
+        llm=llm, tools=herramientas,
+        format_instructions=MULTI_ACTION_FORMAT_INSTRUCTIONS, output_parser=MultiActionConvoOutputParser(),
+    )
+    executor = ParallelAgentExecutor.from_agent_and_tools(
+        agent=agente, tools=herramientas, max_iterations=3,
+        memory=ConversationBufferMemory(memory_key="chat_history", input_key="input", output_key="output"),
+    )
+
+    # El turno ocupa un cupo durante toda la ejecución del agente
+    with scheduler.slot():
+        assert executor.invoke({"input": "varias cosas"})["output"] == "listo"
+    assert pico[0] <= 2
+    assert scheduler.get_stats()["active"] == 0
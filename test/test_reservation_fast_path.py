@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test del parser determinista de solicitudes de reserva
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agente
+
+ENTRADA = (date.today() + timedelta(days=30)).strftime("%d/%m/%Y")
+SALIDA = (date.today() + timedelta(days=32)).strftime("%d/%m/%Y")
+
+MENSAJE_COMPLETO = f"""Juan Perez
+Maria Lopez
+Centaury
+{ENTRADA} hasta {SALIDA}
+Masajes
+1 mascota
+3001234567
+correo@email.com
+Efectivo
+Tengo una persona en silla de ruedas"""
+
+
+def test_mensaje_bien_formado_sin_llm(monkeypatch):
+    """El formato que pedimos se interpreta completo sin llamar al LLM"""
+    def llm_no_permitido(user_input):
+        raise AssertionError("no debería llamarse al LLM")
+    monkeypatch.setattr(agente, "_parse_reservation_with_llm", llm_no_permitido)
+
+    antes = agente.get_parse_stats("reservation")["deterministic"]
+    datos = agente.parse_reservation_details(MENSAJE_COMPLETO)
+
+    assert datos["nombres_huespedes"] == ["Juan Perez", "Maria Lopez"]
+    assert datos["domo"] == "Centaury"
+    assert (datos["fecha_entrada"], datos["fecha_salida"]) == (ENTRADA, SALIDA)
+    assert datos["servicio_elegido"] == "Masajes"
+    assert datos["adicciones"] == "1 mascota"
+    assert datos["numero_contacto"] == "3001234567"
+    assert datos["email_contacto"] == "correo@email.com"
+    assert datos["metodo_pago"] == "Efectivo"
+    assert datos["comentarios_especiales"] == "Tengo una persona en silla de ruedas"
+    assert agente.get_parse_stats("reservation")["deterministic"] == antes + 1
+
+
+def test_formato_con_etiquetas():
+    """Las líneas con etiqueta "Campo: valor" se asignan por la etiqueta"""
+    datos, faltantes = agente.parse_reservation_fast(
+        f"Nombres: Ana Ruiz y Luis Gómez\nDomo: polaris\nFechas: {ENTRADA} - {SALIDA}\n"
+        "Correo: ana@correo.co\nPago: transferencia\nSomos 2 personas"
+    )
+    assert faltantes == []
+    assert datos["nombres_huespedes"] == ["Ana Ruiz", "Luis Gómez"]
+    assert datos["domo"] == "Polaris"
+    assert datos["numero_acompanantes"] == "2"
+    assert datos["numero_contacto"] == "N/A"
+
+
+def test_numero_de_personas_no_es_el_de_contacto():
+    """ "Número de personas" va al tamaño del grupo; solo teléfono/celular/contacto es el número de contacto"""
+    datos, _ = agente.parse_reservation_fast(
+        f"Nombre: Ana Ruiz\nDomo: polaris\nFechas: {ENTRADA} - {SALIDA}\n"
+        "Número de personas: 4\nNúmero de celular: 3001234567"
+    )
+    assert datos["numero_acompanantes"] == "4"
+    assert datos["numero_contacto"] == "3001234567"
+
+    datos, _ = agente.parse_reservation_fast(f"Ana Ruiz\nPolaris\n{ENTRADA} - {SALIDA}\nNúmero: 3001234567")
+    assert datos["numero_contacto"] == "3001234567"
+
+
+def test_fechas_invalidas_quedan_sin_resolver():
+    """Una fecha que no pasa los validadores no se acepta en el camino rápido"""
+    _, faltantes = agente.parse_reservation_fast("Juan Perez\nSirius\n01/01/2020 hasta 03/01/2020")
+    assert faltantes == ["fecha_entrada", "fecha_salida"]
+
+
+def test_llm_solo_completa_lo_que_falta(monkeypatch):
+    """El LLM se consulta para los campos sin resolver y no pisa los ya validados"""
+    def llm_parcial(user_input):
+        datos = agente.ReservationDetails(nombres_huespedes=["Juan"], domo="Antares",
+                                          fecha_entrada=ENTRADA, fecha_salida=SALIDA).to_dict()
+        return datos
+    monkeypatch.setattr(agente, "_parse_reservation_with_llm", llm_parcial)
+
+    antes = agente.get_parse_stats("reservation")["llm_assisted"]
+    datos = agente.parse_reservation_details(f"Juan Perez\nSirius\nllegamos el {ENTRADA} y nos vamos el otro fin de semana")
+
+    assert datos["nombres_huespedes"] == ["Juan Perez"]
+    assert datos["domo"] == "Sirius"
+    assert datos["fecha_salida"] == SALIDA
+    assert datos["servicio_elegido"] == "ninguno"
+    stats = agente.get_parse_stats("reservation")
+    assert stats["llm_assisted"] == antes + 1
+    assert 0 <= stats["llm_free_share"] <= 1
+
+
+def test_disponibilidad_sin_llm(monkeypatch):
+    """Una consulta con fechas en español se resuelve sin llamar al LLM"""
+    def llm_no_permitido(*args, **kwargs):
+        raise AssertionError("no debería llamarse al LLM")
+    consultas = []
+    monkeypatch.setattr(agente, "call_routed_llm", llm_no_permitido)
+    monkeypatch.setattr(agente, "obtener_disponibilidades_calendario",
+                        lambda *args: consultas.append(args) or {"disponibilidades_por_dia": []})
+
+    agente.handle_availability_request("del 15 al 17 de diciembre, somos 3, domo Polaris")
+
+    fecha_inicio, fecha_fin, domo, personas = consultas[0]
+    assert fecha_inicio.endswith("-12-15") and fecha_fin.endswith("-12-17")
+    assert (domo, personas) == ("polaris", 3)
+    assert agente.get_parse_stats("availability")["deterministic"] >= 1
+
+
+def test_disponibilidad_rechaza_fechas_pasadas(monkeypatch):
+    """El camino sin LLM no consulta el calendario con fechas que ya pasaron"""
+    consultas = []
+    monkeypatch.setattr(agente, "call_routed_llm", lambda *args, **kwargs: None)
+    monkeypatch.setattr(agente, "obtener_disponibilidades_calendario",
+                        lambda *args: consultas.append(args) or {"disponibilidades_por_dia": []})
+
+    respuesta = agente.handle_availability_request("del 01/01/2020 al 03/01/2020")
+
+    assert consultas == []
+    assert "No pude entender las fechas" in respuesta
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test de los esquemas de salida estructurada de reservas y disponibilidad
+"""
+
+import sys
+import os
+from datetime import date
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reservation_schemas import ReservationDetails, AvailabilityQuery
+
+
+def test_reserva_completa_se_convierte_al_formato_del_flujo():
+    """Los datos tipados se entregan con el formato que ya valida el flujo de reservas"""
+    detalles = ReservationDetails(
+        nombres_huespedes="Juan Perez, Maria Lopez",
+        numero_acompanantes=2,
+        domo="Centaury",
+        fecha_entrada="24/08/2025",
+        fecha_salida="30/08/2025",
+        numero_contacto="3001234567",
+    )
+    assert detalles.missing_required() == []
+    datos = detalles.to_dict()
+    assert datos["nombres_huespedes"] == ["Juan Perez", "Maria Lopez"]
+    assert datos["numero_acompanantes"] == "2"
+    assert datos["metodo_pago"] == "No especificado"
+    assert datos["comentarios_especiales"] == "Ninguno"
+
+
+def test_reserva_incompleta_reporta_campos_faltantes():
+    """Los campos obligatorios ausentes se detectan para escalar de modelo"""
+    detalles = ReservationDetails(nombres_huespedes=["Ana"], domo="Polaris")
+    assert detalles.missing_required() == ["fecha_entrada", "fecha_salida"]
+    assert detalles.to_dict()["numero_acompanantes"] == "N/A"
+
+
+def test_consulta_de_disponibilidad_tipada():
+    """Las fechas llegan como date y una consulta sin fechas claras también es completa"""
+    consulta = AvailabilityQuery(fechas_claras=True, fecha_inicio="2025-12-15", fecha_fin="2025-12-17", personas=2)
+    assert consulta.fecha_inicio == date(2025, 12, 15)
+    assert consulta.is_complete()
+    assert not AvailabilityQuery(fechas_claras=True, fecha_inicio="2025-12-15").is_complete()
+    assert AvailabilityQuery(fechas_claras=False).is_complete()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test del recuerdo semántico por usuario sobre turnos pasados
+"""
+
+import sys
+import os
+import zlib
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+
+from semantic_recall import SemanticRecallIndex
+from token_memory import TokenBudgetMemory
+
+
+def _fake_embed(text):
+    """Embedding determinista por bolsa de palabras para no depender de OpenAI"""
+    vector = np.zeros(64, dtype=np.float32)
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip("¿?¡!.,:").encode()) % 64] += 1.0
+    return vector
+
+
+def _index(tmp_path, **kwargs):
+    return SemanticRecallIndex(
+        str(tmp_path),
+        embed_documents=lambda texts: [_fake_embed(t) for t in texts],
+        embed_query=_fake_embed,
+        background=False,
+        **kwargs
+    )
+
+
+def _turnos(*pares):
+    mensajes = []
+    for usuario, asistente in pares:
+        mensajes += [HumanMessage(content=usuario), AIMessage(content=asistente)]
+    return mensajes
+
+
+def test_recupera_turnos_relevantes_de_otra_sesion(tmp_path):
+    """Un huésped que vuelve con otra sesión recupera lo que habló semanas atrás"""
+    index = _index(tmp_path, top_k=1)
+    index.add_messages("cliente-1", "sesion-vieja", _turnos(
+        ("Mi esposa es alérgica al gluten", "Anotado, el desayuno puede ser sin gluten."),
+        ("Qué actividades hay en Guatavita", "Paseos a caballo y jet ski en Tominé."),
+    ))
+
+    resultados = index.search("cliente-1", "el desayuno será sin gluten para mi esposa?", session_id="sesion-nueva")
+    assert len(resultados) == 1
+    assert "gluten" in resultados[0]
+
+
+def test_indexacion_incremental_y_persistente(tmp_path):
+    """Solo se indexan los turnos nuevos y el índice sobrevive a un reinicio"""
+    index = _index(tmp_path)
+    mensajes = _turnos(("hola", "¡Hola! Soy María."))
+    index.add_messages("cliente-2", "s1", mensajes)
+    mensajes += _turnos(("precio del domo antares", "El Antares cuesta $650.000 por noche."))
+    index.add_messages("cliente-2", "s1", mensajes)
+    assert index.get_stats()["indexed_turns"] == 2
+
+    reiniciado = _index(tmp_path)
+    reiniciado.add_messages("cliente-2", "s1", mensajes)
+    assert reiniciado.get_stats()["indexed_turns"] == 0
+    assert "Antares" in reiniciado.search("cliente-2", "cuánto cuesta el antares")[0]
+
+
+def test_excluye_la_ventana_reciente_de_la_sesion(tmp_path):
+    """Los turnos que ya van literales en la memoria no se repiten como recuerdo"""
+    index = _index(tmp_path)
+    index.add_messages("cliente-3", "s1", _turnos(("precio del domo sirius", "El Sirius cuesta $350.000.")))
+    assert index.search("cliente-3", "precio sirius", session_id="s1", before_message_index=0) == []
+
+
+def test_busqueda_lexica_si_fallan_los_embeddings(tmp_path):
+    """Sin embeddings disponibles se recurre a palabras compartidas"""
+    def falla(_):
+        raise RuntimeError("Connection error")
+
+    index = SemanticRecallIndex(str(tmp_path), embed_documents=lambda t: falla(t), embed_query=falla, background=False)
+    index.add_messages("cliente-4", "s1", _turnos(("celebramos aniversario en diciembre", "¡Felicitaciones!")))
+    assert "aniversario" in index.search("cliente-4", "reserva para el aniversario")[0]
+    assert index.get_stats()["lexical_fallbacks"] == 1
+
+
+def test_memoria_inyecta_recuerdos_con_tamano_acotado(tmp_path):
+    """La memoria agrega los recuerdos como mensaje de sistema sin superar su presupuesto"""
+    index = _index(tmp_path)
+    index.add_messages("cliente-5", "vieja", _turnos(("viajo con mi perro labrador", "Aceptamos mascotas.")))
+
+    memory = TokenBudgetMemory(memory_key="chat_history", return_messages=True, input_key="input",
+                               recall_max_tokens=50)
+    memory.recall = lambda query, start: index.search("cliente-5", query, session_id="nueva", before_message_index=start)
+    memory.save_context({"input": "hola"}, {"output": "¡Hola!"})
+
+    enviados = memory.load_memory_variables({"input": "puedo llevar a mi perro?"})["chat_history"]
+    assert isinstance(enviados[0], SystemMessage)
+    assert "labrador" in enviados[0].content
+
+
+def test_chat_solo_acepta_identidad_firmada(monkeypatch):
+    """/chat no recuerda por un user_id suelto ni puede usar ids de WhatsApp"""
+    import agente
+    from itsdangerous import URLSafeTimedSerializer
+
+    monkeypatch.setattr(agente, "CHAT_USER_TOKEN_SECRET", "secreto-de-prueba")
+    firmar = URLSafeTimedSerializer("secreto-de-prueba", salt="chat-user").dumps
+    assert agente.verified_chat_user(firmar("cliente-42")) == "web:cliente-42"
+    assert agente.verified_chat_user("cliente-42") is None
+    assert agente.verified_chat_user(URLSafeTimedSerializer("otro", salt="chat-user").dumps("cliente-42")) is None
+    assert agente.verified_chat_user(firmar("whatsapp:+573001234567")) is None
+    assert agente.verified_chat_user(firmar(":whatsapp:+573001234567")) is None
+
+    monkeypatch.setattr(agente, "CHAT_USER_TOKEN_SECRET", "")
+    assert agente.verified_chat_user(firmar("cliente-42")) is None
+
+    client = agente.app.test_client()
+    for session_id in ("whatsapp:+573001234567", ":whatsapp:+573001234567", "+whatsapp+573001234567", " WhatsApp:+57"):
+        respuesta = client.post("/chat", json={"input": "hola", "session_id": session_id})
+        assert respuesta.status_code == 400, session_id
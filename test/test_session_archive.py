@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test de la retención y el archivo de sesiones inactivas
+"""
+
+import sys
+import os
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_manifest import MemoryManifest
+from session_archive import SessionArchive
+from session_log import SessionLogStore
+
+
+def _mensaje(i):
+    return {"type": "human" if i % 2 == 0 else "ai", "data": {"content": f"mensaje {i}"}}
+
+
+def test_paquete_se_lee_por_sesion(tmp_path):
+    """Un paquete guarda varios registros y se puede recuperar uno solo"""
+    for nombre in ("a", "b"):
+        (tmp_path / f"{nombre}.jsonl").write_text(f'{{"t":"msg","m":"{nombre}"}}\n' * 50, encoding="utf-8")
+    archivo = SessionArchive(str(tmp_path / "archive"))
+
+    paquete = archivo.write_bundle({"a.jsonl": str(tmp_path / "a.jsonl"), "b.jsonl": str(tmp_path / "b.jsonl")})
+    archivo.restore(paquete, "b.jsonl", str(tmp_path / "hot" / "b.jsonl"))
+
+    assert (tmp_path / "hot" / "b.jsonl").read_text(encoding="utf-8") == (tmp_path / "b.jsonl").read_text(encoding="utf-8")
+    assert archivo.get_stats()["ratio"] > 5
+    assert archivo.write_bundle({"a.jsonl": str(tmp_path / "a.jsonl")}) != paquete
+
+
+def test_sesiones_inactivas_se_archivan_y_vuelven(tmp_path, monkeypatch):
+    """Una sesión vieja sale del almacenamiento activo y se recupera cuando el cliente vuelve"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+    monkeypatch.setattr(agente, "session_archive", SessionArchive(str(tmp_path / "archive")))
+
+    historial = [_mensaje(i) for i in range(6)]
+    for user_id in ("viejo", "reciente"):
+        agente.memory_log.append(user_id, "resumen", 2, historial)
+        agente._index_session(user_id, len(historial))
+    ruta_vieja = agente.memory_log.path("viejo")
+    hace_90_dias = time.time() - 90 * 86400
+    os.utime(ruta_vieja, (hace_90_dias, hace_90_dias))
+    agente._index_session("viejo", len(historial))
+
+    assert agente.archive_idle_sessions(max_idle_days=30) == 1
+    assert not os.path.exists(ruta_vieja)
+    assert os.path.exists(agente.memory_log.path("reciente"))
+    salud = agente.get_memory_system_health()
+    assert salud["total_files"] == 1
+    assert salud["archived_sessions"] == 1
+
+    memoria = agente.load_user_memory("viejo")
+    assert [m.content for m in memoria.chat_memory.messages] == [m["data"]["content"] for m in historial]
+    assert memoria.summary == "resumen"
+    assert os.path.exists(ruta_vieja)
+    assert agente.get_memory_system_health()["archived_sessions"] == 0
+
+
+def test_no_se_borra_un_registro_que_cambio(tmp_path, monkeypatch):
+    """Se mira la fecha del propio registro, antes de empaquetar y otra vez antes de borrarlo"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_manifest", MemoryManifest(str(tmp_path / "_manifest.db")))
+    archivo = SessionArchive(str(tmp_path / "archive"))
+    monkeypatch.setattr(agente, "session_archive", archivo)
+
+    hace_90_dias = time.time() - 90 * 86400
+    for user_id in ("activo", "durante"):
+        agente.memory_log.append(user_id, "", 0, [_mensaje(0), _mensaje(1)])
+        os.utime(agente.memory_log.path(user_id), (hace_90_dias, hace_90_dias))
+        agente._index_session(user_id, 2)
+    # El índice quedó viejo pero el registro se escribió hace poco
+    os.utime(agente.memory_log.path("activo"))
+
+    write_bundle = archivo.write_bundle
+
+    def empaquetar_mientras_llega_un_mensaje(files):
+        bundle = write_bundle(files)
+        agente.memory_log.append_messages("durante", [_mensaje(2)])
+        return bundle
+
+    monkeypatch.setattr(archivo, "write_bundle", empaquetar_mientras_llega_un_mensaje)
+
+    assert agente.archive_idle_sessions(max_idle_days=30) == 0
+    assert agente.memory_log.load("activo")["messages"] == [_mensaje(0), _mensaje(1)]
+    assert len(agente.memory_log.load("durante")["messages"]) == 3
+    assert agente.get_memory_system_health()["archived_sessions"] == 0
+
+
+def test_importar_no_arranca_la_retencion(monkeypatch):
+    """El hilo de retención lo arranca el servidor; importar agente no archiva nada"""
+    import threading
+    import agente
+    assert "memory-retention" not in [hilo.name for hilo in threading.enumerate()]
+
+    arrancado = threading.Event()
+    monkeypatch.setattr(agente, "MEMORY_RETENTION_DAYS", 30)
+    monkeypatch.setattr(agente, "_retention_loop", arrancado.set)
+    agente.start_memory_retention()
+    assert arrancado.wait(5)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test de la caché acotada de sesiones
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_cache import SessionCache
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def test_desalojo_lru_con_escritura_previa():
+    """Al superar la capacidad sale la sesión menos usada y se escribe lo pendiente"""
+    desalojadas = []
+    cache = SessionCache(max_entries=2, idle_ttl=0, on_evict=lambda sid, valor: desalojadas.append(sid))
+    cache.get_or_load("a", lambda sid: f"memoria {sid}")
+    cache.get_or_load("b", lambda sid: f"memoria {sid}")
+    cache.get_or_load("a", lambda sid: "no debería cargarse")
+    cache.get_or_load("c", lambda sid: f"memoria {sid}")
+
+    assert desalojadas == ["b"]
+    assert "a" in cache and "c" in cache and len(cache) == 2
+    stats = cache.get_stats()
+    assert stats["evicted_lru"] == 1 and stats["hits"] == 1 and stats["hit_rate"] == 0.25
+
+
+def test_desalojo_por_inactividad_y_recarga():
+    """Las sesiones inactivas salen y vuelven a cargarse en el siguiente mensaje"""
+    reloj = Reloj()
+    cargas = []
+    cache = SessionCache(max_entries=100, idle_ttl=60, clock=reloj)
+
+    def cargar(sid):
+        cargas.append(sid)
+        return {"current_flow": "none"}
+
+    for numero in range(50):
+        cache.get_or_load(f"sesion-{numero}", cargar)
+    reloj.ahora = 30
+    cache.get_or_load("sesion-0", cargar)
+    reloj.ahora = 61
+    assert cache.evict_idle() == 49
+    assert len(cache) == 1
+
+    cache.get_or_load("sesion-1", cargar)
+    assert cargas.count("sesion-1") == 2
+    assert cache.get_stats()["evicted_idle"] == 49
+
+
+def test_consulta_sin_cargar():
+    """get() no carga ni cuenta como acceso"""
+    cache = SessionCache(max_entries=10)
+    assert cache.get("x") is None
+    cache.get_or_load("x", lambda sid: {"current_flow": "reserva"})
+    assert cache.get("x")["current_flow"] == "reserva"
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_sesion_desalojada_se_guarda_y_se_rehidrata(tmp_path, monkeypatch):
+    """Una memoria pendiente no se pierde al desalojarla y se recarga igual del disco"""
+    import agente
+    from session_log import SessionLogStore
+    from write_behind import WriteBehindPersister
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    monkeypatch.setattr(agente, "memory_persister", WriteBehindPersister(agente.save_user_memory, interval=60))
+
+    memoria = agente.rehydrate_user_memory("573001234567")
+    memoria.chat_memory.add_user_message("hola")
+    memoria.chat_memory.add_ai_message("¡Bienvenido!")
+    agente.memory_persister.mark_dirty("573001234567", memoria)
+    # Mientras no se guarde, la sesión se rehidrata con la memoria pendiente
+    assert agente.rehydrate_user_memory("573001234567") is memoria
+
+    agente._write_back_session("573001234567", memoria)
+    recargada = agente.rehydrate_user_memory("573001234567")
+    assert recargada is not memoria
+    assert [m.content for m in recargada.chat_memory.messages] == ["hola", "¡Bienvenido!"]
+    agente.memory_persister.close()
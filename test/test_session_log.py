@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test del registro de sesiones de solo anexado
+"""
+
+import sys
+import os
+import json
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_log import SessionLogStore
+
+
+def _mensaje(i):
+    return {"type": "human" if i % 2 == 0 else "ai", "data": {"content": f"mensaje {i}"}}
+
+
+def test_cada_turno_agrega_solo_lo_nuevo(tmp_path):
+    """El costo por turno es constante: se escriben solo los dos mensajes nuevos"""
+    store = SessionLogStore(str(tmp_path))
+    historial = []
+    tamanos = []
+    for turno in range(30):
+        historial += [_mensaje(2 * turno), _mensaje(2 * turno + 1)]
+        antes = os.path.getsize(store.path("s1")) if store.exists("s1") else 0
+        store.append("s1", "", 0, historial)
+        tamanos.append(os.path.getsize(store.path("s1")) - antes)
+
+    assert max(tamanos[1:]) - min(tamanos[1:]) <= 2
+    datos = SessionLogStore(str(tmp_path)).load("s1")
+    assert datos["messages"] == historial
+
+
+def test_resumen_y_ultimo_mensaje_reescrito(tmp_path):
+    """Los cambios de resumen y el reemplazo del último mensaje se registran y se reproducen"""
+    store = SessionLogStore(str(tmp_path))
+    historial = [_mensaje(0), _mensaje(1)]
+    store.append("s1", "", 0, historial)
+    historial[1] = {"type": "ai", "data": {"content": "reemplazado"}}
+    assert store.append("s1", "cliente pregunta por Polaris", 2, historial) == 2
+
+    datos = SessionLogStore(str(tmp_path)).load("s1")
+    assert datos["summary"] == "cliente pregunta por Polaris"
+    assert datos["summarized_count"] == 2
+    assert datos["messages"][1]["data"]["content"] == "reemplazado"
+
+
+def test_recupera_escritura_interrumpida(tmp_path):
+    """Una línea incompleta al final se descarta y el archivo queda utilizable"""
+    store = SessionLogStore(str(tmp_path))
+    store.append("s1", "", 0, [_mensaje(0), _mensaje(1)])
+    with open(store.path("s1"), "a", encoding="utf-8") as f:
+        f.write('{"t":"msg","m":{"type":"human","da')
+
+    nuevo = SessionLogStore(str(tmp_path))
+    assert len(nuevo.load("s1")["messages"]) == 2
+    assert nuevo.get_stats()["recovered"] == 1
+    nuevo.append("s1", "", 0, [_mensaje(0), _mensaje(1), _mensaje(2)])
+    assert len(SessionLogStore(str(tmp_path)).load("s1")["messages"]) == 3
+
+
+def test_compacta_registros_obsoletos(tmp_path):
+    """Con demasiados registros obsoletos la sesión se reescribe en una instantánea"""
+    store = SessionLogStore(str(tmp_path), compact_after=3)
+    historial = [_mensaje(0)]
+    for version in range(5):
+        store.append("s1", f"resumen {version}", 0, historial)
+
+    with open(store.path("s1"), encoding="utf-8") as f:
+        registros = [json.loads(linea) for linea in f]
+    assert len(registros) <= 5
+    assert store.get_stats()["compactions"] == 2
+    assert SessionLogStore(str(tmp_path)).load("s1")["summary"] == "resumen 4"
+
+
+def test_memoria_json_anterior_se_convierte(tmp_path, monkeypatch):
+    """Una memoria guardada en el formato JSON anterior se carga y pasa al registro"""
+    import agente
+    monkeypatch.setattr(agente, "MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(agente, "memory_log", SessionLogStore(str(tmp_path)))
+    with open(tmp_path / "antiguo.json", "w", encoding="utf-8") as f:
+        json.dump({"summary": "resumen", "summarized_count": 0, "messages": [_mensaje(0), _mensaje(1)]}, f)
+
+    memoria = agente.load_user_memory("antiguo")
+
+    assert [m.content for m in memoria.chat_memory.messages] == ["mensaje 0", "mensaje 1"]
+    assert not (tmp_path / "antiguo.json").exists()
+    assert agente.memory_log.load("antiguo")["summary"] == "resumen"
+
+
+def _mensaje_langchain(i):
+    from langchain.schema import messages_to_dict, HumanMessage, AIMessage
+    tipo = HumanMessage if i % 2 == 0 else AIMessage
+    return messages_to_dict([tipo(content=f"Quiero reservar el domo Polaris, mensaje {i}")])[0]
+
+
+def test_formato_compacto_y_comprimido(tmp_path):
+    """Los mensajes se guardan sin el sobre de langchain y la instantánea grande va comprimida"""
+    historial = [_mensaje_langchain(i) for i in range(200)]
+    legado = tmp_path / "legado.json"
+    with open(legado, "w", encoding="utf-8") as f:
+        json.dump(historial, f, ensure_ascii=False, indent=2)
+
+    store = SessionLogStore(str(tmp_path), compress_above=4096)
+    store.compact("s1", "", 0, historial)
+
+    assert os.path.getsize(store.path("s1")) * 5 < os.path.getsize(legado)
+    assert store.get_stats()["packed_snapshots"] == 1
+    from langchain.schema import messages_from_dict
+    cargados = messages_from_dict(SessionLogStore(str(tmp_path)).load("s1")["messages"])
+    assert [m.content for m in cargados] == [m["data"]["content"] for m in historial]
+    assert cargados[1].type == "ai"
+
+
+def test_lee_ultimos_n_mensajes(tmp_path):
+    """tail() devuelve solo los últimos mensajes, incluidos los anexados tras la instantánea"""
+    store = SessionLogStore(str(tmp_path), compress_above=1024)
+    historial = [_mensaje_langchain(i) for i in range(100)]
+    store.append("s1", "resumen", 40, historial)
+    historial += [_mensaje_langchain(100), _mensaje_langchain(101)]
+    store.append("s1", "resumen", 40, historial)
+
+    ultimos = SessionLogStore(str(tmp_path)).tail("s1", 3)
+    assert ultimos["total"] == 102
+    assert ultimos["summary"] == "resumen"
+    assert [m["data"]["content"] for m in ultimos["messages"]] == [
+        m["data"]["content"] for m in historial[-3:]
+    ]
+
+
+def test_lee_registros_del_formato_anterior(tmp_path):
+    """Un registro JSONL con el sobre completo de messages_to_dict se sigue leyendo"""
+    store = SessionLogStore(str(tmp_path), compress_above=4096)
+    viejo = [_mensaje_langchain(0), _mensaje_langchain(1)]
+    os.makedirs(os.path.dirname(store.path("s1")), exist_ok=True)
+    with open(store.path("s1"), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"t": "meta", "v": 1, "summary": "", "summarized_count": 0}) + "\n")
+        for mensaje in viejo:
+            f.write(json.dumps({"t": "msg", "m": mensaje}) + "\n")
+
+    assert store.load("s1")["messages"][0]["data"]["content"] == viejo[0]["data"]["content"]
+    # Sin cambios no se reescribe nada aunque el formato guardado sea el anterior
+    assert store.append("s1", "", 0, viejo) == 0
+
+
+def test_registros_repartidos_por_hash(tmp_path):
+    """Cada sesión vive en una carpeta de hash y no en el directorio raíz"""
+    store = SessionLogStore(str(tmp_path))
+    for i in range(20):
+        store.append(f"whatsapp57300{i}", "", 0, [_mensaje(0)])
+
+    assert not [nombre for nombre in os.listdir(tmp_path) if nombre.endswith(".jsonl")]
+    carpetas = [nombre for nombre in os.listdir(tmp_path) if store.is_shard_dir(nombre)]
+    assert len(carpetas) > 1
+    assert os.path.dirname(os.path.dirname(store.path("whatsapp573001"))) == str(tmp_path)
+
+
+def test_anexa_mensajes_sin_leer_el_historial(tmp_path):
+    """Los turnos de una sesión no cargada se anexan; una cola incompleta se recupera antes"""
+    store = SessionLogStore(str(tmp_path))
+    assert store.append_messages("s1", [_mensaje(0), _mensaje(1)]) == 3
+    assert store.append_messages("s1", [_mensaje(2)]) == 1
+    with open(store.path("s1"), "ab") as f:
+        f.write(b'{"t":"msg","m":{"r":"h"')
+
+    store = SessionLogStore(str(tmp_path))
+    assert store.append_messages("s1", [_mensaje(3)]) == 1
+    data = SessionLogStore(str(tmp_path)).load("s1")
+    assert [m["data"]["content"] for m in data["messages"]] == [f"mensaje {i}" for i in range(4)]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test del procesamiento ordenado por sesión y la agrupación de ráfagas de mensajes
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_queue import SessionTurnQueue
+
+
+def test_sin_ventana_no_agrupa():
+    """Con ventana 0 cada mensaje es su propio turno"""
+    queue = SessionTurnQueue(coalesce_window=0)
+    assert queue.collect("whatsapp:+57300", "hola") == "hola"
+    assert queue.collect("whatsapp:+57300", "quiero info") == "quiero info"
+    assert queue.get_stats()["turns"] == 2
+
+
+def test_rafaga_se_fusiona_en_un_turno():
+    """Tres mensajes seguidos producen un solo turno con el texto fusionado"""
+    queue = SessionTurnQueue(coalesce_window=0.2)
+    results = []
+
+    def send(msg):
+        results.append(queue.collect("whatsapp:+57300", msg))
+
+    threads = []
+    for msg in ["hola", "quiero info", "del antares"]:
+        t = threading.Thread(target=send, args=(msg,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+
+    merged = [r for r in results if r is not None]
+    assert len(merged) == 1, f"Se esperaba un solo líder: {results}"
+    assert merged[0] == "hola\nquiero info\ndel antares"
+    assert queue.get_stats()["coalesced"] == 2
+
+
+def test_sesiones_distintas_no_se_mezclan():
+    """Mensajes de números distintos nunca se fusionan"""
+    queue = SessionTurnQueue(coalesce_window=0.1)
+    results = {}
+
+    def send(session, msg):
+        results[session] = queue.collect(session, msg)
+
+    a = threading.Thread(target=send, args=("a", "hola"))
+    b = threading.Thread(target=send, args=("b", "precios"))
+    a.start(); b.start(); a.join(); b.join()
+    assert results == {"a": "hola", "b": "precios"}
+
+
+def test_turnos_de_una_sesion_son_exclusivos_y_ordenados():
+    """Los turnos de una misma sesión se ejecutan uno a la vez y en orden de llegada"""
+    queue = SessionTurnQueue()
+    active = []
+    max_active = []
+    order = []
+    lock = threading.Lock()
+
+    def run_turn(i):
+        with queue.turn("session-1"):
+            with lock:
+                active.append(i)
+                max_active.append(len(active))
+                order.append(i)
+            time.sleep(0.02)
+            with lock:
+                active.remove(i)
+
+    threads = []
+    for i in range(5):
+        t = threading.Thread(target=run_turn, args=(i,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.005)
+    for t in threads:
+        t.join()
+
+    assert max(max_active) == 1
+    assert order == [0, 1, 2, 3, 4]
+    # El slot se libera al terminar todos los turnos
+    assert queue.get_stats()["active_sessions"] == 0
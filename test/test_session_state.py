@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test del estado de conversación compartido entre workers
+"""
+
+import sys
+import os
+import threading
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_state import SessionStateStore, SQLiteStateBackend, SQLAlchemyStateBackend
+
+
+def _estado_nuevo(session_id=None):
+    return {"current_flow": "none", "reserva_step": 0, "reserva_data": {}, "waiting_for_availability": False}
+
+
+def test_dos_workers_comparten_el_flujo_de_reserva(tmp_path):
+    """Lo que un worker deja en el estado lo ve el otro en el siguiente turno"""
+    ruta = str(tmp_path / "estado.db")
+    worker_a = SessionStateStore(SQLiteStateBackend(ruta), _estado_nuevo)
+    worker_b = SessionStateStore(SQLiteStateBackend(ruta), _estado_nuevo)
+
+    with worker_a.turn("573001234567") as estado:
+        estado["current_flow"] = "reserva"
+        estado["reserva_step"] = 1
+
+    with worker_b.turn("573001234567") as estado:
+        assert (estado["current_flow"], estado["reserva_step"]) == ("reserva", 1)
+        estado["reserva_data"] = {"domo": "Polaris"}
+
+    assert worker_a.load("573001234567")["reserva_data"] == {"domo": "Polaris"}
+
+
+def test_turnos_concurrentes_solo_aplican_lo_que_cambiaron(tmp_path):
+    """Dos turnos simultáneos que tocan claves distintas no se pisan"""
+    store = SessionStateStore(SQLiteStateBackend(str(tmp_path / "estado.db")), _estado_nuevo)
+    with store.turn("s1") as primero:
+        primero["waiting_for_availability"] = True
+        # Mientras tanto otro worker avanza la reserva y guarda
+        otro = SessionStateStore(SQLiteStateBackend(str(tmp_path / "estado.db")), _estado_nuevo)
+        with otro.turn("s1") as segundo:
+            segundo["current_flow"] = "reserva"
+
+    final = store.load("s1")
+    assert final["waiting_for_availability"] is True
+    assert final["current_flow"] == "reserva"
+
+
+def test_actualizaciones_atomicas_por_sesion(tmp_path):
+    """Las lecturas-modificaciones concurrentes no pierden actualizaciones"""
+    backend = SQLiteStateBackend(str(tmp_path / "estado.db"))
+
+    def sumar():
+        for _ in range(20):
+            backend.update("s1", lambda estado: {"turnos": (estado or {}).get("turnos", 0) + 1})
+
+    hilos = [threading.Thread(target=sumar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert backend.load("s1") == {"turnos": 80}
+
+
+def test_turno_sin_cambios_no_escribe(tmp_path):
+    """Un turno de menú que no toca el estado no escribe en el backend"""
+    store = SessionStateStore(SQLiteStateBackend(str(tmp_path / "estado.db")), _estado_nuevo)
+    with store.turn("s1") as estado:
+        assert store.get("s1") is estado
+    stats = store.get_stats()
+    assert stats["writes"] == 0 and stats["unchanged"] == 1 and stats["sessions"] == 0
+
+
+def test_backend_de_base_de_datos(tmp_path):
+    """El backend SQLAlchemy guarda el estado en la tabla de la aplicación"""
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'app.db'}"
+    db = SQLAlchemy(app)
+
+    class SessionState(db.Model):
+        __tablename__ = "session_state"
+        session_id = db.Column(db.String(100), primary_key=True)
+        state = db.Column(db.Text, nullable=False)
+        version = db.Column(db.Integer, nullable=False, default=0)
+        updated_at = db.Column(db.DateTime)
+
+    with app.app_context():
+        db.create_all()
+
+    store = SessionStateStore(SQLAlchemyStateBackend(db, app, SessionState), _estado_nuevo)
+    for paso in (1, 2):
+        with store.turn("s1") as estado:
+            estado["reserva_step"] = paso
+
+    assert store.load("s1")["reserva_step"] == 2
+    with app.app_context():
+        assert db.session.get(SessionState, "s1").version == 2
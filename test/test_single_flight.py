@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test de la agrupación de solicitudes idénticas concurrentes (single-flight)
+"""
+
+import sys
+import os
+import threading
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from single_flight import SingleFlight, normalize_key
+
+
+def _run_concurrently(flight, site, keys, fn):
+    results = [None] * len(keys)
+    errors = [None] * len(keys)
+
+    def worker(i, key):
+        try:
+            results[i] = flight.do(site, key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i, k)) for i, k in enumerate(keys)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_normaliza_mayusculas_y_puntuacion():
+    """Variantes triviales de la misma pregunta producen la misma clave"""
+    assert normalize_key("¿Cuáles son los PRECIOS?") == normalize_key("cuáles son los  precios")
+
+
+def test_solicitudes_identicas_comparten_una_llamada():
+    """Cinco usuarios con la misma pregunta generan una sola llamada upstream"""
+    flight = SingleFlight()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.1)
+        return "precios"
+
+    keys = ["¿Precios?", "precios", "PRECIOS", "precios!", " precios "]
+    results, errors = _run_concurrently(flight, "chain:domos_precios", keys, upstream)
+
+    assert len(calls) == 1
+    assert results == ["precios"] * 5
+    assert errors == [None] * 5
+    assert flight.get_stats()["shared"] == 4
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_claves_distintas_no_se_mezclan():
+    """Puntos de llamada distintos con el mismo texto ejecutan llamadas separadas"""
+    flight = SingleFlight()
+    assert flight.do("menu", "1", lambda: "domos") == "domos"
+    assert flight.do("topic_filter", "1", lambda: "SI") == "SI"
+    assert flight.get_stats()["calls"] == 2
+
+
+def test_error_del_lider_se_propaga_a_seguidores():
+    """Si la llamada compartida falla, todos reciben el error y la siguiente reintenta"""
+    flight = SingleFlight()
+
+    def upstream():
+        time.sleep(0.1)
+        raise RuntimeError("Rate limit reached")
+
+    results, errors = _run_concurrently(flight, "menu", ["1", "1", "1"], upstream)
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+    assert flight.do("menu", "1", lambda: "ok") == "ok"
+
+
+def test_seguidor_reintenta_si_el_lider_agota_su_turno():
+    """Un timeout o descarte del líder no se hereda: el seguidor repite con su propio turno"""
+    from llm_deadline import DeadlineExceeded
+    flight = SingleFlight()
+    lider_entro = threading.Event()
+    llamadas = []
+
+    def upstream():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            lider_entro.set()
+            time.sleep(0.1)
+            raise DeadlineExceeded("Timeout del líder")
+        return "domos"
+
+    errores, resultados = [], []
+
+    def lider():
+        try:
+            flight.do("menu", "1", upstream)
+        except DeadlineExceeded as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=lider)
+    hilo.start()
+    lider_entro.wait(1)
+    resultados.append(flight.do("menu", "1", upstream))
+    hilo.join()
+
+    assert len(errores) == 1
+    assert resultados == ["domos"]
+    assert flight.get_stats()["retried"] == 1
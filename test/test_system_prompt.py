@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test del prefijo de sistema estático y la limpieza de memorias antiguas
+"""
+
+import sys
+import os
+import importlib
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import HumanMessage, AIMessage, messages_to_dict
+
+import system_prompt
+from system_prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_HASH, strip_legacy_system_messages
+
+INSTRUCCIONES_ANTIGUAS = (
+    "Hola, tu nombre es Maria. Eres una asistente experta en Glamping Brillo de Luna. "
+    "REGLAS IMPORTANTES: 1. SIEMPRE usa las herramientas disponibles..."
+)
+SALUDO_ANTIGUO = "¡Hola! Mi nombre es María y soy la asistente virtual del Glamping Brillo de Luna."
+
+
+def test_prefijo_identico_entre_cargas():
+    """El prefijo y su hash no cambian entre cargas del módulo"""
+    recargado = importlib.reload(system_prompt)
+    assert recargado.SYSTEM_PROMPT == SYSTEM_PROMPT
+    assert recargado.SYSTEM_PROMPT_HASH == SYSTEM_PROMPT_HASH
+    assert "RespuestaEmpaticaYRedirection" in SYSTEM_PROMPT
+
+
+def test_quita_instrucciones_y_saludo_serializados():
+    """Las memorias guardadas pierden el turno de instrucciones y el saludo fijo"""
+    mensajes = messages_to_dict([
+        HumanMessage(content=INSTRUCCIONES_ANTIGUAS),
+        AIMessage(content=SALUDO_ANTIGUO),
+        HumanMessage(content="hola"),
+        AIMessage(content="¡Hola! ¿En qué te ayudo?"),
+    ])
+    limpios, eliminados = strip_legacy_system_messages(mensajes)
+    assert eliminados == 2
+    assert [m["data"]["content"] for m in limpios] == ["hola", "¡Hola! ¿En qué te ayudo?"]
+
+
+def test_no_toca_historiales_sin_instrucciones():
+    """Un historial que ya solo tiene turnos reales se deja igual"""
+    mensajes = [HumanMessage(content="Eres muy amable"), AIMessage(content="¡Gracias!")]
+    limpios, eliminados = strip_legacy_system_messages(mensajes)
+    assert eliminados == 0
+    assert limpios == mensajes
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test de la memoria con presupuesto de tokens y resumen incremental
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import SystemMessage
+
+from token_memory import TokenBudgetMemory, count_tokens, truncate_to_tokens
+
+
+def _conversar(memory, turnos):
+    for i in range(turnos):
+        memory.save_context({"input": f"Pregunta número {i} sobre el domo Antares"},
+                            {"output": f"Respuesta número {i}: el domo Antares tiene jacuzzi privado."})
+
+
+def _tokens(messages):
+    return sum(count_tokens(str(m.content)) for m in messages)
+
+
+def test_prompt_no_crece_con_la_conversacion():
+    """Con 10 o 60 turnos el historial enviado al agente tiene el mismo orden de tamaño"""
+    corta = TokenBudgetMemory(memory_key="chat_history", return_messages=True, input_key="input",
+                              keep_last_turns=3, fold_batch_turns=2)
+    larga = TokenBudgetMemory(memory_key="chat_history", return_messages=True, input_key="input",
+                              keep_last_turns=3, fold_batch_turns=2)
+    _conversar(corta, 10)
+    _conversar(larga, 60)
+
+    enviados_corta = corta.load_memory_variables({})["chat_history"]
+    enviados_larga = larga.load_memory_variables({})["chat_history"]
+
+    # El historial completo se conserva
+    assert len(larga.chat_memory.messages) == 120
+    assert _tokens(enviados_larga) <= _tokens(enviados_corta) + larga.summary_max_tokens
+    assert _tokens(enviados_larga) <= larga.max_token_limit
+
+
+def test_resumen_incremental_con_summarizer():
+    """Los turnos viejos se pliegan en el resumen y los últimos quedan literales"""
+    llamadas = []
+
+    def summarizer(previo, transcripcion):
+        llamadas.append(transcripcion)
+        return f"{previo} +{transcripcion.count('Usuario:')} turnos".strip()
+
+    memory = TokenBudgetMemory(memory_key="chat_history", return_messages=True, input_key="input",
+                               keep_last_turns=2, fold_batch_turns=2, summarizer=summarizer)
+    _conversar(memory, 8)
+
+    enviados = memory.load_memory_variables({})["chat_history"]
+    assert isinstance(enviados[0], SystemMessage)
+    assert "turnos" in enviados[0].content
+    assert enviados[-1].content.startswith("Respuesta número 7")
+    # Se resume por lotes, no en cada turno
+    assert 1 <= len(llamadas) <= 3
+    assert memory.summarized_count + len(enviados) - 1 == len(memory.chat_memory.messages)
+
+
+def test_resumen_local_si_el_summarizer_falla():
+    """Si el LLM no puede resumir se usa un resumen extractivo acotado"""
+    def summarizer(previo, transcripcion):
+        raise RuntimeError("Rate limit reached")
+
+    memory = TokenBudgetMemory(memory_key="chat_history", return_messages=True, input_key="input",
+                               keep_last_turns=1, fold_batch_turns=1, summary_max_tokens=40,
+                               summarizer=summarizer)
+    _conversar(memory, 6)
+    assert memory.summary
+    assert count_tokens(memory.summary) <= 40
+
+
+def test_truncar_por_tokens():
+    """El recorte de prompts se hace por tokens y agrega el sufijo indicado"""
+    texto = "palabra " * 500
+    recortado = truncate_to_tokens(texto, 50, "[truncado]")
+    assert recortado.endswith("[truncado]")
+    assert count_tokens(recortado) <= 55
+    assert truncate_to_tokens("corto", 50) == "corto"
+
+
+def test_memoria_de_respaldo_conserva_el_presupuesto(monkeypatch):
+    """Si falla la creación normal, la memoria de respaldo sigue siendo TokenBudgetMemory"""
+    import agente
+
+    def fallar(user_id=None):
+        raise RuntimeError("sin embeddings")
+
+    monkeypatch.setattr(agente, "_new_memory", fallar)
+    memoria = agente._create_fresh_memory("respaldo")
+    assert isinstance(memoria, TokenBudgetMemory)
+    assert memoria.summary == ""
+    assert memoria.max_token_limit == agente.MEMORY_TOKEN_BUDGET
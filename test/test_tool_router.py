@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test de la selección de herramientas por turno
+"""
+
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.tools import Tool
+
+from tool_router import ToolSelector
+
+
+def _tool(name, description):
+    return Tool(name=name, func=lambda q: name, description=description)
+
+
+HERRAMIENTAS = [
+    _tool("SolicitarDatosReserva", "Iniciar el proceso de reserva cuando el usuario quiere reservar."),
+    _tool("DomosPreciosDetallados", "Devuelve los precios de los domos por noche."),
+    _tool("ServiciosExternos", "Actividades, turismo, paseos a caballo y jet ski en Guatavita."),
+    _tool("SugerenciasMovilidadReducida", "Silla de ruedas, movilidad reducida, accesibilidad y adaptaciones."),
+    _tool("PoliticasPrivacidad", "Políticas de privacidad y manejo de datos personales."),
+    _tool("MenuPrincipal", "Menú principal de opciones y ayuda."),
+]
+
+
+def _nombres(herramientas):
+    return [t.name for t in herramientas]
+
+
+def test_selecciona_relevantes_y_siempre_activas():
+    """Solo se ofrecen las herramientas del tema más las siempre activas, en el orden original"""
+    selector = ToolSelector(HERRAMIENTAS, top_k=1, always_on=["SolicitarDatosReserva", "MenuPrincipal"])
+    elegidas = _nombres(selector.select("mi papá usa silla de ruedas, hay accesibilidad?"))
+    assert elegidas == ["SolicitarDatosReserva", "SugerenciasMovilidadReducida", "MenuPrincipal"]
+    assert selector.get_stats()["lexical_fallbacks"] == 1
+
+
+def test_usa_embeddings_de_descripciones_una_vez():
+    """Las descripciones se embeben una sola vez y la consulta elige por similitud"""
+    llamadas = []
+
+    def embed_documents(textos):
+        llamadas.append(len(textos))
+        return [[1.0 if "precios" in t else 0.0, 1.0 if "Actividades" in t else 0.0, 0.1] for t in textos]
+
+    selector = ToolSelector(HERRAMIENTAS, embed_documents=embed_documents,
+                            embed_query=lambda q: [1.0, 0.0, 0.0], top_k=1)
+    assert _nombres(selector.select("cuánto vale?")) == ["DomosPreciosDetallados"]
+    selector.select("y el más grande?")
+    assert llamadas == [len(HERRAMIENTAS)]
+
+
+def test_sin_senal_ofrece_todas():
+    """Si ninguna herramienta coincide con el mensaje se ofrecen todas"""
+    selector = ToolSelector(HERRAMIENTAS, top_k=2, always_on=["MenuPrincipal"])
+    assert len(selector.select("ok")) == len(HERRAMIENTAS)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test del guardado diferido de la memoria de conversación
+"""
+
+import sys
+import os
+import time
+
+# Agregar el directorio del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_behind import WriteBehindPersister
+
+
+def test_rafaga_de_turnos_produce_un_guardado():
+    """Varias marcas de la misma sesión antes del ciclo se combinan en una escritura"""
+    guardados = []
+    persister = WriteBehindPersister(lambda sid, obj: guardados.append((sid, obj)), interval=60)
+    for turno in range(5):
+        persister.mark_dirty("573001234567", f"turno {turno}")
+    persister.mark_dirty("otra", "turno 0")
+
+    assert guardados == []
+    assert persister.flush() == 2
+    assert sorted(guardados) == [("573001234567", "turno 4"), ("otra", "turno 0")]
+    assert persister.get_stats()["coalesced"] == 4
+    persister.close()
+
+
+def test_guardado_por_intervalo_y_al_cerrar():
+    """El hilo guarda las sesiones pendientes cada intervalo y close() guarda el resto"""
+    guardados = []
+    persister = WriteBehindPersister(lambda sid, obj: guardados.append(sid), interval=0.05)
+    persister.mark_dirty("s1", "memoria")
+    time.sleep(0.3)
+    assert guardados == ["s1"]
+
+    persister.interval = 60
+    time.sleep(0.1)
+    persister.mark_dirty("s2", "memoria")
+    persister.close()
+    assert guardados == ["s1", "s2"]
+    assert persister.get_stats()["pending"] == 0
+
+
+def test_guardado_fallido_se_reintenta():
+    """Si el guardado falla la sesión sigue pendiente para el próximo ciclo"""
+    intentos = []
+
+    def guardar(sid, obj):
+        intentos.append(sid)
+        return len(intentos) > 1
+
+    persister = WriteBehindPersister(guardar, interval=60)
+    persister.mark_dirty("s1", "memoria")
+    assert persister.flush() == 0
+    assert persister.is_dirty("s1")
+    assert persister.flush() == 1
+    assert persister.get_stats()["failures"] == 1
+    persister.close()
+
+
+def test_sin_segundo_plano_guarda_al_marcar():
+    """Con background=False se conserva el guardado síncrono"""
+    guardados = []
+    persister = WriteBehindPersister(lambda sid, obj: guardados.append(sid), background=False)
+    persister.mark_dirty("s1", "memoria")
+    assert guardados == ["s1"]
+
+
+def test_pendiente_visible_mientras_se_guarda():
+    """Con un guardado en curso, pending() espera a que termine en lugar de dejar leer el disco viejo"""
+    import threading
+    disco, liberar, empezo = {}, threading.Event(), threading.Event()
+
+    def guardar(sid, obj):
+        empezo.set()
+        liberar.wait(5)
+        disco[sid] = obj
+
+    persister = WriteBehindPersister(guardar, interval=60)
+    persister.mark_dirty("s1", "memoria completa")
+    guardado = threading.Thread(target=persister.flush)
+    guardado.start()
+    assert empezo.wait(5)
+
+    vistos = []
+    lector = threading.Thread(target=lambda: vistos.append((persister.pending("s1"), disco.get("s1"))))
+    lector.start()
+    lector.join(0.2)
+    assert lector.is_alive() and persister.is_dirty("s1")
+
+    liberar.set()
+    guardado.join(5)
+    lector.join(5)
+    assert vistos == [(None, "memoria completa")]
+    assert not persister.is_dirty("s1")
+    persister.close()
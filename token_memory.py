@@ -0,0 +1,176 @@
+# token_memory.py
+"""
+Memoria conversacional con presupuesto de tokens y resumen incremental.
+
+El historial completo se sigue guardando en chat_memory.messages, pero al
+agente solo se le envían los últimos turnos literales más un resumen de la
+conversación anterior. Los turnos viejos se pliegan en el resumen por lotes,
+así el tamaño del prompt deja de crecer con la longitud de la conversación.
+"""
+
+from typing import Any, Callable, Optional
+
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import SystemMessage, get_buffer_string
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken viene con langchain-openai
+    tiktoken = None
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior con este usuario: "
+RECALL_PREFIX = "Fragmentos relevantes de conversaciones anteriores con este usuario:\n"
+
+_encoding = None
+_encoding_unavailable = tiktoken is None
+
+
+def _get_encoding():
+    """Codificación de tiktoken; None si no se puede cargar (se aproxima por caracteres)"""
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken descarga la codificación la primera vez; sin red se usa la aproximación
+            print(f"WARNING:  tiktoken no disponible, conteo de tokens aproximado: {e}")
+            _encoding_unavailable = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Cuenta tokens con tiktoken; aproxima por caracteres si no está disponible"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "") -> str:
+    """Recorta el texto a max_tokens conservando el inicio"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4] + suffix
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens]) + suffix
+
+
+def _message_tokens(message) -> int:
+    # 4 tokens aproximados de formato por mensaje, como en la API de chat
+    return count_tokens(str(message.content)) + 4
+
+
+def extractive_summary(previous_summary: str, transcript: str, max_tokens: int) -> str:
+    """Resumen local sin LLM: conserva lo más reciente que quepa en el presupuesto"""
+    combined = f"{previous_summary}\n{transcript}".strip() if previous_summary else transcript
+    encoding = _get_encoding()
+    if count_tokens(combined) <= max_tokens:
+        return combined
+    if encoding is None:
+        return "..." + combined[-max_tokens * 4:]
+    tokens = encoding.encode(combined, disallowed_special=())
+    return "..." + encoding.decode(tokens[-max_tokens:])
+
+
+class TokenBudgetMemory(ConversationBufferMemory):
+    """ConversationBufferMemory que envía resumen + últimos turnos dentro de un presupuesto de tokens"""
+
+    max_token_limit: int = 1500
+    keep_last_turns: int = 6
+    fold_batch_turns: int = 4
+    summary_max_tokens: int = 300
+    summary: str = ""
+    summarized_count: int = 0
+    # summarizer(resumen_anterior, transcripcion) -> nuevo resumen o None si falla
+    summarizer: Optional[Callable[[str, str], Optional[str]]] = None
+    # recall(mensaje_actual, indice_inicio_ventana) -> textos de turnos pasados relevantes
+    recall: Optional[Callable[[str, int], list]] = None
+    recall_key: Optional[str] = None
+    recall_max_tokens: int = 400
+
+    def _fold_candidates(self) -> list:
+        messages = self.chat_memory.messages
+        if self.summarized_count > len(messages):
+            # El historial se reemplazó por fuera (p. ej. reinicio): el resumen ya no aplica
+            self.summary = ""
+            self.summarized_count = 0
+        keep_from = max(self.summarized_count, len(messages) - self.keep_last_turns * 2)
+        return messages[self.summarized_count:keep_from]
+
+    def _window_tokens(self) -> int:
+        return sum(_message_tokens(m) for m in self.chat_memory.messages[self.summarized_count:])
+
+    def prune(self):
+        """Pliega los turnos viejos en el resumen cuando hay un lote o se excede el presupuesto"""
+        candidates = self._fold_candidates()
+        if not candidates:
+            return
+        if len(candidates) < self.fold_batch_turns * 2 and self._window_tokens() <= self.max_token_limit:
+            return
+
+        transcript = get_buffer_string(candidates, human_prefix="Usuario", ai_prefix="María")
+        new_summary = None
+        if self.summarizer is not None:
+            try:
+                new_summary = self.summarizer(self.summary, transcript)
+            except Exception as e:
+                print(f"WARNING:  No se pudo resumir la conversación: {e}")
+        if not new_summary:
+            new_summary = extractive_summary(self.summary, transcript, self.summary_max_tokens)
+
+        self.summary = truncate_to_tokens(new_summary.strip(), self.summary_max_tokens)
+        self.summarized_count += len(candidates)
+
+    def _recalled_message(self, query: str, window_start: int):
+        if self.recall is None or not query:
+            return None
+        try:
+            recalled = self.recall(query, window_start)
+        except Exception as e:
+            print(f"WARNING:  No se pudo consultar el recuerdo semántico: {e}")
+            return None
+        if not recalled:
+            return None
+        content = truncate_to_tokens(RECALL_PREFIX + "\n---\n".join(recalled), self.recall_max_tokens, "...")
+        return SystemMessage(content=content)
+
+    def budgeted_messages(self, query: str = None) -> list:
+        """Mensajes que se envían al modelo: resumen + recuerdos + turnos recientes dentro del presupuesto"""
+        self.prune()
+        budget = self.max_token_limit
+        prefix = []
+        if self.summary:
+            prefix = [SystemMessage(content=SUMMARY_PREFIX + self.summary)]
+            budget -= _message_tokens(prefix[0])
+
+        window = []
+        for message in reversed(self.chat_memory.messages[self.summarized_count:]):
+            tokens = _message_tokens(message)
+            # Siempre se incluye al menos el último intercambio
+            if len(window) >= 2 and tokens > budget:
+                break
+            window.append(message)
+            budget -= tokens
+        window.reverse()
+
+        recalled = self._recalled_message(query, len(self.chat_memory.messages) - len(window))
+        if recalled is not None:
+            prefix.append(recalled)
+        return prefix + window
+
+    def load_memory_variables(self, inputs: dict[str, Any]) -> dict[str, Any]:
+        messages = self.budgeted_messages(inputs.get(self.input_key) if inputs else None)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: self._buffer_as_str(messages)}
+
+    def save_context(self, inputs: dict[str, Any], outputs: dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.prune()
+
+
+__all__ = ['TokenBudgetMemory', 'count_tokens', 'truncate_to_tokens', 'extractive_summary']
@@ -0,0 +1,92 @@
+# tool_router.py
+"""
+Selección por turno de las herramientas que se describen al agente.
+
+Describir todas las herramientas en cada llamada infla el prompt y confunde al
+agente. El selector compara el mensaje del usuario con las descripciones de
+las herramientas (similitud de embeddings, o palabras compartidas si los
+embeddings no están disponibles) y entrega solo las k más relevantes junto con
+las herramientas que deben estar siempre disponibles. Las herramientas
+conservan el orden original de la lista para que el prompt sea estable.
+"""
+
+import re
+import threading
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+
+class ToolSelector:
+    """Elige las herramientas relevantes para cada mensaje"""
+
+    def __init__(self, tools: list, embed_documents=None, embed_query=None, top_k: int = 5,
+                 always_on=(), min_score: float = 0.0):
+        self.tools = list(tools)
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.top_k = top_k
+        self.always_on = set(always_on)
+        self.min_score = min_score
+        self._vectors = None
+        self._tool_words = [_words(f"{t.name} {t.description}") for t in self.tools]
+        self._lock = threading.Lock()
+        self._stats = {"selections": 0, "tools_offered": 0, "lexical_fallbacks": 0, "embedding_errors": 0}
+
+    def _description_vectors(self):
+        """Embeddings de las descripciones, calculados una sola vez"""
+        with self._lock:
+            if self._vectors is None and self.embed_documents is not None:
+                texts = [f"{t.name}: {t.description}" for t in self.tools]
+                vectors = np.asarray(self.embed_documents(texts), dtype=np.float32)
+                self._vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9)
+            return self._vectors
+
+    def _scores(self, query: str):
+        if self.embed_query is not None:
+            try:
+                vectors = self._description_vectors()
+                if vectors is not None:
+                    query_vector = np.asarray(self.embed_query(query), dtype=np.float32)
+                    query_vector /= np.linalg.norm(query_vector) + 1e-9
+                    return vectors @ query_vector
+            except Exception as e:
+                self._stats["embedding_errors"] += 1
+                print(f"WARNING:  Selección de herramientas sin embeddings, usando búsqueda léxica: {e}")
+
+        self._stats["lexical_fallbacks"] += 1
+        query_words = _words(query)
+        return np.array([len(query_words & words) for words in self._tool_words], dtype=np.float32)
+
+    def select(self, query: str, k: int = None) -> list:
+        """Herramientas para este turno: las k más relevantes más las siempre activas"""
+        k = k or self.top_k
+        if not query or k >= len(self.tools):
+            return list(self.tools)
+
+        scores = self._scores(query)
+        ranked = [i for i in np.argsort(-scores, kind="stable") if self.tools[i].name not in self.always_on]
+        chosen = {i for i in ranked[:k] if scores[i] > self.min_score}
+        if not chosen:
+            # Sin señal para decidir es mejor ofrecer todas que dejar al agente sin la correcta
+            chosen = set(range(len(self.tools)))
+        selected = [t for i, t in enumerate(self.tools) if i in chosen or t.name in self.always_on]
+
+        self._stats["selections"] += 1
+        self._stats["tools_offered"] += len(selected)
+        return selected
+
+    def get_stats(self) -> dict:
+        """Estadísticas de selección para monitoreo"""
+        stats = dict(self._stats)
+        stats["total_tools"] = len(self.tools)
+        stats["avg_tools_offered"] = round(stats["tools_offered"] / stats["selections"], 2) if stats["selections"] else 0
+        return stats
+
+
+__all__ = ['ToolSelector']
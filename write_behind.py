@@ -0,0 +1,153 @@
+# write_behind.py
+"""
+Persistencia diferida (write-behind) de la memoria de conversación.
+
+Los manejadores solo marcan la sesión como modificada y responden; un hilo en
+segundo plano guarda las sesiones marcadas cada `interval` segundos. Varias
+marcas de la misma sesión antes del guardado se combinan en una sola
+escritura, así una ráfaga de mensajes de un usuario produce un solo guardado.
+Al cerrar el proceso se guarda todo lo pendiente.
+
+Con `combine`, `merge` suma un objeto nuevo a lo que ya estaba pendiente de
+la sesión en lugar de reemplazarlo (p. ej. turnos que se anexan sin cargar
+la memoria), y un guardado fallido se combina con lo marcado después.
+
+Mientras el guardado de una sesión está en curso, `pending` espera a que
+termine: así nadie lee del disco un estado anterior al que se está
+escribiendo.
+"""
+
+import threading
+import time
+
+
+class WriteBehindPersister:
+    """Guarda en segundo plano las sesiones marcadas como modificadas"""
+
+    def __init__(self, save, interval: float = 1.0, background: bool = True, combine=None):
+        # save(session_id, objeto) -> bool; con background=False se guarda al marcar
+        # combine(pendiente, nuevo) -> objeto: junta dos guardados de la misma sesión
+        self.save = save
+        self.combine = combine
+        self.interval = interval
+        self.background = background
+        self._dirty = {}
+        self._saving = {}  # sesión -> guardados en curso
+        lock = threading.RLock()
+        self._cond = threading.Condition(lock)
+        # Avisa el fin de un guardado sin despertar al hilo de guardado
+        self._saved = threading.Condition(lock)
+        self._closed = False
+        self._stats = {"marks": 0, "flushes": 0, "failures": 0, "flush_ms": 0.0}
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, session_id: str, obj):
+        """Registra que la sesión cambió; se guardará en el próximo ciclo"""
+        with self._cond:
+            self._stats["marks"] += 1
+            if self.background and not self._closed:
+                self._dirty[session_id] = obj
+                return
+            self._start_saving(session_id)
+        self._save(session_id, obj)
+
+    def merge(self, session_id: str, obj):
+        """Como mark_dirty, pero combina obj con lo que ya estaba pendiente de la sesión"""
+        with self._cond:
+            self._stats["marks"] += 1
+            if self.background and not self._closed:
+                current = self._dirty.get(session_id)
+                self._dirty[session_id] = obj if current is None or self.combine is None else self.combine(current, obj)
+                return
+            self._start_saving(session_id)
+        self._save(session_id, obj)
+
+    def is_dirty(self, session_id: str) -> bool:
+        """¿La sesión tiene cambios sin guardar o un guardado en curso?"""
+        with self._cond:
+            return session_id in self._dirty or session_id in self._saving
+
+    def pending(self, session_id: str):
+        """Objeto marcado y aún sin guardar de la sesión, o None; si se está guardando, espera a que termine"""
+        with self._cond:
+            while session_id in self._saving:
+                self._saved.wait()
+            return self._dirty.get(session_id)
+
+    def _start_saving(self, session_id: str):
+        # Se llama con self._cond tomado
+        self._saving[session_id] = self._saving.get(session_id, 0) + 1
+
+    def _save(self, session_id: str, obj) -> bool:
+        start = time.monotonic()
+        try:
+            ok = self.save(session_id, obj) is not False
+        except Exception as e:
+            print(f"ERROR: Guardado diferido falló para {session_id}: {e}")
+            ok = False
+        with self._cond:
+            self._stats["flushes"] += 1
+            self._stats["flush_ms"] += (time.monotonic() - start) * 1000
+            if not ok:
+                self._stats["failures"] += 1
+                # Se reintenta en el próximo ciclo salvo que ya haya una marca más nueva
+                if self.background and not self._closed:
+                    newer = self._dirty.get(session_id)
+                    if newer is None:
+                        self._dirty[session_id] = obj
+                    elif self.combine is not None:
+                        self._dirty[session_id] = self.combine(obj, newer)
+            # Lo que no se guardó ya volvió a _dirty: recién ahora deja de estar en curso
+            self._saving[session_id] -= 1
+            if not self._saving[session_id]:
+                del self._saving[session_id]
+            self._saved.notify_all()
+        return ok
+
+    def flush(self, session_id: str = None) -> int:
+        """Guarda ya las sesiones pendientes (o solo una); devuelve cuántas se guardaron"""
+        with self._cond:
+            if session_id is None:
+                pending, self._dirty = self._dirty, {}
+            elif session_id in self._dirty:
+                pending = {session_id: self._dirty.pop(session_id)}
+            else:
+                pending = {}
+            for sid in pending:
+                self._start_saving(sid)
+        return sum(1 for sid, obj in pending.items() if self._save(sid, obj))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """Detiene el hilo y guarda todo lo pendiente (se registra con atexit)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        saved = self.flush()
+        if saved:
+            print(f"OK: {saved} sesiones guardadas al cerrar")
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._dirty)
+        stats["coalesced"] = max(0, stats["marks"] - stats["flushes"] - stats["pending"])
+        stats["avg_flush_ms"] = round(stats.pop("flush_ms") / stats["flushes"], 2) if stats["flushes"] else 0
+        return stats
+
+
+__all__ = ['WriteBehindPersister']